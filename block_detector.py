@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Detección temprana de bloqueos de Google Scholar para ScholarDown
+La respuesta se pide en streaming y se examinan solo los primeros KB con una única
+expresión regular precompilada (todas las marcas a la vez, sin .lower() de la página).
+Si es una página de bloqueo, la transferencia se corta en ese momento. El resultado
+lleva el tipo de bloqueo para que la rotación actúe según el caso:
+captcha, 429, bloqueo suave, muro de consentimiento o página vacía.
+
+Uso:
+    python block_detector.py pagina.html [...]   # Clasificar páginas guardadas
+"""
+
+import re
+import sys
+import threading
+from urllib.parse import urlparse
+
+from host_scheduler import parse_retry_after
+
+SNIFF_BYTES = 16384       # Bytes examinados antes de decidir si se sigue descargando
+CHUNK_SIZE = 4096
+EMPTY_PAGE_BYTES = 512    # Una respuesta 200 más corta que esto se considera vacía
+OVERLAP = 64              # Solape al examinar el resto del cuerpo (marcas partidas entre trozos)
+
+BLOCK_CAPTCHA = "captcha"
+BLOCK_RATE_LIMIT = "429"
+BLOCK_SOFT = "soft_block"
+BLOCK_CONSENT = "consent"
+BLOCK_EMPTY = "empty"
+
+BLOCK_LABELS = {
+    BLOCK_CAPTCHA: "captcha",
+    BLOCK_RATE_LIMIT: "429 (demasiadas peticiones)",
+    BLOCK_SOFT: "bloqueo suave (tráfico inusual)",
+    BLOCK_CONSENT: "muro de consentimiento",
+    BLOCK_EMPTY: "página vacía",
+}
+
+# Una sola pasada: cada grupo con nombre es un tipo de bloqueo
+BLOCK_PATTERN = re.compile(
+    rb"(?P<captcha>gs_captcha_ccl|g-recaptcha|captcha|not a robot)"
+    rb"|(?P<soft_block>unusual traffic|automated queries|/sorry/index)"
+    rb"|(?P<consent>consent\.google\.|before you continue to)",
+    re.IGNORECASE)
+# Si aparecen varias marcas manda la más grave (la página /sorry/ de Google trae las tres)
+PRIORITY = (BLOCK_CAPTCHA, BLOCK_SOFT, BLOCK_CONSENT)
+
+stats_lock = threading.Lock()
+stats = {"checked": 0, "aborted": 0}
+
+def detect(data):
+    """Tipo de bloqueo que delatan estos bytes, o None"""
+    found = {match.lastgroup for match in BLOCK_PATTERN.finditer(data)}
+    for kind in PRIORITY:
+        if kind in found:
+            return kind
+    return None
+
+def detect_url(url):
+    """Redirecciones que ya son un bloqueo sin mirar el cuerpo"""
+    parsed = urlparse(url or "")
+    if (parsed.hostname or "").startswith("consent."):
+        return BLOCK_CONSENT
+    if parsed.path.startswith("/sorry/"):
+        return BLOCK_SOFT
+    return None
+
+class CheckedResponse:
+    """
+    Respuesta ya leída (o cortada) con su tipo de bloqueo. Ofrece lo que usan los pasos
+    de requests.Response: status_code, headers, url, cookies, content y text.
+    """
+    def __init__(self, response, content, block=None, aborted=False):
+        self.status_code = response.status_code
+        self.headers = response.headers
+        self.url = response.url
+        self.cookies = response.cookies
+        self.encoding = response.encoding
+        self.content = content
+        self.block = block
+        self.aborted = aborted
+        self.from_cache = False
+        self.retry_after = parse_retry_after(response.headers.get("Retry-After")) if block == BLOCK_RATE_LIMIT else None
+
+    @property
+    def text(self):
+        try:
+            return self.content.decode(self.encoding or "utf-8", errors="replace")
+        except LookupError:
+            return self.content.decode("utf-8", errors="replace")
+
+    def describe(self):
+        return BLOCK_LABELS.get(self.block, "sin bloqueo")
+
+def _count(block, aborted):
+    with stats_lock:
+        stats["checked"] += 1
+        if block:
+            stats[block] = stats.get(block, 0) + 1
+        if aborted:
+            stats["aborted"] += 1
+
+def checked_get(session, url, **kwargs):
+    """
+    GET en streaming con detección temprana de bloqueos.
+    Retorna: CheckedResponse (block es None si la página es válida)
+    """
+    response = session.get(url, stream=True, **kwargs)
+    with response:
+        block = BLOCK_RATE_LIMIT if response.status_code == 429 else detect_url(response.url)
+        if block:
+            _count(block, True)
+            return CheckedResponse(response, b"", block, aborted=True)
+
+        chunks = response.iter_content(chunk_size=CHUNK_SIZE)
+        body = b""
+        for chunk in chunks:
+            body += chunk
+            if len(body) >= SNIFF_BYTES:
+                break
+        block = detect(body)
+        if block:
+            # Página de bloqueo reconocida: no se descarga el resto
+            _count(block, True)
+            return CheckedResponse(response, body, block, aborted=True)
+
+        sniffed = len(body)
+        body += b"".join(chunks)
+        if len(body) > sniffed:
+            # Marca más allá de los primeros KB (cabecera muy larga): se detecta, aunque sin cortar
+            block = detect(body[sniffed - OVERLAP:])
+        if not block and response.status_code == 200 and len(body.strip()) < EMPTY_PAGE_BYTES:
+            block = BLOCK_EMPTY
+        _count(block, False)
+        return CheckedResponse(response, body, block)
+
+def print_block_summary():
+    with stats_lock:
+        blocks = {kind: count for kind, count in stats.items() if kind in BLOCK_LABELS}
+        checked, aborted = stats["checked"], stats["aborted"]
+    if not blocks:
+        return
+    detail = ", ".join(f"{BLOCK_LABELS[kind]}: {count}" for kind, count in blocks.items())
+    print(f"[INFO] Bloqueos detectados en {checked} respuestas: {detail} ({aborted} transferencias cortadas al inicio)")
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    for path in sys.argv[1:]:
+        with open(path, "rb") as f:
+            data = f.read()
+        early = detect(data[:SNIFF_BYTES])
+        kind = early or detect(data)
+        if not kind and len(data.strip()) < EMPTY_PAGE_BYTES:
+            kind = BLOCK_EMPTY
+        where = f" (en los primeros {SNIFF_BYTES // 1024} KB)" if early else ""
+        print(f"{path}: {BLOCK_LABELS.get(kind, 'sin bloqueo')}{where}")
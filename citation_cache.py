@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Caché entre ejecuciones de las fichas de Scholar para ScholarDown
+Guarda el resultado extraído de cada ficha (view_citation) con la fecha de consulta,
+con la clave citation_for_view normalizada: la misma ficha llegada desde otro perfil,
+otro dominio de Scholar o un reintento no vuelve a pedirse mientras no caduque.
+Los "sin enlace" también se guardan, con una caducidad más corta, y con cada ficha
+sus demás candidatos de descarga.
+Usa el formato del diario (journal.py): JSONL de solo añadir con fsync en grupo.
+"""
+
+import threading
+from datetime import datetime, timedelta
+from urllib.parse import urlparse, parse_qs, quote
+
+from journal import Journal, STATUS_FOUND, STATUS_NOT_FOUND
+
+CACHE_FILE = "citation_cache.jsonl"
+TTL_DAYS = 90            # Caducidad de una ficha con enlace
+NEGATIVE_TTL_DAYS = 7    # Caducidad de una ficha sin enlace (puede aparecer más tarde)
+CANONICAL_URL = "https://scholar.google.com/citations?view_op=view_citation&citation_for_view="
+
+def citation_key(url):
+    """Clave normalizada de una ficha (independiente del dominio y del resto de parámetros); None si no es una ficha"""
+    values = parse_qs(urlparse(url).query).get("citation_for_view")
+    if not values or not values[0].strip():
+        return None
+    return CANONICAL_URL + quote(values[0].strip(), safe=":")
+
+class CitationCache:
+    def __init__(self, path=CACHE_FILE, ttl_days=TTL_DAYS, negative_ttl_days=NEGATIVE_TTL_DAYS):
+        self.journal = Journal(path)
+        self.ttl = timedelta(days=ttl_days)
+        self.negative_ttl = timedelta(days=negative_ttl_days)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+
+    def lookup(self, url):
+        """
+        Retorna (acierto, enlace, candidatos). Un acierto con enlace None es un "sin enlace" aún vigente.
+        """
+        key = citation_key(url)
+        entry = self.journal.entries.get(key) if key else None
+        fresh = False
+        if entry and entry["status"] in (STATUS_FOUND, STATUS_NOT_FOUND):
+            ttl = self.ttl if entry["status"] == STATUS_FOUND else self.negative_ttl
+            fresh = datetime.now() - datetime.fromisoformat(entry["ts"]) < ttl
+        with self.lock:
+            if fresh:
+                self.hits += 1
+            else:
+                self.misses += 1
+                if entry:
+                    self.expired += 1
+        if fresh:
+            return True, entry.get("link"), entry.get("candidates")
+        return False, None, None
+
+    def store(self, url, link, candidates=None):
+        """Anota el resultado de una ficha recién consultada (los errores no se guardan)"""
+        key = citation_key(url)
+        if key:
+            self.journal.record(key, STATUS_FOUND if link else STATUS_NOT_FOUND, link, candidates=candidates)
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def print_summary(self):
+        total = self.hits + self.misses
+        if total:
+            print(f"[INFO] Caché de fichas: {self.hits}/{total} aciertos ({self.hit_rate():.0%}), "
+                  f"{self.expired} caducadas, {len(self.journal.entries)} fichas guardadas")
+
+    def close(self):
+        self.journal.close()
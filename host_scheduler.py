@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Planificador de cortesía por host para las descargas de ScholarDown
+Una cola por host, concurrencia y espaciado mínimo por host, Retry-After y Crawl-delay,
+y reparto round-robin entre hosts para que ningún servidor reciba ráfagas.
+"""
+
+import time
+import threading
+from collections import deque
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from urllib.parse import urlparse
+
+MAX_CRAWL_DELAY = 30     # Un Crawl-delay mayor se recorta a este valor (segundos)
+MAX_RETRY_AFTER = 300    # Un Retry-After mayor se recorta a este valor (segundos)
+
+def host_of(url):
+    return (urlparse(url).hostname or "").lower()
+
+def parse_retry_after(value):
+    """Convierte un Retry-After (segundos o fecha HTTP) en segundos de espera; None si no es válido"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return min(int(value), MAX_RETRY_AFTER)
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0, min((when - datetime.now(timezone.utc)).total_seconds(), MAX_RETRY_AFTER))
+
+def parse_crawl_delay(robots_txt, user_agent="*"):
+    """Extrae el Crawl-delay aplicable (grupo del user-agent o '*') de un robots.txt"""
+    delays = {}
+    agents = []
+    in_rules = False
+    for raw_line in robots_txt.splitlines():
+        line = raw_line.split("#", 1)[0].strip()
+        if ":" not in line:
+            continue
+        field, value = [part.strip() for part in line.split(":", 1)]
+        field = field.lower()
+        if field == "user-agent":
+            if in_rules:
+                agents = []
+                in_rules = False
+            agents.append(value.lower())
+        else:
+            in_rules = True
+            if field == "crawl-delay":
+                try:
+                    delay = float(value)
+                except ValueError:
+                    continue
+                for agent in agents:
+                    delays.setdefault(agent, delay)
+
+    ua = user_agent.lower()
+    for agent, delay in delays.items():
+        if agent != "*" and agent in ua:
+            return min(delay, MAX_CRAWL_DELAY)
+    if "*" in delays:
+        return min(delays["*"], MAX_CRAWL_DELAY)
+    return None
+
+class HostState:
+    def __init__(self, interval):
+        self.queue = deque()
+        self.interval = interval       # Espaciado mínimo entre peticiones
+        self.next_allowed = 0.0        # Instante (monotonic) de la próxima petición permitida
+        self.active = 0                # Peticiones en curso
+        self.tasks_active = 0          # URLs de la cola en proceso
+        self.requests = 0
+        self.wait_time = 0.0           # Tiempo total esperado por cortesía
+        self.penalties = 0
+        self.stalls = 0                # Descargas abortadas por lentitud (baja su prioridad)
+        self.stall_reasons = []
+        self.robots_checked = False
+
+class HostScheduler:
+    """
+    Dos niveles:
+      - next_task()/task_done(): reparte las URLs de entrada round-robin entre hosts;
+        los hosts con atascos solo se eligen si no hay otro host disponible.
+      - acquire()/release(): cada petición HTTP real espera su turno en su host
+        (concurrencia, espaciado, Crawl-delay y Retry-After) y un hueco global.
+    """
+    def __init__(self, max_global, max_per_host, min_interval, robots_fetcher=None, user_agent="*"):
+        self.max_global = max_global
+        self.max_per_host = max_per_host
+        self.min_interval = min_interval
+        self.robots_fetcher = robots_fetcher
+        self.user_agent = user_agent
+        self.cond = threading.Condition()
+        self.hosts = {}
+        self.ring = deque()
+        self.global_active = 0
+        self.queued = 0
+        self.tasks_active = 0
+
+    def _state(self, host):
+        state = self.hosts.get(host)
+        if state is None:
+            state = self.hosts[host] = HostState(self.min_interval)
+        return state
+
+    # --- Cola de tareas -------------------------------------------------
+
+    def submit(self, url):
+        with self.cond:
+            host = host_of(url)
+            state = self._state(host)
+            if not state.queue and host not in self.ring:
+                self.ring.append(host)
+            state.queue.append(url)
+            self.queued += 1
+            self.cond.notify_all()
+
+    def next_task(self):
+        """Bloquea hasta que haya una URL de un host disponible; None cuando no queda trabajo"""
+        with self.cond:
+            while True:
+                if self.queued == 0 and self.tasks_active == 0:
+                    return None
+                now = time.monotonic()
+                wake_at = None
+                chosen = None
+                for _ in range(len(self.ring)):
+                    host = self.ring[0]
+                    self.ring.rotate(-1)
+                    state = self.hosts[host]
+                    if not state.queue:
+                        continue
+                    if state.tasks_active < self.max_per_host and now >= state.next_allowed:
+                        if chosen is None or state.stalls < self.hosts[chosen].stalls:
+                            chosen = host
+                        if state.stalls == 0:
+                            break
+                    elif state.tasks_active < self.max_per_host:
+                        wake_at = state.next_allowed if wake_at is None else min(wake_at, state.next_allowed)
+                if chosen is not None:
+                    state = self.hosts[chosen]
+                    url = state.queue.popleft()
+                    if not state.queue:
+                        self.ring.remove(chosen)
+                    self.queued -= 1
+                    state.tasks_active += 1
+                    self.tasks_active += 1
+                    return url
+                timeout = max(0.01, wake_at - now) if wake_at is not None else 1.0
+                self.cond.wait(timeout)
+
+    def task_done(self, url):
+        with self.cond:
+            state = self._state(host_of(url))
+            state.tasks_active -= 1
+            self.tasks_active -= 1
+            self.cond.notify_all()
+
+    # --- Peticiones individuales ---------------------------------------
+
+    def _check_robots(self, url):
+        """Lee el Crawl-delay del host la primera vez que se le hace una petición"""
+        host = host_of(url)
+        with self.cond:
+            state = self._state(host)
+            if state.robots_checked or not self.robots_fetcher:
+                return
+            state.robots_checked = True
+        parsed = urlparse(url)
+        robots_txt = self.robots_fetcher(f"{parsed.scheme}://{parsed.netloc}/robots.txt")
+        delay = parse_crawl_delay(robots_txt or "", self.user_agent)
+        if delay:
+            with self.cond:
+                state.interval = max(state.interval, delay)
+            print(f"   [CORTESÍA] {host}: Crawl-delay {delay:.1f}s")
+
+    def acquire(self, url, limit=None):
+        """
+        Espera el turno de la petición; retorna el host para release().
+        limit permite más conexiones al host (segmentos de un mismo archivo grande).
+        """
+        self._check_robots(url)
+        host = host_of(url)
+        max_per_host = max(limit or 0, self.max_per_host)
+        start = time.monotonic()
+        with self.cond:
+            state = self._state(host)
+            while True:
+                now = time.monotonic()
+                if state.active < max_per_host and self.global_active < self.max_global:
+                    if now >= state.next_allowed:
+                        break
+                    self.cond.wait(state.next_allowed - now)
+                else:
+                    self.cond.wait()
+            state.active += 1
+            self.global_active += 1
+            state.requests += 1
+            state.next_allowed = now + state.interval
+            state.wait_time += now - start
+        return host
+
+    def release(self, host):
+        with self.cond:
+            self.hosts[host].active -= 1
+            self.global_active -= 1
+            self.cond.notify_all()
+
+    def penalize(self, url, seconds):
+        """Aplaza todas las peticiones al host (Retry-After, bloqueos...)"""
+        with self.cond:
+            state = self._state(host_of(url))
+            state.next_allowed = max(state.next_allowed, time.monotonic() + seconds)
+            state.penalties += 1
+            self.cond.notify_all()
+        print(f"   [CORTESÍA] {host_of(url)}: pausa de {seconds:.0f}s")
+
+    def record_stall(self, url, reason):
+        """Anota un atasco por lentitud; el host pasa detrás de los que no se atascan"""
+        with self.cond:
+            state = self._state(host_of(url))
+            state.stalls += 1
+            state.stall_reasons.append(reason)
+
+    # --- Métricas --------------------------------------------------------
+
+    def snapshot(self):
+        """Estado por host: cola pendiente, peticiones en curso, peticiones hechas y espera acumulada"""
+        with self.cond:
+            return {
+                host: {
+                    "queued": len(state.queue),
+                    "active": state.active,
+                    "requests": state.requests,
+                    "wait_time": state.wait_time,
+                    "interval": state.interval,
+                    "penalties": state.penalties,
+                    "stalls": state.stalls,
+                }
+                for host, state in self.hosts.items()
+            }
+
+    def print_status(self, limit=5):
+        busiest = sorted(self.snapshot().items(), key=lambda item: item[1]["queued"], reverse=True)[:limit]
+        queued = sum(data["queued"] for _, data in busiest)
+        if not queued:
+            return
+        print("   [COLA] " + ", ".join(f"{host}: {data['queued']} en cola / {data['wait_time']:.0f}s espera"
+                                     for host, data in busiest if data["queued"]))
+
+    def print_summary(self, limit=10):
+        hosts = sorted(self.snapshot().items(), key=lambda item: item[1]["wait_time"], reverse=True)[:limit]
+        if not hosts:
+            return
+        print(f"\n🚦 Cortesía por host ({len(self.hosts)} hosts) - peticiones / espera / intervalo / pausas / atascos:")
+        for host, data in hosts:
+            print(f"   {host:<35} {data['requests']:>5} / {data['wait_time']:>7.1f}s / "
+                  f"{data['interval']:>4.1f}s / {data['penalties']} / {data['stalls']}")
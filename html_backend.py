@@ -0,0 +1,406 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Análisis HTML de las páginas de Scholar para ScholarDown
+De cada página solo interesan las filas tr.gsc_a_tr (perfil), en la ficha el bloque
+div#gsc_oci_title_wrapper y el enlace "All N versions" de div#gsc_oci_table, y en la
+página de versiones (cluster=) los resultados div.gs_r. Se usa un analizador en C si está instalado
+(selectolax, si no lxml) y solo se analiza desde el bloque necesario, saltando la
+cabecera con estilos y scripts. Sin ninguno de los dos se usa BeautifulSoup con
+SoupStrainer. Las páginas de aterrizaje del paso 3 se analizan enteras con BeautifulSoup.
+Con un ParsePool (parse_pool.py) el análisis se hace en otros procesos, fuera de los
+hilos de red. Se mide el tiempo de análisis por página.
+
+Uso:
+    python html_backend.py --autoprueba   # Páginas de referencia con cada analizador instalado
+    python html_backend.py --comparar     # Todas las páginas de Scholar de la caché HTTP
+    python html_backend.py --referencia tests/golden/ficha_x.html   # Crear su .json de referencia
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import threading
+from urllib.parse import urljoin
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+try:
+    from selectolax.lexbor import LexborHTMLParser as SelectolaxParser
+except ImportError:
+    SelectolaxParser = None
+
+try:
+    import lxml.html as lxml_html
+except ImportError:
+    lxml_html = None
+
+HTML_BACKEND = "auto"   # "auto" (selectolax > lxml > bs4), "selectolax", "lxml" o "bs4"
+
+# Inicio del bloque útil: la etiqueta contenedora anterior a la marca (un <tr> suelto
+# fuera de su <table> lo descartan los analizadores HTML5)
+PROFILE_SCOPE = (re.compile(r"""class=["']?[^"'>]*\bgsc_a_tr\b"""), "<table")
+CITATION_SCOPE = (re.compile(r"""id=["']?gsc_oci_title_wrapper\b"""), "<div")
+VERSIONS_SCOPE = (re.compile(r"""id=["']?gs_res_ccl_mid\b"""), "<div")
+PROFILE_ROW_CLASS = re.compile(r"(^|\s)gsc_a_tr(\s|$)")   # Para SoupStrainer: fila con varias clases
+CITATION_BLOCKS = re.compile(r"^(gsc_oci_title_wrapper|gsc_oci_table)$")
+SIDE_BLOCK_CLASS = "gsc_oci_title_ggi"   # Enlaces laterales de la ficha ([PDF], [HTML], bibliotecas)
+RESULT_CLASS = re.compile(r"(^|\s)gs_r(\s|$)")  # Cada versión en la página del cluster
+
+def inside_script(html, position):
+    return html.rfind("<script", 0, position) > html.rfind("</script", 0, position)
+
+def scope(html, marker):
+    """
+    Recorta el HTML desde la etiqueta que contiene el bloque buscado; sin marca, la página entera.
+    Las marcas dentro de un <script> (plantillas de la propia página) no cuentan.
+    """
+    pattern, container = marker
+    for match in pattern.finditer(html):
+        if inside_script(html, match.start()):
+            continue
+        start = html.rfind(container, 0, match.start())
+        return html[start:] if start >= 0 else html
+    return html
+
+# --- Analizadores --------------------------------------------------------------
+
+class Bs4Backend:
+    name = "bs4"
+
+    def profile_hrefs(self, html):
+        soup = BeautifulSoup(html, "html.parser", parse_only=SoupStrainer("tr", class_=PROFILE_ROW_CLASS))
+        hrefs = []
+        for row in soup.find_all("tr", class_="gsc_a_tr"):
+            link_tag = row.select_one("a.gsc_a_at")
+            if link_tag and link_tag.get("href"):
+                hrefs.append(link_tag["href"])
+        return hrefs
+
+    def citation_anchors(self, html):
+        soup = BeautifulSoup(html, "html.parser", parse_only=SoupStrainer("div", id=CITATION_BLOCKS))
+        wrapper = soup.find("div", id="gsc_oci_title_wrapper")
+        anchors = None
+        if wrapper is not None:
+            anchors = [(a_tag["href"], a_tag.get_text(strip=True),
+                        a_tag.find_parent("div", class_=SIDE_BLOCK_CLASS) is not None)
+                       for a_tag in wrapper.find_all("a", href=True)]
+        table = soup.find("div", id="gsc_oci_table")
+        cluster = table.find("a", href=re.compile("cluster=")) if table is not None else None
+        return anchors, cluster["href"] if cluster is not None else None
+
+    def versions_anchors(self, html):
+        soup = BeautifulSoup(html, "html.parser", parse_only=SoupStrainer("div", id="gs_res_ccl_mid"))
+        anchors = []
+        for result in soup.find_all("div", class_=RESULT_CLASS):
+            for a_tag in result.select("div.gs_ggs a[href]"):
+                anchors.append((a_tag["href"], a_tag.get_text(strip=True), True))
+            for a_tag in result.select("h3.gs_rt a[href]"):
+                anchors.append((a_tag["href"], a_tag.get_text(strip=True), False))
+        return anchors
+
+class LxmlBackend:
+    name = "lxml"
+
+    @staticmethod
+    def _document(html):
+        try:
+            return lxml_html.document_fromstring(html)
+        except Exception:
+            return None  # Documento vacío o ilegible
+
+    def profile_hrefs(self, html):
+        document = self._document(scope(html, PROFILE_SCOPE))
+        if document is None:
+            return []
+        hrefs = []
+        for row in document.xpath("//tr[contains(concat(' ', normalize-space(@class), ' '), ' gsc_a_tr ')]"):
+            links = row.xpath(".//a[contains(concat(' ', normalize-space(@class), ' '), ' gsc_a_at ')]")
+            if links and links[0].get("href"):
+                hrefs.append(links[0].get("href"))
+        return hrefs
+
+    def citation_anchors(self, html):
+        document = self._document(scope(html, CITATION_SCOPE))
+        if document is None:
+            return None, None
+        wrappers = document.xpath("//div[@id='gsc_oci_title_wrapper']")
+        anchors = None
+        if wrappers:
+            side = f"ancestor::div[contains(concat(' ', normalize-space(@class), ' '), ' {SIDE_BLOCK_CLASS} ')]"
+            anchors = [(a_tag.get("href"), "".join(text.strip() for text in a_tag.itertext()), bool(a_tag.xpath(side)))
+                       for a_tag in wrappers[0].xpath(".//a[@href]")]
+        clusters = document.xpath("(//div[@id='gsc_oci_table'])[1]//a[contains(@href, 'cluster=')]")
+        return anchors, clusters[0].get("href") if clusters else None
+
+    def versions_anchors(self, html):
+        document = self._document(scope(html, VERSIONS_SCOPE))
+        if document is None:
+            return []
+        has_class = "contains(concat(' ', normalize-space(@class), ' '), ' {} ')".format
+        anchors = []
+        for result in document.xpath(f"//div[@id='gs_res_ccl_mid']//div[{has_class('gs_r')}]"):
+            for a_tag in result.xpath(f".//div[{has_class('gs_ggs')}]//a[@href]"):
+                anchors.append((a_tag.get("href"), "".join(text.strip() for text in a_tag.itertext()), True))
+            for a_tag in result.xpath(f".//h3[{has_class('gs_rt')}]//a[@href]"):
+                anchors.append((a_tag.get("href"), "".join(text.strip() for text in a_tag.itertext()), False))
+        return anchors
+
+class SelectolaxBackend:
+    name = "selectolax"
+
+    def profile_hrefs(self, html):
+        hrefs = []
+        for row in SelectolaxParser(scope(html, PROFILE_SCOPE)).css("tr.gsc_a_tr"):
+            link_tag = row.css_first("a.gsc_a_at")
+            if link_tag is not None and link_tag.attributes.get("href"):
+                hrefs.append(link_tag.attributes["href"])
+        return hrefs
+
+    @staticmethod
+    def _in_side_block(node):
+        node = node.parent
+        while node is not None:
+            if SIDE_BLOCK_CLASS in (node.attributes.get("class") or "").split():
+                return True
+            node = node.parent
+        return False
+
+    def citation_anchors(self, html):
+        tree = SelectolaxParser(scope(html, CITATION_SCOPE))
+        wrapper = tree.css_first("div#gsc_oci_title_wrapper")
+        anchors = None
+        if wrapper is not None:
+            anchors = [(a_tag.attributes.get("href") or "", a_tag.text(strip=True), self._in_side_block(a_tag))
+                       for a_tag in wrapper.css("a[href]")]
+        cluster = tree.css_first("div#gsc_oci_table a[href*='cluster=']")
+        return anchors, cluster.attributes.get("href") if cluster is not None else None
+
+    def versions_anchors(self, html):
+        anchors = []
+        for result in SelectolaxParser(scope(html, VERSIONS_SCOPE)).css("div#gs_res_ccl_mid div.gs_r"):
+            for a_tag in result.css("div.gs_ggs a[href]"):
+                anchors.append((a_tag.attributes.get("href") or "", a_tag.text(strip=True), True))
+            for a_tag in result.css("h3.gs_rt a[href]"):
+                anchors.append((a_tag.attributes.get("href") or "", a_tag.text(strip=True), False))
+        return anchors
+
+def available_backends():
+    """Analizadores instalados, del más rápido al más lento"""
+    backends = []
+    if SelectolaxParser:
+        backends.append(SelectolaxBackend())
+    if lxml_html:
+        backends.append(LxmlBackend())
+    backends.append(Bs4Backend())
+    return backends
+
+def select_backend(name=HTML_BACKEND):
+    for candidate in available_backends():
+        if name in ("auto", candidate.name):
+            return candidate
+    print(f"[WARNING] Analizador HTML '{name}' no instalado; se usa BeautifulSoup")
+    return Bs4Backend()
+
+backend = select_backend()
+
+# --- Análisis con medición de tiempo ------------------------------------------
+
+stats_lock = threading.Lock()
+stats = {}   # tipo de página -> [analizador, páginas, segundos totales, segundos de la más lenta]
+pool = None  # ParsePool (parse_pool.py) si el análisis se hace fuera de los hilos de red
+
+def set_parse_pool(parse_pool):
+    """Envía los análisis siguientes al pool de procesos (None = en el hilo que llama)"""
+    global pool
+    pool = parse_pool
+
+def _as_text(html):
+    return html.decode("utf-8", errors="replace") if isinstance(html, bytes) else html
+
+def _profile_hrefs(html):
+    return backend.profile_hrefs(_as_text(html))
+
+def _citation_anchors(html):
+    return backend.citation_anchors(_as_text(html))
+
+def _versions_anchors(html):
+    return backend.versions_anchors(_as_text(html))
+
+def _pdf_anchor_links(html, base_url):
+    # Página de cualquier editorial: análisis completo, BeautifulSoup detecta la codificación
+    soup = BeautifulSoup(html, "html.parser")
+    pdf_links = []
+
+    # Buscar enlaces que apunten a un PDF o lo anuncien en el texto
+    for link in soup.find_all("a", href=True):
+        href = link["href"]
+        text = link.get_text(" ", strip=True)
+        if ".pdf" in href.lower() or "download" in href.lower() or "pdf" in text.lower():
+            full_url = urljoin(base_url, href)
+            pdf_links.append((full_url, text))
+
+    return pdf_links
+
+def run_parser(parser, *args):
+    """Ejecuta un análisis y mide su duración (en el propio proceso o en uno del pool)"""
+    start = time.perf_counter()
+    result = parser(*args)
+    return result, time.perf_counter() - start
+
+def _parse(kind, parser_name, parser, *args):
+    if pool is not None:
+        result, elapsed = pool.run(run_parser, parser, *args)
+    else:
+        result, elapsed = run_parser(parser, *args)
+    with stats_lock:
+        entry = stats.setdefault(kind, [parser_name, 0, 0.0, 0.0])
+        entry[1] += 1
+        entry[2] += elapsed
+        entry[3] = max(entry[3], elapsed)
+    return result
+
+def profile_hrefs(html):
+    """href de las filas de publicaciones (tr.gsc_a_tr a.gsc_a_at) de una página del perfil"""
+    return _parse("perfil", backend.name, _profile_hrefs, html)
+
+def citation_anchors(html):
+    """
+    Enlaces de una ficha. Retorna: (anclas, cluster)
+    anclas: (href, texto, lateral) de div#gsc_oci_title_wrapper, lateral si está en un bloque
+    gsc_oci_title_ggi; None si la ficha no tiene ese bloque.
+    cluster: href del enlace "All N versions" (cluster=) de div#gsc_oci_table, o None.
+    """
+    return _parse("ficha", backend.name, _citation_anchors, html)
+
+def versions_anchors(html):
+    """
+    Enlaces de la página "All N versions" de un cluster, versión a versión (div.gs_r).
+    Retorna: lista de (href, texto, lateral); laterales los de div.gs_ggs ([PDF], [HTML]),
+    no laterales los del título (h3.gs_rt).
+    """
+    return _parse("versiones", backend.name, _versions_anchors, html)
+
+def find_pdf_links(html, base_url):
+    """
+    Busca enlaces a PDF en el HTML ya descargado de una página.
+    Retorna: lista de (url, texto del enlace)
+    """
+    return _parse("aterrizaje", "bs4", _pdf_anchor_links, html, base_url)
+
+def print_parse_summary():
+    with stats_lock:
+        summary = {kind: list(entry) for kind, entry in stats.items()}
+    for kind, (parser_name, pages, total, slowest) in summary.items():
+        print(f"[INFO] Análisis HTML ({parser_name}), páginas de {kind}: {pages}, "
+              f"media {total / pages * 1000:.1f} ms/página, máx. {slowest * 1000:.1f} ms")
+
+# --- Autoprueba y comparación -------------------------------------------------
+
+GOLDEN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tests", "golden")
+GOLDEN_KINDS = ("perfil", "ficha", "versiones")   # Prefijo del nombre de cada página de referencia
+
+def extract(backend_instance, kind, html):
+    if kind == "perfil":
+        return backend_instance.profile_hrefs(html)
+    if kind == "versiones":
+        return backend_instance.versions_anchors(html)
+    return backend_instance.citation_anchors(html)
+
+def as_json(result):
+    """Resultado en la forma en que se guarda en el .json de referencia (tuplas -> listas)"""
+    return json.loads(json.dumps(result, ensure_ascii=False))
+
+def golden_kind(path):
+    kind = os.path.basename(path).split("_", 1)[0]
+    if kind not in GOLDEN_KINDS:
+        raise ValueError(f"{path}: el nombre debe empezar por {', '.join(k + '_' for k in GOLDEN_KINDS)}")
+    return kind
+
+def load_golden(directory=GOLDEN_DIR):
+    """Páginas de referencia: (nombre, tipo, html, esperado) por cada .html con su .json al lado"""
+    cases = []
+    for filename in sorted(os.listdir(directory)):
+        if not filename.endswith(".html"):
+            continue
+        path = os.path.join(directory, filename)
+        with open(path, "r", encoding="utf-8") as f:
+            html = f.read()
+        with open(path[:-len(".html")] + ".json", "r", encoding="utf-8") as f:
+            expected = json.load(f)
+        cases.append((filename, golden_kind(path), html, expected))
+    return cases
+
+def save_reference(path):
+    """Escribe el .json de referencia de una página guardada con lo que extrae BeautifulSoup (revisarlo a mano)"""
+    with open(path, "r", encoding="utf-8") as f:
+        result = extract(Bs4Backend(), golden_kind(path), f.read())
+    with open(path[:-len(".html")] + ".json", "w", encoding="utf-8") as f:
+        json.dump(as_json(result), f, ensure_ascii=False, indent=2)
+        f.write("\n")
+    print(f"[INFO] {path}: referencia guardada, revisar antes de confirmarla")
+
+def self_check():
+    """Cada analizador instalado debe dar exactamente los resultados de referencia de tests/golden/"""
+    ok = True
+    cases = load_golden()
+    for backend_instance in available_backends():
+        for name, kind, html, expected in cases:
+            result = as_json(extract(backend_instance, kind, html))
+            if result != expected:
+                print(f"[ERROR] {backend_instance.name}, {name}: {result!r} != {expected!r}")
+                ok = False
+        print(f"[INFO] {backend_instance.name}: {len(cases)} páginas de referencia comprobadas")
+    print("✅ Autoprueba superada" if ok else "❌ Autoprueba fallida")
+    return ok
+
+def compare_cached_pages():
+    """Compara todos los analizadores con BeautifulSoup sobre las páginas de Scholar de la caché HTTP"""
+    from http_cache import HttpCache
+
+    cache = HttpCache(offline=True)
+    backends = available_backends()
+    reference = backends[-1]
+    timings = {backend_instance.name: 0.0 for backend_instance in backends}
+    pages = differences = 0
+    for entry in list(cache.entries.values()):
+        if "scholar.google" not in entry["url"]:
+            continue
+        kind = ("ficha" if "view_citation" in entry["url"] else "perfil" if "list_works" in entry["url"]
+                else "versiones" if "cluster=" in entry["url"] else None)
+        page = cache.lookup(entry["url"], count=False) if kind else None
+        if page is None:
+            continue
+        pages += 1
+        html = page.text
+        results = {}
+        for backend_instance in backends:
+            start = time.perf_counter()
+            results[backend_instance.name] = extract(backend_instance, kind, html)
+            timings[backend_instance.name] += time.perf_counter() - start
+        for name, result in results.items():
+            if result != results[reference.name]:
+                differences += 1
+                print(f"[ERROR] {name} difiere de {reference.name} en {entry['url']}")
+    if not pages:
+        print("[INFO] No hay páginas de Scholar en la caché HTTP")
+        return True
+    for name, total in timings.items():
+        print(f"   {name:<12} {total / pages * 1000:.2f} ms/página")
+    print(f"[INFO] {pages} páginas comparadas, {differences} diferencias")
+    return differences == 0
+
+if __name__ == "__main__":
+    if "--autoprueba" in sys.argv:
+        sys.exit(0 if self_check() else 1)
+    if "--comparar" in sys.argv:
+        sys.exit(0 if compare_cached_pages() else 1)
+    if "--referencia" in sys.argv:
+        for path in sys.argv[sys.argv.index("--referencia") + 1:]:
+            save_reference(path)
+        sys.exit(0)
+    print(__doc__)
+    print(f"Analizadores instalados: {', '.join(b.name for b in available_backends())} (en uso: {backend.name})")
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Caché HTTP en disco compartida por los tres pasos de ScholarDown
+Guarda el cuerpo de las páginas comprimido (zstd si está instalado, si no gzip) junto
+con sus cabeceras y la fecha de descarga. Las páginas con ETag/Last-Modified se
+revalidan con peticiones condicionales (304 = sin volver a descargar). Con --offline
+los pasos vuelven a analizar las páginas guardadas sin hacer ninguna petición, así una
+mejora del extractor se aplica a miles de páginas sin tocar la red.
+El tamaño total está acotado: al superarlo se expulsan las páginas usadas hace más tiempo.
+
+Uso:
+    python http_cache.py             # Estadísticas de la caché
+    python http_cache.py --vaciar    # Borrar la caché
+"""
+
+import os
+import sys
+import gzip
+import json
+import time
+import shutil
+import hashlib
+import threading
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+CACHE_DIR = ".http_cache"
+INDEX_FILENAME = "index.jsonl"
+MAX_BYTES = 1073741824          # Tamaño máximo de los cuerpos comprimidos (1 GB)
+EVICT_TO = 0.9                  # Al expulsar, se baja hasta este porcentaje del máximo
+ZSTD_LEVEL = 10
+KEPT_HEADERS = ("Content-Type", "ETag", "Last-Modified", "Content-Language")
+
+class CachedPage:
+    """Página guardada; text y content como en requests.Response"""
+    block = None  # Solo se guardan páginas válidas (ver block_detector.py)
+
+    def __init__(self, entry, body):
+        self.url = entry["url"]
+        self.final_url = entry.get("final_url") or entry["url"]
+        self.status_code = entry.get("status", 200)
+        self.headers = entry.get("headers", {})
+        self.fetched_at = entry["fetched_at"]
+        self.complete = entry.get("complete", True)
+        self.content = body
+        self.from_cache = True
+
+    @property
+    def text(self):
+        content_type = self.headers.get("Content-Type", "")
+        charset = "utf-8"
+        if "charset=" in content_type:
+            charset = content_type.split("charset=", 1)[1].split(";")[0].strip().strip('"') or charset
+        try:
+            return self.content.decode(charset, errors="replace")
+        except LookupError:
+            return self.content.decode("utf-8", errors="replace")
+
+class HttpCache:
+    """
+    Estructura en disco:
+      .http_cache/objects/ab/abcdef....zst|.gz  -> cuerpo comprimido (clave = sha1 de la URL)
+      .http_cache/index.jsonl                   -> metadatos por URL (la última línea manda)
+    """
+    def __init__(self, root=CACHE_DIR, max_bytes=MAX_BYTES, offline=False):
+        self.root = root
+        self.objects_dir = os.path.join(root, "objects")
+        self.index_path = os.path.join(root, INDEX_FILENAME)
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.total_bytes = 0
+        self.index_lines = 0
+        self.stats = {"hits": 0, "misses": 0, "revalidated": 0, "stored": 0, "evicted": 0,
+                      "raw_bytes": 0, "stored_bytes": 0}
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # Línea truncada por un corte: se ignora
+                    self.index_lines += 1
+                    if entry.get("deleted"):
+                        self.entries.pop(entry["key"], None)
+                    else:
+                        self.entries[entry["key"]] = entry
+        except FileNotFoundError:
+            pass
+        # Un cuerpo perdido (borrado a mano, corte antes de escribirlo) invalida la entrada
+        for key, entry in list(self.entries.items()):
+            if not os.path.exists(self._body_path(key, entry["codec"])):
+                del self.entries[key]
+        self.total_bytes = sum(entry["size"] for entry in self.entries.values())
+
+    def _append_index(self, entry):
+        with open(self.index_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self.index_lines += 1
+
+    @staticmethod
+    def key_for(url):
+        return hashlib.sha1(url.encode("utf-8")).hexdigest()
+
+    def _body_path(self, key, codec):
+        return os.path.join(self.objects_dir, key[:2], f"{key}.{codec}")
+
+    # --- Compresión -----------------------------------------------------------
+
+    def _compress(self, body):
+        if zstandard:
+            return "zst", zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body)
+        return "gz", gzip.compress(body)
+
+    def _decompress(self, codec, data):
+        if codec == "zst":
+            if not zstandard:
+                return None  # Guardado con zstd pero el módulo ya no está instalado
+            return zstandard.ZstdDecompressor().decompress(data)
+        return gzip.decompress(data)
+
+    # --- Consulta -------------------------------------------------------------
+
+    def lookup(self, url, count=True):
+        """Página guardada para la URL o None; cuenta como uso reciente para la expulsión LRU"""
+        key = self.key_for(url)
+        with self.lock:
+            entry = self.entries.get(key)
+        body = None
+        if entry:
+            try:
+                with open(self._body_path(key, entry["codec"]), "rb") as f:
+                    body = self._decompress(entry["codec"], f.read())
+            except (OSError, EOFError, ValueError) as e:
+                print(f"[WARNING] Caché HTTP: cuerpo ilegible de {url} ({e})")
+        with self.lock:
+            if body is None:
+                if count:
+                    self.stats["misses"] += 1
+                return None
+            entry["last_access"] = time.time()
+            if count:
+                self.stats["hits"] += 1
+        return CachedPage(entry, body)
+
+    def contains(self, url):
+        with self.lock:
+            return self.key_for(url) in self.entries
+
+    def validators(self, url, require_complete=False):
+        """
+        Cabeceras condicionales (If-None-Match / If-Modified-Since) para revalidar la URL.
+        require_complete: no revalidar si solo se guardó el <head> de la página.
+        """
+        with self.lock:
+            entry = self.entries.get(self.key_for(url))
+        headers = {}
+        if entry and (entry.get("complete", True) or not require_complete):
+            if entry["headers"].get("ETag"):
+                headers["If-None-Match"] = entry["headers"]["ETag"]
+            if entry["headers"].get("Last-Modified"):
+                headers["If-Modified-Since"] = entry["headers"]["Last-Modified"]
+        return headers
+
+    def revalidated(self, url):
+        """El servidor respondió 304: se usa la copia guardada y se renueva su fecha"""
+        page = self.lookup(url, count=False)
+        if page is None:
+            return None
+        with self.lock:
+            entry = self.entries.get(self.key_for(url))
+            if entry:
+                entry["fetched_at"] = time.time()
+            self.stats["revalidated"] += 1
+        return page
+
+    # --- Escritura ------------------------------------------------------------
+
+    def store(self, url, body, headers=None, final_url=None, status=200, complete=True):
+        """Guarda (o reemplaza) la página de una URL"""
+        if self.offline:
+            return
+        key = self.key_for(url)
+        codec, data = self._compress(body)
+        path = self._body_path(key, codec)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+        kept = {}
+        for name in KEPT_HEADERS:
+            value = (headers or {}).get(name)
+            if value:
+                kept[name] = value
+        now = time.time()
+        entry = {"key": key, "url": url, "final_url": final_url if final_url != url else None,
+                 "status": status, "headers": kept, "codec": codec, "size": len(data),
+                 "raw_size": len(body), "complete": complete, "fetched_at": now, "last_access": now}
+        with self.lock:
+            old = self.entries.get(key)
+            if old:
+                self.total_bytes -= old["size"]
+                if old["codec"] != codec:
+                    self._remove_body(key, old["codec"])
+            self.entries[key] = entry
+            self.total_bytes += len(data)
+            self.stats["stored"] += 1
+            self.stats["raw_bytes"] += len(body)
+            self.stats["stored_bytes"] += len(data)
+            self._append_index(entry)
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+
+    def store_response(self, url, response, complete=True):
+        """Guarda una respuesta de requests ya leída"""
+        self.store(url, response.content, response.headers, response.url, response.status_code, complete)
+
+    def _remove_body(self, key, codec):
+        try:
+            os.remove(self._body_path(key, codec))
+        except FileNotFoundError:
+            pass
+
+    def _evict(self):
+        """Expulsa las páginas usadas hace más tiempo hasta bajar de EVICT_TO * máximo"""
+        target = self.max_bytes * EVICT_TO
+        for entry in sorted(self.entries.values(), key=lambda e: e["last_access"]):
+            if self.total_bytes <= target:
+                break
+            self._remove_body(entry["key"], entry["codec"])
+            del self.entries[entry["key"]]
+            self.total_bytes -= entry["size"]
+            self.stats["evicted"] += 1
+            self._append_index({"key": entry["key"], "deleted": True})
+
+    def close(self):
+        """Reescribe el índice compacto con los últimos accesos (usados por la expulsión LRU)"""
+        if self.offline:
+            return
+        with self.lock:
+            tmp = self.index_path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                for entry in self.entries.values():
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            os.replace(tmp, self.index_path)
+            self.index_lines = len(self.entries)
+
+    # --- Resumen --------------------------------------------------------------
+
+    def print_summary(self):
+        stats = self.stats
+        lookups = stats["hits"] + stats["misses"]
+        if not lookups and not stats["stored"] and not stats["revalidated"]:
+            return
+        hit_rate = stats["hits"] / lookups if lookups else 0.0
+        ratio = stats["raw_bytes"] / stats["stored_bytes"] if stats["stored_bytes"] else 0.0
+        mode = " (offline)" if self.offline else ""
+        print(f"\n🗂️ Caché HTTP{mode}: {len(self.entries)} páginas, {self.total_bytes / 1048576:.1f} MB "
+              f"de {self.max_bytes / 1048576:.0f} MB")
+        print(f"   Aciertos: {stats['hits']}/{lookups} ({hit_rate:.0%}) | Revalidadas (304): {stats['revalidated']} | "
+              f"Guardadas: {stats['stored']} (compresión {ratio:.1f}x) | Expulsadas: {stats['evicted']}")
+
+if __name__ == "__main__":
+    if "--vaciar" in sys.argv:
+        shutil.rmtree(CACHE_DIR, ignore_errors=True)
+        print(f"[INFO] Caché {CACHE_DIR} eliminada")
+        sys.exit(0)
+    cache = HttpCache()
+    raw = sum(entry.get("raw_size", 0) for entry in cache.entries.values())
+    codecs = {}
+    for entry in cache.entries.values():
+        codecs[entry["codec"]] = codecs.get(entry["codec"], 0) + 1
+    print(f"[INFO] {CACHE_DIR}: {len(cache.entries)} páginas, {cache.total_bytes / 1048576:.1f} MB comprimidos "
+          f"({raw / 1048576:.1f} MB sin comprimir), compresión: {codecs or '-'}")
+    print(f"   Compresor actual: {'zstd' if zstandard else 'gzip'} | Líneas de índice: {cache.index_lines}")
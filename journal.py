@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Diario de progreso (write-ahead) para ScholarDown
+Archivo JSONL de solo añadir, con una línea por ficha procesada: URL, estado, enlace,
+error y, si los hay, los demás candidatos de descarga de la ficha. La última línea de cada URL manda. Las escrituras se agrupan y se sincronizan
+con fsync en bloque; una línea a medias por un corte se descarta al abrir.
+La reanudación es por conjunto de URLs, no por posición: se puede editar papers.txt
+o relanzar cualquier subconjunto sin corromper el estado.
+
+Uso:
+    python journal.py [diario]               # Resumen por estado
+    python journal.py [diario] --compactar   # Reescribe el diario con una línea por URL
+"""
+
+import os
+import sys
+import json
+import time
+import atexit
+import threading
+from datetime import datetime
+
+JOURNAL_FILE = "journal.jsonl"
+FSYNC_RECORDS = 64          # Registros por grupo antes de forzar fsync
+FSYNC_INTERVAL = 2.0        # Segundos máximos que un registro espera su fsync
+COMPACT_MIN_LINES = 10000   # Compactar al abrir si hay al menos estas líneas...
+COMPACT_RATIO = 2           # ...y más del doble que URLs distintas
+
+STATUS_FOUND = "found"          # Enlace de descarga encontrado
+STATUS_NOT_FOUND = "not_found"  # Ficha leída, sin enlace
+STATUS_ERROR = "error"          # Fallaron todos los intentos: se reintenta al reanudar
+DONE_STATUSES = (STATUS_FOUND, STATUS_NOT_FOUND)
+
+class Journal:
+    """
+    Estado en memoria (URL -> último registro) respaldado por el diario en disco.
+    record() es seguro entre hilos; close() sincroniza lo pendiente.
+    """
+    def __init__(self, path=JOURNAL_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.lines = 0
+        self.unsynced = 0
+        self.closed = False
+        self._load()
+        self.file = open(self.path, "ab")
+        if self.lines >= COMPACT_MIN_LINES and self.lines > COMPACT_RATIO * len(self.entries):
+            self.compact()
+
+        self.stop_event = threading.Event()
+        self.sync_thread = threading.Thread(target=self._sync_loop, daemon=True)
+        self.sync_thread.start()
+        atexit.register(self.close)
+
+    def _load(self):
+        """Lee el diario; si el final quedó a medias (corte durante una escritura) lo recorta"""
+        good_offset = 0
+        try:
+            with open(self.path, "rb") as f:
+                for raw in f:
+                    if not raw.endswith(b"\n"):
+                        break  # Última línea incompleta
+                    try:
+                        entry = json.loads(raw)
+                        self.entries[entry["url"]] = entry
+                        self.lines += 1
+                    except (ValueError, KeyError):
+                        pass  # Línea dañada en medio: se ignora
+                    good_offset += len(raw)
+        except FileNotFoundError:
+            return
+        if good_offset < os.path.getsize(self.path):
+            print(f"[WARNING] {self.path}: se descarta una línea incompleta al final")
+            with open(self.path, "r+b") as f:
+                f.truncate(good_offset)
+
+    def record(self, url, status, link=None, error=None, source=None, candidates=None):
+        """Añade el resultado de una URL; se sincroniza en el siguiente grupo"""
+        entry = {"url": url, "status": status, "link": link, "error": error,
+                 "ts": datetime.now().isoformat(timespec="seconds")}
+        if source:
+            entry["source"] = source
+        if candidates:
+            entry["candidates"] = candidates
+        data = (json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8")
+        with self.lock:
+            self.entries[url] = entry
+            self.file.write(data)
+            self.lines += 1
+            self.unsynced += 1
+            if self.unsynced >= FSYNC_RECORDS:
+                self._sync()
+
+    def _sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.unsynced = 0
+
+    def _sync_loop(self):
+        while not self.stop_event.wait(FSYNC_INTERVAL):
+            with self.lock:
+                if self.unsynced and not self.closed:
+                    self._sync()
+
+    def is_done(self, url):
+        entry = self.entries.get(url)
+        return entry is not None and entry["status"] in DONE_STATUSES
+
+    def pending(self, urls):
+        """URLs (en su orden) que faltan por procesar o fallaron la última vez"""
+        return [url for url in urls if not self.is_done(url)]
+
+    def links_for(self, urls):
+        """Enlaces encontrados para esas URLs, en su orden"""
+        links = []
+        for url in urls:
+            entry = self.entries.get(url)
+            if entry and entry["status"] == STATUS_FOUND and entry.get("link"):
+                links.append(entry["link"])
+        return links
+
+    def counts(self):
+        counts = {}
+        for entry in self.entries.values():
+            counts[entry["status"]] = counts.get(entry["status"], 0) + 1
+        return counts
+
+    def export_links(self, urls, output_file):
+        """Escribe el archivo de enlaces de una vez (temporal + reemplazo atómico)"""
+        links = self.links_for(urls)
+        tmp = output_file + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for link in links:
+                f.write(link + "\n")
+        os.replace(tmp, output_file)
+        return len(links)
+
+    def export_candidates(self, urls, output_file):
+        """
+        Archivo JSONL con los candidatos de cada ficha que los tenga, indexado por el
+        enlace escrito en el archivo de enlaces (temporal + reemplazo atómico)
+        """
+        count = 0
+        tmp = output_file + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for url in urls:
+                entry = self.entries.get(url)
+                if entry and entry["status"] in DONE_STATUSES and entry.get("candidates"):
+                    record = {"link": entry.get("link"), "url": url, "candidates": entry["candidates"]}
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    count += 1
+        os.replace(tmp, output_file)
+        return count
+
+    def compact(self):
+        """Reescribe el diario con una sola línea por URL"""
+        with self.lock:
+            self._sync()
+            tmp = self.path + ".tmp"
+            with open(tmp, "wb") as f:
+                for entry in self.entries.values():
+                    f.write((json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8"))
+                f.flush()
+                os.fsync(f.fileno())
+            self.file.close()
+            before = self.lines
+            os.replace(tmp, self.path)
+            self.file = open(self.path, "ab")
+            self.lines = len(self.entries)
+        print(f"[INFO] Diario compactado: {before} -> {self.lines} líneas")
+
+    def close(self):
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            self._sync()
+            self.file.close()
+        self.stop_event.set()
+
+if __name__ == "__main__":
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    path = args[0] if args else JOURNAL_FILE
+    if not os.path.exists(path):
+        print(f"[ERROR] No existe el diario {path}")
+        sys.exit(1)
+    start_time = time.time()
+    journal = Journal(path)
+    print(f"[INFO] {path}: {journal.lines} líneas, {len(journal.entries)} URLs "
+          f"(cargado en {time.time() - start_time:.2f}s)")
+    for status, count in sorted(journal.counts().items()):
+        print(f"   {status:<10} {count}")
+    if "--compactar" in sys.argv:
+        journal.compact()
+    journal.close()
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Índice offline de acceso abierto para ScholarDown
+Construye, a partir de un volcado JSONL (DOI -> URL OA), un índice compacto en disco
+con claves ordenadas y offsets, consultable por mmap sin tocar Google Scholar.
+
+Uso:
+    python oa_index.py volcado.jsonl [prefijo]     # Construir oa_index.dat / oa_index.idx
+    python oa_index.py --buscar 10.1234/abcd       # Consultar un DOI
+"""
+
+import os
+import re
+import sys
+import json
+import mmap
+import time
+import heapq
+import array
+import tempfile
+from urllib.parse import unquote
+
+OA_INDEX_PREFIX = "oa_index"
+RUN_SIZE = 1000000  # Registros ordenados en memoria antes de volcar un tramo a disco
+
+# La cola del DOI acaba en la consulta o el fragmento de la URL (?casa_token=, ?needAccess=, #...)
+DOI_RE = re.compile(r"10\.\d{4,9}/[^\s\"'<>?#&]+", re.IGNORECASE)
+
+def normalize_doi(doi):
+    """Normaliza un DOI: minúsculas y sin prefijos doi:/https://doi.org/"""
+    doi = unquote(doi.strip()).lower()
+    for prefix in ("https://doi.org/", "http://doi.org/", "https://dx.doi.org/", "http://dx.doi.org/", "doi:"):
+        if doi.startswith(prefix):
+            doi = doi[len(prefix):]
+    return doi.strip()
+
+def extract_doi(text):
+    """Busca un DOI dentro de un texto o URL; retorna el DOI normalizado o None"""
+    match = DOI_RE.search(unquote(text or ""))
+    if not match:
+        return None
+    # Quitar puntuación final y sufijos de editoriales que no forman parte del DOI
+    doi = match.group(0).rstrip(".,;)]}")
+    doi = re.sub(r"(\.pdf|/full|/abstract|/pdf|/epdf)$", "", doi, flags=re.IGNORECASE)
+    return normalize_doi(doi)
+
+def extract_oa_url(record):
+    """Obtiene la URL OA de un registro (formato simple o formato Unpaywall)"""
+    for key in ("oa_url", "url_for_pdf", "url"):
+        if isinstance(record.get(key), str) and record[key]:
+            return record[key]
+    location = record.get("best_oa_location") or {}
+    return location.get("url_for_pdf") or location.get("url")
+
+def _write_run(records, tmp_dir):
+    # Orden por (DOI, línea del volcado): entre DOIs repetidos queda delante el primero del volcado
+    records.sort()
+    fd, path = tempfile.mkstemp(prefix="oa_run_", suffix=".tsv", dir=tmp_dir)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        for doi, position, url in records:
+            f.write(f"{doi}\t{position}\t{url}\n")
+    return path
+
+def _read_run(path):
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            doi, position, url = line.rstrip("\n").split("\t", 2)
+            yield doi, int(position), url
+
+def build_index(dump_path, prefix=OA_INDEX_PREFIX):
+    """
+    Ordenación externa del volcado: tramos ordenados en disco y mezcla final.
+    Escribe <prefijo>.dat (líneas 'doi\\turl' ordenadas) y <prefijo>.idx (offsets uint64).
+    """
+    start_time = time.time()
+    tmp_dir = os.path.dirname(os.path.abspath(prefix)) or "."
+    runs = []
+    records = []
+    read_count = 0
+    skipped = 0
+
+    print(f"[INFO] Leyendo volcado {dump_path}...")
+    with open(dump_path, "r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            read_count += 1
+            try:
+                record = json.loads(line)
+            except ValueError:
+                skipped += 1
+                continue
+            doi = record.get("doi")
+            url = extract_oa_url(record)
+            if not doi or not url:
+                skipped += 1
+                continue
+            records.append((normalize_doi(doi), read_count, url.strip().replace("\t", " ").replace("\n", " ")))
+            if len(records) >= RUN_SIZE:
+                runs.append(_write_run(records, tmp_dir))
+                records = []
+                print(f"   [{read_count:,} líneas] Tramo {len(runs)} ordenado")
+    if records:
+        runs.append(_write_run(records, tmp_dir))
+
+    print(f"[INFO] Mezclando {len(runs)} tramos...")
+    offsets = array.array("Q")
+    written = 0
+    last_doi = None
+    try:
+        with open(prefix + ".dat.tmp", "wb") as data:
+            for doi, _, url in heapq.merge(*[_read_run(path) for path in runs]):
+                if doi == last_doi:
+                    continue  # DOI repetido: se conserva el que aparece primero en el volcado
+                last_doi = doi
+                offsets.append(data.tell())
+                data.write(f"{doi}\t{url}\n".encode("utf-8"))
+                written += 1
+        if sys.byteorder != "little":
+            offsets.byteswap()
+        with open(prefix + ".idx.tmp", "wb") as idx:
+            offsets.tofile(idx)
+        os.replace(prefix + ".dat.tmp", prefix + ".dat")
+        os.replace(prefix + ".idx.tmp", prefix + ".idx")
+    finally:
+        for path in runs:
+            os.remove(path)
+
+    elapsed = time.time() - start_time
+    print(f"[INFO] Índice OA construido: {written:,} DOIs ({skipped:,} líneas descartadas) en {elapsed:.1f}s")
+    print(f"[INFO] Archivos: {prefix}.dat ({os.path.getsize(prefix + '.dat') / 1048576:.1f} MB), {prefix}.idx")
+    return written
+
+class OAIndex:
+    """Consulta del índice por búsqueda binaria sobre los offsets, todo en mmap"""
+    def __init__(self, prefix=OA_INDEX_PREFIX):
+        self.data_file = open(prefix + ".dat", "rb")
+        self.idx_file = open(prefix + ".idx", "rb")
+        self.count = os.path.getsize(prefix + ".idx") // 8
+        self.data = None
+        self.offsets = []
+        if self.count:
+            self.data = mmap.mmap(self.data_file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.idx = mmap.mmap(self.idx_file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.offsets = memoryview(self.idx).cast("Q")
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def open_if_exists(cls, prefix=OA_INDEX_PREFIX):
+        """Abre el índice si se ha construido; si no, retorna None sin error"""
+        if os.path.exists(prefix + ".dat") and os.path.exists(prefix + ".idx"):
+            index = cls(prefix)
+            print(f"[INFO] Índice OA cargado: {index.count:,} DOIs")
+            return index
+        return None
+
+    def _key_at(self, i):
+        start = self.offsets[i]
+        return self.data[start:self.data.find(b"\t", start)]
+
+    def lookup(self, doi):
+        """Retorna la URL OA del DOI, o None"""
+        if not doi or not self.count:
+            return None
+        key = normalize_doi(doi).encode("utf-8")
+        low, high = 0, self.count
+        while low < high:
+            mid = (low + high) // 2
+            if self._key_at(mid) < key:
+                low = mid + 1
+            else:
+                high = mid
+        if low < self.count and self._key_at(low) == key:
+            start = self.offsets[low] + len(key) + 1
+            self.hits += 1
+            return self.data[start:self.data.find(b"\n", start)].decode("utf-8")
+        self.misses += 1
+        return None
+
+    def close(self):
+        if self.data is not None:
+            self.offsets.release()
+            self.idx.close()
+            self.data.close()
+        self.data_file.close()
+        self.idx_file.close()
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 3 and sys.argv[1] == "--buscar":
+        index = OAIndex.open_if_exists()
+        if not index:
+            print(f"[ERROR] No existe {OA_INDEX_PREFIX}.dat / {OA_INDEX_PREFIX}.idx")
+            sys.exit(1)
+        start = time.perf_counter()
+        result = index.lookup(sys.argv[2])
+        elapsed_us = (time.perf_counter() - start) * 1e6
+        print(f"{sys.argv[2]} -> {result or 'sin versión OA'} ({elapsed_us:.0f} µs)")
+    elif len(sys.argv) >= 2:
+        build_index(sys.argv[1], sys.argv[2] if len(sys.argv) >= 3 else OA_INDEX_PREFIX)
+    else:
+        print(__doc__)
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Pool de procesos para el análisis HTML de ScholarDown
+Los hilos de red envían los bytes de la página a un ProcessPoolExecutor y reciben
+los enlaces ya extraídos: el análisis usa todos los núcleos y no retiene el GIL de
+los hilos que descargan. Un semáforo limita los análisis en curso (contrapresión):
+si los procesos no dan abasto, los hilos de red esperan antes de entregar la página
+y dejan de descargar nuevas hasta que haya sitio.
+En Windows cada proceso del pool vuelve a importar el script que lo lanzó.
+
+Uso:
+    python parse_pool.py --autoprueba   # Mismos resultados en el pool que en el propio hilo
+"""
+
+import os
+import sys
+import time
+import threading
+import concurrent.futures
+from concurrent.futures.process import BrokenProcessPool
+
+PROCESOS = max(1, (os.cpu_count() or 2) - 1)   # Procesos de análisis (deja un núcleo a la red)
+PENDIENTES_POR_PROCESO = 2                     # Análisis en curso o en cola por proceso
+
+class ParsePool:
+    """run(func, *args) desde cualquier hilo: ejecuta func en un proceso del pool y retorna su resultado"""
+    def __init__(self, workers=PROCESOS, max_pending=None):
+        self.workers = workers
+        self.executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+        # Arrancar los procesos ya, antes de que los hilos de red empiecen a descargar
+        self.executor.submit(int).result()
+        self.max_pending = max_pending or workers * PENDIENTES_POR_PROCESO
+        self.slots = threading.BoundedSemaphore(self.max_pending)
+        self.lock = threading.Lock()
+        self.broken = False
+        self.jobs = 0
+        self.waited = 0.0      # Tiempo que los hilos de red esperaron por contrapresión
+        self.fallbacks = 0
+        self.in_flight = 0
+        self.peak = 0          # Máximo de análisis en curso a la vez
+
+    def run(self, func, *args):
+        if self.broken:
+            return self._run_here(func, *args)
+        start = time.monotonic()
+        self.slots.acquire()
+        waited = time.monotonic() - start
+        with self.lock:
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+        try:
+            result = self.executor.submit(func, *args).result()
+        except BrokenProcessPool as e:
+            # Un proceso murió (memoria, señal): el resto del análisis se hace en los hilos
+            with self.lock:
+                if not self.broken:
+                    print(f"[WARNING] Pool de análisis roto ({e}); se analiza en los hilos de red")
+                self.broken = True
+            return self._run_here(func, *args)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+            self.slots.release()
+        with self.lock:
+            self.jobs += 1
+            self.waited += waited
+        return result
+
+    def _run_here(self, func, *args):
+        with self.lock:
+            self.fallbacks += 1
+        return func(*args)
+
+    def print_summary(self):
+        if not self.jobs and not self.fallbacks:
+            return
+        print(f"[INFO] Pool de análisis: {self.jobs} páginas en {self.workers} procesos, "
+              f"máx. {self.peak}/{self.max_pending} en curso, espera por contrapresión {self.waited:.1f}s"
+              + (f", {self.fallbacks} analizadas en los hilos" if self.fallbacks else ""))
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+# --- Autoprueba ---------------------------------------------------------------
+
+def self_check(threads=8, pages=64):
+    """Los resultados del pool coinciden con el análisis en el hilo y la contrapresión acota la cola"""
+    import html_backend
+
+    with open(os.path.join(html_backend.GOLDEN_DIR, "ficha_completa.html"), "r", encoding="utf-8") as f:
+        page = f.read().replace("</body>", "<p>relleno</p>" * 2000 + "</body>")
+    expected = html_backend.citation_anchors(page)
+
+    pool = ParsePool(workers=2, max_pending=3)
+    html_backend.set_parse_pool(pool)
+    results = []
+    lock = threading.Lock()
+
+    def worker(count):
+        for _ in range(count):
+            result = html_backend.citation_anchors(page.encode("utf-8"))
+            with lock:
+                results.append(result)
+
+    start = time.perf_counter()
+    workers = [threading.Thread(target=worker, args=(pages // threads,)) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    html_backend.set_parse_pool(None)
+    pool.print_summary()
+    pool.close()
+
+    ok = True
+    if any(result != expected for result in results) or len(results) != pages:
+        print("[ERROR] El pool devolvió resultados distintos al análisis en el hilo")
+        ok = False
+    if pool.peak > pool.max_pending:
+        print(f"[ERROR] Contrapresión rota: {pool.peak} análisis simultáneos (máximo {pool.max_pending})")
+        ok = False
+    print(f"[INFO] {pages} páginas en {elapsed:.2f}s con {threads} hilos de red y 2 procesos")
+    print("✅ Autoprueba superada" if ok else "❌ Autoprueba fallida")
+    return ok
+
+if __name__ == "__main__":
+    if "--autoprueba" in sys.argv:
+        sys.exit(0 if self_check() else 1)
+    print(__doc__)
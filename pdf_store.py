@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Almacén de PDFs direccionado por contenido para ScholarDown
+Guarda un único blob por hash SHA-256 y construye la carpeta legible con enlaces
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import threading
+
+STORE_DIRNAME = ".store"
+INDEX_FILENAME = "index.jsonl"
+HASH_CHUNK_SIZE = 1048576
+
+def hash_file(path, hasher=None):
+    """Calcula (o continúa) el SHA-256 de un archivo leyéndolo por bloques"""
+    hasher = hasher or hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            hasher.update(block)
+    return hasher
+
+class PdfStore:
+    """
+    Estructura en disco:
+      pdf/.store/objects/ab/abcdef....pdf   -> un blob por contenido
+      pdf/.store/tmp/<sha1(url)>.part       -> descargas en curso
+      pdf/.store/index.jsonl                -> URL de origen -> hash
+      pdf/<nombre>.pdf                      -> enlace duro/simbólico al blob
+    """
+    def __init__(self, root):
+        self.root = root
+        self.store_dir = os.path.join(root, STORE_DIRNAME)
+        self.objects_dir = os.path.join(self.store_dir, "objects")
+        self.tmp_dir = os.path.join(self.store_dir, "tmp")
+        self.index_path = os.path.join(self.store_dir, INDEX_FILENAME)
+        self.lock = threading.Lock()
+        self.url_to_hash = {}
+        self.hash_to_name = {}
+        self.dedup_hits = 0
+
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # Línea truncada por un corte: se ignora
+                    self.url_to_hash[entry["url"]] = entry["sha256"]
+                    if entry.get("name"):
+                        self.hash_to_name[entry["sha256"]] = entry["name"]
+        except FileNotFoundError:
+            pass
+
+    def _append_index(self, url, sha256, name):
+        entry = {"url": url, "sha256": sha256, "name": name}
+        with open(self.index_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+        self.url_to_hash[url] = sha256
+        if name:
+            self.hash_to_name[sha256] = name
+
+    def blob_path(self, sha256):
+        return os.path.join(self.objects_dir, sha256[:2], sha256 + ".pdf")
+
+    def tmp_path(self, url):
+        """Ruta del .part de una URL (única por URL, sin colisiones de nombre)"""
+        return os.path.join(self.tmp_dir, hashlib.sha1(url.encode("utf-8")).hexdigest() + ".part")
+
+    def lookup(self, url):
+        """Retorna el hash ya almacenado para la URL, o None si hay que descargarla"""
+        with self.lock:
+            sha256 = self.url_to_hash.get(url)
+        if sha256 and os.path.exists(self.blob_path(sha256)):
+            return sha256
+        return None
+
+    def name_for(self, sha256):
+        with self.lock:
+            return self.hash_to_name.get(sha256)
+
+    def add_alias(self, url, sha256):
+        """Registra otra URL de origen (p.ej. la página de aterrizaje) para un blob existente"""
+        with self.lock:
+            if self.url_to_hash.get(url) != sha256:
+                self._append_index(url, sha256, self.hash_to_name.get(sha256))
+
+    def commit(self, url, tmp_path, sha256, filename):
+        """
+        Mueve una descarga terminada al almacén y la enlaza en la carpeta legible.
+        Retorna: (nombre visible, es_duplicado)
+        """
+        blob = self.blob_path(sha256)
+        with self.lock:
+            duplicate = os.path.exists(blob)
+            if duplicate:
+                os.remove(tmp_path)
+                self.dedup_hits += 1
+            else:
+                os.makedirs(os.path.dirname(blob), exist_ok=True)
+                os.replace(tmp_path, blob)
+
+            name = self.hash_to_name.get(sha256)
+            if not name or not os.path.exists(os.path.join(self.root, name)):
+                name = self._link_into_tree(blob, sha256, filename)
+            self._append_index(url, sha256, name)
+        return name, duplicate
+
+    def _link_into_tree(self, blob, sha256, filename):
+        """Crea pdf/<nombre> apuntando al blob; si el nombre ya lo usa otro contenido, añade el hash"""
+        name = filename
+        target = os.path.join(self.root, name)
+        if os.path.lexists(target):
+            base, ext = os.path.splitext(filename)
+            name = f"{base}_{sha256[:8]}{ext}"
+            target = os.path.join(self.root, name)
+            if os.path.lexists(target):
+                return name
+
+        try:
+            os.link(blob, target)
+        except OSError:
+            try:
+                os.symlink(os.path.relpath(blob, self.root), target)
+            except OSError:
+                # Sistemas de archivos sin enlaces: copia como último recurso
+                shutil.copy2(blob, target)
+        return name
+
+    def forget(self, sha256):
+        """Elimina un blob (p.ej. puesto en cuarentena); sus URLs se volverán a descargar"""
+        with self.lock:
+            try:
+                os.remove(self.blob_path(sha256))
+            except FileNotFoundError:
+                pass
+            self.hash_to_name.pop(sha256, None)
+            for url in [u for u, h in self.url_to_hash.items() if h == sha256]:
+                del self.url_to_hash[url]
+
+    def ensure_link(self, sha256, filename):
+        """Garantiza que un blob existente tiene su enlace en la carpeta legible"""
+        with self.lock:
+            name = self.hash_to_name.get(sha256)
+            if name and os.path.exists(os.path.join(self.root, name)):
+                return name
+            name = self._link_into_tree(self.blob_path(sha256), sha256, filename)
+            self.hash_to_name[sha256] = name
+            return name
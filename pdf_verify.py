@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Verificación de integridad de PDFs para ScholarDown
+Comprueba la firma %PDF-, el trailer %%EOF y la coherencia de startxref, tanto durante
+la descarga como en lote sobre la carpeta pdf/ (los archivos dañados van a cuarentena).
+
+Uso:
+    python pdf_verify.py [carpeta]
+"""
+
+import os
+import re
+import sys
+import time
+import shutil
+import hashlib
+import concurrent.futures
+
+HEAD_BYTES = 1024
+TAIL_BYTES = 2048
+QUARANTINE_DIRNAME = "_cuarentena"
+MAX_WORKERS = os.cpu_count() or 4
+
+STARTXREF_RE = re.compile(rb"startxref\s+(\d+)")
+
+def check_pdf_head(first_bytes):
+    """Retorna None si el inicio es un PDF; si no, el motivo del rechazo"""
+    head = first_bytes[:HEAD_BYTES]
+    if b"%PDF-" in head:
+        return None
+    lowered = head.lstrip(b"\xef\xbb\xbf \t\r\n").lower()
+    if lowered.startswith((b"<!doctype", b"<html", b"<head", b"<?xml")) or b"<html" in lowered:
+        return "HTML servido como PDF"
+    return "Sin firma %PDF-"
+
+def check_pdf_tail(tail, size):
+    """Retorna None si el final es coherente; si no, el motivo (archivo truncado o corrupto)"""
+    if b"%%EOF" not in tail[-1024:]:
+        return "Sin trailer %%EOF (truncado)"
+    matches = STARTXREF_RE.findall(tail)
+    if not matches:
+        return "Sin startxref"
+    offset = int(matches[-1])
+    if offset <= 0 or offset >= size:
+        return f"startxref fuera de rango ({offset} >= {size})"
+    return None
+
+def verify_file(path):
+    """Verifica un PDF en disco; retorna (ruta, motivo o None)"""
+    try:
+        size = os.path.getsize(path)
+        with open(path, "rb") as f:
+            first = f.read(HEAD_BYTES)
+            f.seek(max(0, size - TAIL_BYTES))
+            tail = f.read(TAIL_BYTES)
+    except OSError as e:
+        return path, f"No se puede leer: {e}"
+    if size == 0:
+        return path, "Archivo vacío"
+    return path, check_pdf_head(first) or check_pdf_tail(tail, size)
+
+def quarantine(path, folder):
+    """Mueve un PDF dañado a <carpeta>/_cuarentena y retorna su hash (para olvidarlo en el almacén)"""
+    quarantine_dir = os.path.join(folder, QUARANTINE_DIRNAME)
+    os.makedirs(quarantine_dir, exist_ok=True)
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1048576), b""):
+            hasher.update(block)
+    destination = os.path.join(quarantine_dir, os.path.basename(path))
+    if os.path.islink(path):
+        # Enlace simbólico al almacén: movido quedaría roto y forget() borra el blob,
+        # así que a la cuarentena va una copia del blob y el enlace se elimina
+        shutil.copy2(os.path.realpath(path), destination)
+        os.remove(path)
+    else:
+        shutil.move(path, destination)
+    return hasher.hexdigest()
+
+def verify_folder(folder, workers=MAX_WORKERS, store=None):
+    """
+    Verifica en paralelo (pool de procesos) todos los PDF de la carpeta y pone en
+    cuarentena los dañados. Si se pasa el almacén, se eliminan también sus blobs.
+    Retorna: lista de (nombre, motivo)
+    """
+    paths = [os.path.join(folder, name) for name in sorted(os.listdir(folder))
+             if name.lower().endswith(".pdf") and os.path.isfile(os.path.join(folder, name))]
+    if not paths:
+        return []
+
+    print(f"[INFO] Verificando {len(paths)} PDFs en {folder} con {workers} procesos...")
+    start_time = time.time()
+    broken = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        for path, reason in executor.map(verify_file, paths, chunksize=32):
+            if reason:
+                broken.append((path, reason))
+
+    for path, reason in broken:
+        sha256 = quarantine(path, folder)
+        if store:
+            store.forget(sha256)
+        print(f"   🚫 {os.path.basename(path)}: {reason} -> {QUARANTINE_DIRNAME}/")
+
+    elapsed = time.time() - start_time
+    print(f"[INFO] Verificación completada en {elapsed:.1f}s: {len(paths) - len(broken)} válidos, "
+          f"{len(broken)} en cuarentena")
+    return [(os.path.basename(path), reason) for path, reason in broken]
+
+if __name__ == "__main__":
+    target = sys.argv[1] if len(sys.argv) > 1 else "pdf"
+    if not os.path.isdir(target):
+        print(f"[ERROR] No existe la carpeta {target}")
+        sys.exit(1)
+    from pdf_store import PdfStore
+    verify_folder(target, store=PdfStore(target))
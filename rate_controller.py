@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Control adaptativo del ritmo de peticiones a Google Scholar para ScholarDown
+Un cubo de fichas por identidad con ritmo AIMD: cada racha de éxitos sube el ritmo un
+paso fijo y cada bloqueo (429 o captcha) lo divide, respetando Retry-After. Encima del
+ritmo aprendido se añade una separación aleatoria, como la de una persona.
+"""
+
+import time
+import random
+import threading
+
+RITMO_INICIAL = 0.25       # Peticiones por segundo al empezar (una cada 4s, como las pausas fijas anteriores)
+RITMO_MINIMO = 1 / 60      # Nunca por debajo de una petición por minuto
+RITMO_MAXIMO = 1.0         # Techo aunque Scholar lo tolere todo
+RAFAGA = 1                 # Fichas acumulables: sin ráfagas tras una pausa larga
+PASO_SUBIDA = 0.02         # Incremento aditivo tras cada racha de éxitos
+RACHA_EXITOS = 5           # Éxitos seguidos necesarios para subir el ritmo
+FACTOR_BAJADA = 0.5        # Reducción multiplicativa ante un bloqueo
+JITTER = (0.3, 1.5)        # Separación aleatoria añadida a cada espera (segundos)
+
+class RateController:
+    """
+    Ritmo de una identidad. acquire() antes de cada petición; on_success()/on_block()
+    después, según la respuesta. El ritmo actual se consulta con describe().
+    """
+    def __init__(self, name, rate=RITMO_INICIAL):
+        self.name = name
+        self.rate = rate
+        self.tokens = RAFAGA
+        self.last_refill = time.monotonic()
+        self.blocked_until = 0.0
+        self.streak = 0
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.blocks = 0
+        self.waited = 0.0
+
+    def acquire(self):
+        """Espera a tener ficha (y a que venza un Retry-After) más la separación aleatoria; retorna lo esperado"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(RAFAGA, self.tokens + (now - self.last_refill) * self.rate)
+            self.last_refill = now
+            wait = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+            wait = max(wait, self.blocked_until - now)
+            # La ficha se reserva ya: el saldo negativo lo repone el tiempo de espera
+            self.tokens -= 1
+            self.requests += 1
+        wait += random.uniform(*JITTER)
+        time.sleep(wait)
+        with self.lock:
+            self.waited += wait
+        return wait
+
+    def on_success(self):
+        """Respuesta válida: subida aditiva tras RACHA_EXITOS seguidos"""
+        with self.lock:
+            self.streak += 1
+            if self.streak < RACHA_EXITOS or self.rate >= RITMO_MAXIMO:
+                return
+            self.streak = 0
+            old = self.rate
+            self.rate = min(RITMO_MAXIMO, self.rate + PASO_SUBIDA)
+        print(f"   [RITMO] {self.name}: {old:.2f} -> {self.rate:.2f} req/s")
+
+    def on_block(self, retry_after=None):
+        """429 o captcha: bajada multiplicativa y, si el servidor lo indica, pausa hasta Retry-After"""
+        with self.lock:
+            self.blocks += 1
+            self.streak = 0
+            old = self.rate
+            self.rate = max(RITMO_MINIMO, self.rate * FACTOR_BAJADA)
+            self.tokens = min(self.tokens, 0)
+            if retry_after:
+                self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+        extra = f", Retry-After {retry_after:.0f}s" if retry_after else ""
+        print(f"   [RITMO] {self.name}: {old:.2f} -> {self.rate:.2f} req/s (bloqueo{extra})")
+
+    def describe(self):
+        return f"{self.rate:.2f} req/s"
@@ -82,8 +82,8 @@ Orquesta la ejecución de todos los scripts con funcionalidades avanzadas
 import subprocess
 import sys
 import os
-import json
 from datetime import datetime
+from journal import Journal, JOURNAL_FILE
 
 def verificar_archivos_necesarios():
     """Verifica que existan los archivos necesarios"""
@@ -105,17 +105,29 @@ def verificar_archivos_necesarios():
     return True
 
 def verificar_progreso():
-    """Verifica si hay progreso previo y pregunta al usuario"""
-    if os.path.exists("progress.json"):
+    """Verifica si el diario del paso 2 tiene URLs pendientes de papers.txt y pregunta al usuario"""
+    if os.path.exists(JOURNAL_FILE):
         try:
-            with open("progress.json", "r", encoding="utf-8") as f:
-                progress = json.load(f)
+            journal = Journal(JOURNAL_FILE)
+            urls = []
+            if os.path.exists("papers.txt"):
+                with open("papers.txt", "r", encoding="utf-8") as f:
+                    for line in f:
+                        parts = line.strip().split(": ", 1)
+                        if len(parts) == 2 and parts[1].startswith("http"):
+                            urls.append(parts[1])
+            pendientes = len(journal.pending(urls))
+            counts = journal.counts()
+            journal.close()
+            if not urls or not pendientes:
+                # Diario completo: las URLs ya hechas se reutilizan sin volver a Scholar
+                return False
             
-            print(f"[INFO] Se detectó progreso previo:")
-            print(f"  - Procesadas: {progress['processed']} URLs")
-            print(f"  - Total: {progress['total']} URLs") 
-            print(f"  - Resultados: {progress['results_count']} enlaces")
-            print(f"  - Fecha: {progress['timestamp']}")
+            print(f"[INFO] Se detectó progreso previo ({JOURNAL_FILE}):")
+            print(f"  - Procesadas: {len(urls) - pendientes} de {len(urls)} URLs")
+            print(f"  - Pendientes o con error: {pendientes} URLs")
+            print(f"  - Resultados: {counts.get('found', 0)} enlaces")
+            print(f"  - Fecha: {datetime.fromtimestamp(os.path.getmtime(JOURNAL_FILE)).isoformat(timespec='seconds')}")
             
             respuesta = input("\n¿Desea continuar desde donde se quedó? (s/n): ").lower().strip()
             if respuesta in ['s', 'si', 'yes', 'y']:
@@ -123,7 +135,7 @@ def verificar_progreso():
             else:
                 # Limpiar archivos de progreso
                 try:
-                    os.remove("progress.json")
+                    os.remove(JOURNAL_FILE)
                     if os.path.exists("papers2.txt"):
                         os.remove("papers2.txt")
                     print("[INFO] Progreso anterior eliminado. Comenzando desde cero.")
@@ -342,7 +354,7 @@ def main():
     else:
         # Solo ejecutar desde el paso 2 (el script detectará automáticamente el progreso)
         programas = [
-            ("python scholardown_part.py", "PASO 2: Continuando búsqueda avanzada de enlaces de descarga"),
+            ("python scholardown_part2.py", "PASO 2: Continuando búsqueda avanzada de enlaces de descarga"),
             ("python scholardown_part3.py", "PASO 3: Descarga masiva de archivos PDF")
         ]
     
@@ -379,9 +391,9 @@ def main():
     if limpiados > 0:
         print(f"🧹 {limpiados} archivos temporales eliminados.")
     
-    # Mantener progress.json para posibles reanudaciones futuras
-    if os.path.exists("progress.json"):
-        print("💾 Archivo progress.json mantenido para futuras reanudaciones.")
+    # Mantener el diario para posibles reanudaciones futuras
+    if os.path.exists(JOURNAL_FILE):
+        print(f"💾 Diario {JOURNAL_FILE} mantenido: las URLs ya procesadas no se vuelven a consultar.")
     
     # Mostrar archivos generados
     print(f"\n📁 Archivos generados:")
@@ -7,12 +7,15 @@ Extracción mejorada con anti-detección, auto-detección de proxies y fingerpri
 """
 
 import os
+import sys
 import time
-import subprocess
 import requests
-from bs4 import BeautifulSoup
-from stem import Signal
-from stem.control import Controller
+from tor_fleet import TorFleet
+from rate_controller import RateController
+from http_cache import HttpCache
+from html_backend import profile_hrefs, print_parse_summary
+from block_detector import (checked_get, print_block_summary, BLOCK_CAPTCHA, BLOCK_RATE_LIMIT,
+                            BLOCK_SOFT, BLOCK_CONSENT, BLOCK_EMPTY)
 from datetime import datetime
 from urllib.parse import urlparse, parse_qs, urlunparse, urlencode
 import random
@@ -22,12 +25,13 @@ import concurrent.futures
 import threading
 
 # --- Configuración TOR ---
-TOR_EXE = r"C:\Tor Browser\Browser\TorBrowser\Tor\tor.exe"
+TOR_EXE = r"C:\Tor Browser\Browser\TorBrowser\Tor\tor.exe"  # Si no existe, se busca tor en PATH y rutas habituales
 TOR_CONTROL_PORT = 9051
 TOR_SOCKS_PORT = 9050
 CONTROL_PASSWORD = ""  # sin contraseña
-TORRC_FILE = os.path.join(os.getcwd(), "torrc_temp.txt")
+TOR_IDENTIDAD = "part1"  # Credenciales SOCKS propias: circuito aislado del resto de identidades
 PROXIES_FILE = "proxies.txt"
+MODO_OFFLINE = "--offline" in sys.argv  # Reanalizar las páginas del perfil guardadas en la caché HTTP, sin red
 
 # Variables globales para manejo de proxies y sesiones
 proxy_list = []
@@ -37,6 +41,9 @@ current_proxy_index = 0
 using_proxy = False
 tor_blocked = False
 session_cookies = {}
+tor_fleet = TorFleet(1, TOR_EXE, TOR_SOCKS_PORT, TOR_CONTROL_PORT, CONTROL_PASSWORD)
+scholar_rate = RateController(TOR_IDENTIDAD)  # Ritmo adaptativo de las peticiones a Scholar
+http_cache = HttpCache(offline=MODO_OFFLINE)  # Páginas del perfil guardadas (compartida con los pasos 2 y 3)
 
 # Lista de puertos prioritarios para auto-detección
 PUERTOS_PRIORITARIOS = [
@@ -121,16 +128,11 @@ class BrowserSimulator:
             self.current_profile = self.generate_profile()
     
     def simulate_human_pause(self):
-        """Simula pausas humanas variables"""
-        # Pausa base entre requests
-        base_delay = random.uniform(2, 6)
-        
-        # Ocasionalmente pausas más largas (simular lectura)
+        """Simula pausas de lectura ocasionales (el espaciado base lo impone scholar_rate)"""
         if random.random() < 0.08:  # 8% probabilidad
             base_delay = random.uniform(5, 12)
             print(f"   [HUMAN] Pausa de lectura: {base_delay:.1f}s")
-        
-        time.sleep(base_delay)
+            time.sleep(base_delay)
 
 class SessionManager:
     """Gestión simplificada de sesiones para Part1"""
@@ -340,10 +342,7 @@ def get_next_proxy():
 def setup_tor_session(browser_sim):
     """Configura sesión TOR con headers avanzados"""
     session = requests.Session()
-    session.proxies = {
-        'http': f'socks5h://127.0.0.1:{TOR_SOCKS_PORT}',
-        'https': f'socks5h://127.0.0.1:{TOR_SOCKS_PORT}'
-    }
+    session.proxies = tor_fleet.pool_for(TOR_IDENTIDAD).proxies(TOR_IDENTIDAD)
     # Headers se configurarán dinámicamente en cada request
     return session
 
@@ -382,39 +381,62 @@ def switch_proxy(browser_sim):
         print("[ERROR] No hay más proxies válidos")
         return False
 
-# Crear torrc temporal
-with open(TORRC_FILE, "w") as f:
-    f.write(f"SocksPort {TOR_SOCKS_PORT}\n")
-    f.write(f"ControlPort {TOR_CONTROL_PORT}\n")
-    f.write("CookieAuthentication 0\n")
-
 def start_tor():
+    """Arranca TOR supervisado; retorna cuando el bootstrap ha terminado (evento de stem, sin espera fija)"""
     print("[INFO] Iniciando servicio TOR...")
-    tor_process = subprocess.Popen([TOR_EXE, "-f", TORRC_FILE], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    time.sleep(8)  # Menos tiempo de espera para Part1
-    print("[INFO] TOR iniciado en puertos 9050/9051")
-    return tor_process
+    return tor_fleet.start()
 
 def renew_tor_ip():
+    """
+    Rota solo el circuito de esta identidad (cierra sus circuitos y cambia sus credenciales SOCKS)
+    y continúa en cuanto Tor tiene un circuito construido, en lugar de esperar 3s fijos
+    """
     try:
-        with Controller.from_port(port=TOR_CONTROL_PORT) as controller:
-            controller.authenticate(password=CONTROL_PASSWORD)
-            controller.signal(Signal.NEWNYM)
-        print("[INFO] IP renovada con TOR")
-        time.sleep(3)  # Menos tiempo de espera
+        pool = tor_fleet.pool_for(TOR_IDENTIDAD)
+        pool.rotate(TOR_IDENTIDAD, session)
+        waited = pool.wait_ready(replaced=3)
+        print(f"[INFO] IP renovada con TOR (circuito listo en {waited:.1f}s)")
     except Exception as e:
         print(f"[ERROR] No se pudo renovar la IP: {e}")
 
-def is_blocked(html):
-    """Detecta bloqueos de Google Scholar"""
-    markers = [
-        "id=\"gs_captcha_ccl\"",
-        "Please show you're not a robot", 
-        "detected unusual traffic",
-        "captcha",
-        "Unusual traffic"
-    ]
-    return any(marker.lower() in html.lower() for marker in markers)
+def profile_page_url(domain, user_id, start):
+    """URL de una página de 100 publicaciones del perfil"""
+    params = {
+        "user": user_id,
+        "hl": "en", 
+        "view_op": "list_works",
+        "cstart": start,
+        "pagesize": 100
+    }
+    return f"https://{domain}/citations?" + urlencode(params)
+
+def parse_profile_page(html, domain):
+    """Enlaces a las fichas de una página del perfil (lista vacía si no hay más resultados)"""
+    return [f"https://{domain}" + href for href in profile_hrefs(html)]
+
+def get_profile_links_offline(profile_url):
+    """--offline: recorre las páginas del perfil guardadas en la caché HTTP sin hacer peticiones"""
+    query_params = parse_qs(urlparse(profile_url).query)
+    if "user" not in query_params:
+        print("[ERROR] La URL no contiene el parámetro 'user'.")
+        return []
+    domain = urlparse(profile_url).netloc
+    all_links = []
+    start = 0
+    while True:
+        page = http_cache.lookup(profile_page_url(domain, query_params["user"][0], start))
+        if page is None:
+            print(f"[INFO] [OFFLINE] Sin copia de la página {start}-{start+99}; fin del reanálisis.")
+            break
+        prev_count = len(all_links)
+        for link in parse_profile_page(page.text, domain):
+            if link not in all_links:
+                all_links.append(link)
+        print(f"[INFO] [OFFLINE] Página {start}-{start+99}: acumulados {len(all_links)} enlaces")
+        if len(all_links) == prev_count:
+            break
+        start += 100
+    return all_links
 
 def get_profile_links(profile_url, browser_sim, session_mgr):
     """Extracción mejorada con anti-detección"""
@@ -443,14 +465,7 @@ def get_profile_links(profile_url, browser_sim, session_mgr):
         session.cookies.set(name, value, domain=domain)
 
     while attempts < max_attempts:
-        params = {
-            "user": user_id,
-            "hl": "en", 
-            "view_op": "list_works",
-            "cstart": start,
-            "pagesize": 100
-        }
-        url = f"https://{domain}/citations?" + urlencode(params)
+        url = profile_page_url(domain, user_id, start)
 
         connection_type = "PROXY" if using_proxy else "TOR"
         print(f"[INFO] [{connection_type}] Página {attempts+1}: {start}-{start+99}")
@@ -460,13 +475,18 @@ def get_profile_links(profile_url, browser_sim, session_mgr):
         
         # Obtener headers coherentes
         headers = browser_sim.get_headers(referer=f"https://{domain}/")
+        headers.update(http_cache.validators(url))
         
         try:
-            # Simular comportamiento humano antes del request
+            # Esperar turno según el ritmo aprendido y simular comportamiento humano
+            scholar_rate.acquire()
             if attempts > 0:  # No en la primera página
                 browser_sim.simulate_human_pause()
             
-            r = session.get(url, headers=headers, timeout=25)
+            # En streaming: una página de bloqueo se reconoce en los primeros KB y se corta
+            r = checked_get(session, url, headers=headers, timeout=25)
+            if r.status_code == 304:
+                r = http_cache.revalidated(url) or r
             
         except Exception as e:
             print(f"[ERROR] Excepción durante petición: {e}")
@@ -488,8 +508,33 @@ def get_profile_links(profile_url, browser_sim, session_mgr):
                     break
             continue
 
-        if r.status_code != 200:
+        if r.block == BLOCK_CONSENT:
+            # No es un bloqueo de IP: cookies de consentimiento nuevas y otro intento
+            print("[WARNING] Muro de consentimiento; se regeneran las cookies.")
+            session_mgr.cookies_store.pop(domain, None)
+            for name, value in session_mgr.get_realistic_cookies(domain).items():
+                session.cookies.set(name, value, domain=domain)
+            retry_count += 1
+            if retry_count >= max_retries_per_page:
+                print("[ERROR] Máximo número de reintentos alcanzado. Abortando.")
+                break
+            continue
+
+        if r.block in (BLOCK_SOFT, BLOCK_EMPTY):
+            # Aviso de tráfico inusual o página vacía: se reintenta con otra huella, sin gastar la IP
+            print(f"[WARNING] {r.describe()}; se reintenta con otro perfil.")
+            if r.block == BLOCK_SOFT:
+                scholar_rate.on_block()
+            retry_count += 1
+            if retry_count >= max_retries_per_page:
+                print("[ERROR] Máximo número de reintentos alcanzado. Abortando.")
+                break
+            continue
+
+        if r.status_code != 200 and r.block != BLOCK_CAPTCHA:
             print(f"[ERROR] Código HTTP: {r.status_code}")
+            if r.block == BLOCK_RATE_LIMIT:
+                scholar_rate.on_block(r.retry_after)
             retry_count += 1
             
             if retry_count >= max_retries_per_page:
@@ -508,8 +553,9 @@ def get_profile_links(profile_url, browser_sim, session_mgr):
                     break
             continue
 
-        if is_blocked(r.text):
-            print("[BLOQUEO] Bloqueo detectado.")
+        if r.block == BLOCK_CAPTCHA:
+            print("[BLOQUEO] Captcha detectado.")
+            scholar_rate.on_block()
             retry_count += 1
             
             if retry_count >= max_retries_per_page:
@@ -527,26 +573,23 @@ def get_profile_links(profile_url, browser_sim, session_mgr):
                     print("[ERROR] No se pudo cambiar de proxy. Abortando.")
                     break
             
-            time.sleep(random.uniform(5, 10))
             continue
 
         # Reset retry counter on successful request
         retry_count = 0
+        scholar_rate.on_success()
+        if not getattr(r, "from_cache", False):
+            http_cache.store_response(url, r)
 
-        soup = BeautifulSoup(r.text, "html.parser")
-        rows = soup.select("tr.gsc_a_tr")
-
-        if not rows:
+        page_links = parse_profile_page(r.text, domain)
+        if not page_links:
             print("[INFO] No hay más resultados. Fin de la paginación.")
             break
 
         prev_count = len(all_links)
-        for row in rows:
-            link_tag = row.select_one("a.gsc_a_at")
-            if link_tag and link_tag.get("href"):
-                full_link = f"https://{domain}" + link_tag["href"]
-                if full_link not in all_links:
-                    all_links.append(full_link)
+        for full_link in page_links:
+            if full_link not in all_links:
+                all_links.append(full_link)
 
         print(f"[INFO] Acumulados: {len(all_links)} enlaces")
 
@@ -590,15 +633,24 @@ if __name__ == "__main__":
     print("="*70)
     
     # Configurar proxies con auto-detección
-    proxies_available = load_and_setup_proxies()
-    if not proxies_available:
-        print("[WARNING] Funcionando solo con TOR (sin proxies de respaldo)")
+    if not MODO_OFFLINE:
+        proxies_available = load_and_setup_proxies()
+        if not proxies_available:
+            print("[WARNING] Funcionando solo con TOR (sin proxies de respaldo)")
     
     profile_url = input("\nURL del perfil de Google Scholar: ").strip()
     if "scholar.google" not in profile_url:
         print("[ERROR] URL no válida.")
         exit(1)
 
+    if MODO_OFFLINE:
+        links = get_profile_links_offline(profile_url)
+        save_links(links)
+        print(f"📊 Total enlaces reanalizados: {len(links)}")
+        http_cache.print_summary()
+        print_parse_summary()
+        sys.exit(0)
+
     print(f"\n[INFO] Perfil de navegador: {browser_sim.current_profile['browser_type']}")
     print(f"[INFO] Canvas fingerprint: {browser_sim.current_profile['canvas_fingerprint']}")
 
@@ -608,14 +660,13 @@ if __name__ == "__main__":
         save_links(links)
         print(f"\n🎉 Proceso completado exitosamente!")
         print(f"📊 Total enlaces extraídos: {len(links)}")
+        print(f"⏱️ Ritmo final con Scholar: {scholar_rate.describe()} ({scholar_rate.blocks} bloqueos)")
         print(f"🔒 Nivel de protección: Avanzado")
     finally:
+        http_cache.print_summary()
+        http_cache.close()
+        print_block_summary()
+        print_parse_summary()
+        tor_fleet.print_metrics()
         print("\n[INFO] Cerrando TOR...")
-        tor_process.terminate()
-        
-        # Limpiar archivos temporales
-        try:
-            os.remove(TORRC_FILE)
-            print("[INFO] Archivos temporales eliminados")
-        except:
-            pass
\ No newline at end of file
+        tor_process.terminate()
\ No newline at end of file
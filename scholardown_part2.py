@@ -1,31 +1,55 @@
 import os
-import subprocess
+import sys
 import time
 import random
-import json
 import hashlib
 import base64
+import queue
+import threading
 from datetime import datetime, timezone
 import requests
-from bs4 import BeautifulSoup
-from stem import Signal
-from stem.control import Controller
-from urllib.parse import urlparse, urljoin
+from urllib.parse import urlparse, urljoin, parse_qsl, urlencode
+from oa_index import OAIndex, extract_doi
+from tor_fleet import TorFleet
+from rate_controller import RateController
+from journal import Journal, STATUS_FOUND, STATUS_NOT_FOUND, STATUS_ERROR
+from citation_cache import CitationCache
+from http_cache import HttpCache
+from html_backend import citation_anchors, versions_anchors, set_parse_pool, print_parse_summary
+from parse_pool import ParsePool
+from block_detector import (checked_get, print_block_summary, BLOCK_CAPTCHA, BLOCK_RATE_LIMIT,
+                            BLOCK_SOFT, BLOCK_CONSENT, BLOCK_EMPTY)
 
 # Archivos
 INPUT_FILE = "papers.txt"
 OUTPUT_FILE = "papers2.txt"
-PROGRESS_FILE = "progress.json"
+CANDIDATES_FILE = "candidates.jsonl"  # Todos los candidatos de descarga por ficha (el paso 3 los usa de reserva)
+JOURNAL_FILE = "journal.jsonl"  # Diario de progreso por URL (reemplaza a progress.json)
+CACHE_FICHAS = "citation_cache.jsonl"  # Resultados por ficha (citation_for_view) entre ejecuciones
+CACHE_TTL_DIAS = 90             # Caducidad de una ficha con enlace
+CACHE_TTL_NEGATIVO_DIAS = 7     # Caducidad de una ficha sin enlace
+MODO_OFFLINE = "--offline" in sys.argv  # Reanalizar las fichas de la caché HTTP sin red ni TOR
+MODO_VERSIONES = "--versiones" in sys.argv  # Segundo paso: páginas "All N versions" de las fichas sin PDF
+PRESUPUESTO_VERSIONES = 100     # Peticiones máximas a Scholar del paso de versiones por ejecución
 PROXIES_FILE = "proxies.txt"
 
 # Configuración TOR
-TOR_EXE = r"C:\Tor Browser\Browser\TorBrowser\Tor\tor.exe"
+TOR_EXE = r"C:\Tor Browser\Browser\TorBrowser\Tor\tor.exe"  # Si no existe, se busca tor en PATH y rutas habituales
+TOR_INSTANCIAS = 2            # Procesos Tor supervisados (puertos 9050/9051, 9052/9053...)
 TOR_CONTROL_PORT = 9051
 TOR_SOCKS_PORT = 9050
 CONTROL_PASSWORD = ""
+TOR_PRINCIPAL = "principal"   # Identidad TOR del modo secuencial
 ROTATE_EVERY = 15
 MAX_RETRIES = 5
 
+# Rastreo en paralelo: cada identidad (salida de red + cookies + perfil de navegador) es un hilo
+MODO_PARALELO = True          # False = una URL cada vez con la sesión global (comportamiento original)
+ANALISIS_EN_PROCESOS = True   # En paralelo, analizar las fichas en un pool de procesos (parse_pool.py)
+MAX_IDENTIDADES = 8           # Identidades simultáneas (TOR + un proxy validado por identidad)
+IDENTIDADES_TOR = 4           # Identidades sobre el Tor local, cada una con su propio circuito
+MAX_BLOQUEOS_IDENTIDAD = 3    # Bloqueos seguidos sin recambio antes de retirar una identidad
+
 # Variables globales para manejo de proxies y sesiones
 proxy_list = []
 validated_proxies = []
@@ -36,6 +60,7 @@ tor_blocked = False
 session_cookies = {}
 canvas_fingerprint = None
 webgl_fingerprint = None
+tor_fleet = TorFleet(TOR_INSTANCIAS, TOR_EXE, TOR_SOCKS_PORT, TOR_CONTROL_PORT, CONTROL_PASSWORD)
 
 # Lista de puertos prioritarios para auto-detección
 PUERTOS_PRIORITARIOS = [
@@ -205,15 +230,19 @@ class AdvancedBrowserSimulator:
         }
         return platform_names.get(platform, 'Windows')
     
-    def simulate_human_behavior(self, session, url):
-        """Simula comportamiento humano antes de la request principal"""
+    def simulate_human_behavior(self, session, url, budget=None):
+        """
+        Simula comportamiento humano antes de la request principal.
+        budget: presupuesto de peticiones (VersionsPass); sus peticiones extra también lo gastan
+        y, agotado, se omiten.
+        """
         
         # 1. Ocasionalmente simular navegación previa
         if random.random() < 0.15:  # 15% de probabilidad
             print("   [HUMAN] Simulando navegación previa...")
             
             # Visitar página principal de Scholar ocasionalmente
-            if random.random() < 0.5:
+            if random.random() < 0.5 and (budget is None or budget.take_request()):
                 try:
                     scholar_main = "https://scholar.google.es/"
                     pre_headers = self.get_coherent_headers(scholar_main)
@@ -223,7 +252,7 @@ class AdvancedBrowserSimulator:
                     pass
         
         # 2. Simular errores humanos ocasionales
-        if random.random() < 0.08:  # 8% de probabilidad
+        if random.random() < 0.08 and (budget is None or budget.take_request()):  # 8% de probabilidad
             print("   [HUMAN] Simulando error humano (URL incorrecta)...")
             try:
                 # Simular typo en URL o click erróneo
@@ -686,13 +715,10 @@ def mark_proxy_success(proxy_ip):
                 proxy_data['fail_count'] = max(0, proxy_data['fail_count'] - 1)
             break
 
-def setup_tor_session():
-    """Configura la sesión para usar TOR"""
+def setup_tor_session(name=TOR_PRINCIPAL):
+    """Configura la sesión para usar TOR con las credenciales SOCKS (y el circuito) de la identidad"""
     session = requests.Session()
-    session.proxies = {
-        'http': f'socks5h://127.0.0.1:{TOR_SOCKS_PORT}',
-        'https': f'socks5h://127.0.0.1:{TOR_SOCKS_PORT}'
-    }
+    session.proxies = tor_fleet.pool_for(name).proxies(name)
     return session
 
 def setup_proxy_session(proxy_ip):
@@ -740,64 +766,59 @@ def switch_proxy():
         print("[ERROR] No hay más proxies válidos disponibles")
         return False
 
-# Crear torrc temporal
-TORRC_FILE = os.path.join(os.getcwd(), "torrc_temp.txt")
-with open(TORRC_FILE, "w") as f:
-    f.write(f"SocksPort {TOR_SOCKS_PORT}\n")
-    f.write(f"ControlPort {TOR_CONTROL_PORT}\n")
-    f.write("CookieAuthentication 0\n")
-
 def start_tor():
+    """Arranca la flota TOR supervisada; retorna cuando el bootstrap ha terminado (eventos de stem)"""
     print("[INFO] Iniciando TOR...")
-    tor_process = subprocess.Popen([TOR_EXE, "-f", TORRC_FILE], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    time.sleep(10)
-    print("[INFO] TOR activo en puertos 9050/9051")
-    return tor_process
+    return tor_fleet.start()
 
-def renew_tor_ip():
+def renew_tor_ip(name=TOR_PRINCIPAL, tor_session=None, replaced=0, escalate=False):
+    """
+    Rota solo el circuito de la identidad (cierra sus circuitos y cambia sus credenciales SOCKS)
+    y espera, solo en el hilo de esa identidad, a que Tor tenga un circuito construido.
+    replaced: espera fija que sustituye (para las métricas de tiempo muerto evitado)
+    escalate: pide además NEWNYM a la instancia, si Tor lo admite en ese momento
+    """
     try:
-        with Controller.from_port(port=TOR_CONTROL_PORT) as controller:
-            controller.authenticate(password=CONTROL_PASSWORD)
-            controller.signal(Signal.NEWNYM)
-        print("[INFO] IP renovada con TOR")
+        pool = tor_fleet.pool_for(name)
+        if escalate:
+            pool.newnym()
+        pool.rotate(name, tor_session if tor_session is not None else session)
+        waited = pool.wait_ready(replaced=replaced)
+        print(f"[INFO] IP renovada con TOR (circuito listo en {waited:.1f}s)")
     except Exception as e:
         print(f"[ERROR] No se pudo renovar la IP: {e}")
 
-def save_progress(processed_count, total_count, results):
-    """Guarda el progreso actual"""
-    progress_data = {
-        'processed': processed_count,
-        'total': total_count,
-        'timestamp': datetime.now().isoformat(),
-        'results_count': len(results)
-    }
-    
-    with open(PROGRESS_FILE, 'w', encoding='utf-8') as f:
-        json.dump(progress_data, f, indent=2)
+class ScholarFetchError(Exception):
+    """Fallaron todos los intentos sobre una ficha; queda como error en el diario y se reintenta al reanudar"""
+    pass
 
-def load_progress():
-    """Carga el progreso anterior si existe"""
-    try:
-        with open(PROGRESS_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return None
-
-def append_result(link):
-    """Añade un resultado inmediatamente al archivo de salida"""
-    with open(OUTPUT_FILE, "a", encoding="utf-8") as f:
-        f.write(link + "\n")
-
-def extract_links_from_scholar(url, browser_sim, session_mgr):
-    global using_proxy, tor_blocked, session
+def extract_links_from_scholar(url, browser_sim, session_mgr, identity=None, parse=None, budget=None):
+    """
+    Busca los candidatos de descarga en la ficha de Scholar (ver parse_citation_page).
+    Con identity (modo paralelo) se usan su sesión y su manejo de bloqueos en lugar de los globales.
+    parse: analizador de otra página de Scholar (p.ej. parse_versions_page).
+    budget: presupuesto de peticiones (VersionsPass); cada intento gasta una.
+    """
+    global using_proxy, tor_blocked
+    rate = identity.rate if identity else scholar_rate
+    last_error = None
     
     for attempt in range(MAX_RETRIES):
+        if identity and not identity.healthy:
+            return None
+        if budget and not budget.take_request():
+            raise ScholarFetchError("presupuesto agotado")
+        # handle_block puede sustituir la sesión global, por eso se lee en cada intento
+        session = identity.session if identity else globals()["session"]
         try:
-            connection_type = "PROXY" if using_proxy else "TOR"
+            connection_type = identity.label if identity else ("PROXY" if using_proxy else "TOR")
             print(f"   [{connection_type}] Intento {attempt + 1}/{MAX_RETRIES}")
             
+            # Esperar turno según el ritmo aprendido para esta identidad
+            rate.acquire()
+            
             # Simular comportamiento humano antes de la request
-            browser_sim.simulate_human_behavior(session, url)
+            browser_sim.simulate_human_behavior(session, url, budget)
             
             # Obtener headers coherentes
             headers = browser_sim.get_coherent_headers(url, referer="https://scholar.google.es/")
@@ -810,14 +831,20 @@ def extract_links_from_scholar(url, browser_sim, session_mgr):
             for name, value in cookies.items():
                 session.cookies.set(name, value, domain=domain)
             
-            # Realizar request
-            response = session.get(url, headers=headers, timeout=25)
+            # Realizar request en streaming (condicional si la copia guardada tiene ETag/Last-Modified);
+            # una página de bloqueo se reconoce en los primeros KB y se corta la transferencia
+            headers.update(http_cache.validators(url))
+            response = checked_get(session, url, headers=headers, timeout=25)
             
             # Actualizar cookies de sesión
             session_mgr.update_session_cookies(session, response)
+            if response.status_code == 304:
+                response = http_cache.revalidated(url) or response
             
             # Marcar proxy como exitoso si se usó
-            if using_proxy and hasattr(session, 'proxies'):
+            if identity:
+                identity.mark_proxy_success()
+            elif using_proxy and hasattr(session, 'proxies'):
                 current_proxy = None
                 for proxy_url in session.proxies.values():
                     if 'http://' in proxy_url:
@@ -826,41 +853,53 @@ def extract_links_from_scholar(url, browser_sim, session_mgr):
                 if current_proxy:
                     mark_proxy_success(current_proxy)
             
-            if response.status_code == 429:
-                print(f"[BLOQUEO] 429 detectado.")
-                handle_block(browser_sim)
+            if response.block in (BLOCK_RATE_LIMIT, BLOCK_CAPTCHA):
+                # IP quemada: bajar el ritmo (respetando Retry-After) y cambiar de salida
+                print(f"[BLOQUEO] {response.describe()} detectado.")
+                rate.on_block(response.retry_after)
+                last_error = response.describe()
+                if identity:
+                    identity.handle_block()
+                else:
+                    handle_block(browser_sim)
+                continue
+
+            if response.block == BLOCK_SOFT:
+                # Aviso de tráfico inusual sin captcha: bajar el ritmo y cambiar la huella, sin gastar la IP
+                print(f"[BLOQUEO] {response.describe()}: se reduce el ritmo y se rota el perfil.")
+                rate.on_block()
+                browser_sim.rotate_profile()
+                last_error = response.describe()
+                continue
+
+            if response.block == BLOCK_CONSENT:
+                # No es un bloqueo de IP: cookies de consentimiento nuevas en el siguiente intento
+                print("[WARNING] Muro de consentimiento; se regeneran las cookies.")
+                session_mgr.cookies_store.pop(domain, None)
+                last_error = response.describe()
                 continue
 
-            if "captcha" in response.text.lower() or "unusual traffic" in response.text.lower():
-                print("[BLOQUEO] Captcha/bloqueo detectado.")
-                handle_block(browser_sim)
+            if response.block == BLOCK_EMPTY:
+                print("[WARNING] Página vacía; se reintenta con otro perfil.")
+                browser_sim.rotate_profile()
+                last_error = response.describe()
                 continue
 
             if response.status_code != 200:
                 print(f"[ERROR] {url} - Código: {response.status_code}")
+                last_error = f"HTTP {response.status_code}"
                 time.sleep(random.uniform(3, 8))
                 continue
 
-            # Parsear respuesta
-            soup = BeautifulSoup(response.text, "html.parser")
-            title_wrapper = soup.find("div", id="gsc_oci_title_wrapper")
-
-            if title_wrapper:
-                # Buscar enlace PDF directo
-                for a_tag in title_wrapper.find_all("a", href=True):
-                    href = a_tag["href"]
-                    text = a_tag.get_text(strip=True)
-                    if "[PDF]" in text or href.lower().endswith(".pdf"):
-                        return href
-                    elif "Full View" in text or "view" in href:
-                        editorial_link = href
+            rate.on_success()
+            if not getattr(response, "from_cache", False):
+                http_cache.store_response(url, response)
 
-                return editorial_link if 'editorial_link' in locals() else None
-
-            return None
+            return (parse or parse_citation_page)(response.content, url)
 
         except requests.exceptions.RequestException as e:
             print(f"[ERROR] Excepción en intento {attempt+1}/{MAX_RETRIES}: {e}")
+            last_error = str(e)
             if attempt < MAX_RETRIES - 1:
                 # Rotar perfil en caso de error
                 browser_sim.rotate_profile()
@@ -868,10 +907,79 @@ def extract_links_from_scholar(url, browser_sim, session_mgr):
             continue
 
     print("[ERROR] Todos los intentos fallaron")
+    raise ScholarFetchError(last_error or "sin respuesta")
+
+# Orden de los candidatos de una ficha (menor = mejor)
+CANDIDATE_RANK = {"pdf": 0, "publisher": 1, "html": 2, "other": 3, "library": 4, "versions": 5}
+# Los únicos que cuentan como enlace encontrado; el resto solo sirve de reserva al paso 3
+PRIMARY_SOURCES = ("pdf", "publisher")
+
+def classify_candidate(href, text, side):
+    """Origen de un enlace de la ficha: PDF, editorial, copia HTML, biblioteca u otro"""
+    if "[PDF]" in text or href.lower().endswith(".pdf"):
+        return "pdf"
+    if side:
+        return "html" if "[HTML]" in text else "library"
+    if "Full View" in text or "view" in href:
+        return "publisher"
+    return "other"
+
+def rank_candidates(anchors, base_url=None):
+    """Enlaces (href, texto, lateral) descargables, sin repetir, como candidatos ordenados"""
+    candidates = []
+    seen = set()
+    for href, text, side in anchors or []:
+        if not href or href.startswith(("#", "javascript:")):
+            continue
+        url = urljoin(base_url, href) if base_url else href
+        if not url.startswith(("http://", "https://")) or "scholar.google" in urlparse(url).netloc or url in seen:
+            continue
+        seen.add(url)
+        candidates.append({"url": url, "source": classify_candidate(href, text, side)})
+    candidates.sort(key=lambda candidate: CANDIDATE_RANK[candidate["source"]])
+    return candidates
+
+def parse_citation_page(html, base_url=None):
+    """
+    Candidatos de descarga de una ficha de Scholar, del mejor al peor.
+    Retorna: lista de {"url", "source"}; el enlace "All N versions" va al final con source "versions"
+    """
+    anchors, cluster = citation_anchors(html)
+    candidates = rank_candidates(anchors, base_url)
+    if cluster and base_url:
+        candidates.append({"url": urljoin(base_url, cluster), "source": "versions"})
+    return candidates
+
+def parse_versions_page(html, base_url=None):
+    """Candidatos de descarga de la página "All N versions": enlaces de todas las versiones, del mejor al peor"""
+    return rank_candidates(versions_anchors(html), base_url)
+
+def merge_candidates(found, candidates):
+    """Suma a los candidatos de la ficha los de sus versiones, sin repetir y en el mismo orden"""
+    found_urls = {candidate["url"] for candidate in found}
+    merged = found + [candidate for candidate in candidates or [] if candidate["url"] not in found_urls]
+    merged.sort(key=lambda candidate: CANDIDATE_RANK[candidate["source"]])
+    return merged
+
+def primary_link(candidates):
+    """
+    Enlace para papers2.txt: el mejor PDF o, si no hay, la página de la editorial.
+    Con solo copias HTML, bibliotecas u otros enlaces la ficha queda sin enlace (not_found).
+    """
+    for candidate in candidates or []:
+        if candidate["source"] in PRIMARY_SOURCES:
+            return candidate["url"]
     return None
 
+def describe_result(link, candidates):
+    alternatives = sum(1 for candidate in candidates or [] if candidate["url"] != link)
+    return f"{link} (+{alternatives} candidatos)" if alternatives else link
+
 def handle_block(browser_sim):
-    """Maneja los bloqueos cambiando de TOR a proxies o entre proxies"""
+    """
+    Maneja los bloqueos cambiando de TOR a proxies o entre proxies.
+    La pausa tras el bloqueo la impone el control de ritmo (scholar_rate), no una espera fija.
+    """
     global using_proxy, tor_blocked
     
     # Rotar perfil de navegador en caso de bloqueo
@@ -881,12 +989,9 @@ def handle_block(browser_sim):
     if not using_proxy and not tor_blocked:
         print("[INFO] Primer bloqueo detectado. Cambiando de TOR a sistema de proxies...")
         tor_blocked = True
-        if switch_to_proxy():
-            time.sleep(random.uniform(8, 15))
-        else:
+        if not switch_to_proxy():
             print("[ERROR] No se pudo activar sistema de proxies. Intentando renovar TOR...")
-            renew_tor_ip()
-            time.sleep(15)
+            renew_tor_ip(replaced=15)
     elif using_proxy:
         if not switch_proxy():
             print("[ERROR] No hay más proxies. Volviendo a TOR...")
@@ -895,16 +1000,376 @@ def handle_block(browser_sim):
             global session
             session = setup_tor_session()
             renew_tor_ip()
-        time.sleep(random.uniform(8, 15))
     else:
-        renew_tor_ip()
-        time.sleep(15)
+        renew_tor_ip(replaced=15, escalate=True)
 
 # Inicializar sesión con TOR
 session = setup_tor_session()
+# Ritmo del modo secuencial (en paralelo cada identidad tiene el suyo)
+scholar_rate = RateController(TOR_PRINCIPAL)
+# Páginas de fichas guardadas (compartida con los pasos 1 y 3, ver http_cache.py). Se abre en
+# main() y no al importar: en Windows cada proceso del pool de análisis vuelve a importar este script
+http_cache = None
+
+# Proxies ocupados por alguna identidad del modo paralelo
+proxy_lock = threading.Lock()
+proxies_in_use = set()
+
+def acquire_free_proxy():
+    """Reserva el siguiente proxy validado que no usa ninguna otra identidad"""
+    with proxy_lock:
+        for _ in range(len(validated_proxies)):
+            proxy_ip = get_next_proxy()
+            if proxy_ip and proxy_ip not in proxies_in_use:
+                proxies_in_use.add(proxy_ip)
+                return proxy_ip
+    return None
+
+class CrawlIdentity:
+    """
+    Una identidad de rastreo: salida de red (TOR o un proxy), su propia sesión con
+    su jarra de cookies, su SessionManager y su perfil de navegador. Los bloqueos se
+    resuelven dentro de la identidad, sin tocar la sesión global ni a las demás.
+    """
+    def __init__(self, name, proxy_ip=None):
+        self.name = name
+        self.proxy_ip = proxy_ip
+        self.browser_sim = AdvancedBrowserSimulator()
+        self.session_mgr = SessionManager()
+        self.rate = RateController(name)
+        self.session = setup_proxy_session(proxy_ip) if proxy_ip else setup_tor_session(name)
+        self.healthy = True
+        self.consecutive_blocks = 0
+        self.processed = 0
+        self.found = 0
+        self.blocks = 0
+        self.start_time = time.time()
+
+    @property
+    def label(self):
+        return f"{self.name} PROXY {self.proxy_ip}" if self.proxy_ip else f"{self.name} TOR"
+
+    def mark_proxy_success(self):
+        if self.proxy_ip:
+            with proxy_lock:
+                mark_proxy_success(self.proxy_ip)
+
+    def follow_tor_instance(self):
+        """Si su instancia Tor cayó, la flota la reasigna a otra sana y la sesión la sigue"""
+        proxies = tor_fleet.pool_for(self.name).proxies(self.name)
+        if self.session.proxies != proxies:
+            self.session.proxies = proxies
+
+    def reset_identity(self):
+        """Cookies y perfil nuevos: tras cambiar de salida no se arrastra la identidad anterior"""
+        self.browser_sim.current_profile = self.browser_sim.generate_browser_profile()
+        self.session_mgr = SessionManager()
+
+    def handle_block(self):
+        """Bloqueo de esta identidad: cambia su salida y su huella; las demás siguen trabajando"""
+        self.blocks += 1
+        self.consecutive_blocks += 1
+        print(f"   [{self.label}] Bloqueo {self.consecutive_blocks}/{MAX_BLOQUEOS_IDENTIDAD}")
+
+        if self.proxy_ip:
+            with proxy_lock:
+                mark_proxy_failed(self.proxy_ip)
+            # El proxy bloqueado sigue reservado hasta tener otro, así no se vuelve a elegir
+            new_proxy = acquire_free_proxy()
+            if new_proxy:
+                with proxy_lock:
+                    proxies_in_use.discard(self.proxy_ip)
+                self.proxy_ip = new_proxy
+                self.session = setup_proxy_session(new_proxy)
+                self.consecutive_blocks = 0
+            elif self.consecutive_blocks >= MAX_BLOQUEOS_IDENTIDAD:
+                self.retire("sin proxies libres")
+                return
+        else:
+            if self.consecutive_blocks >= MAX_BLOQUEOS_IDENTIDAD:
+                self.retire("TOR bloqueado repetidamente")
+                return
+            # Si rotar su circuito no bastó, se pide también NEWNYM (solo cuando Tor lo admite)
+            renew_tor_ip(self.name, self.session, replaced=15, escalate=self.consecutive_blocks >= 2)
+            self.session = setup_tor_session(self.name)
+
+        # Sin espera fija: self.rate ya bajó el ritmo y respeta el Retry-After
+        self.reset_identity()
+
+    def retire(self, reason):
+        self.healthy = False
+        if self.proxy_ip:
+            with proxy_lock:
+                proxies_in_use.discard(self.proxy_ip)
+        print(f"   [{self.label}] Identidad retirada: {reason}")
+
+def versions_page_url(url):
+    """Página con todas las versiones del cluster (sin btnI, que salta directamente a la primera)"""
+    parsed = urlparse(url)
+    query = [(name, value) for name, value in parse_qsl(parsed.query) if name != "btnI"]
+    return parsed._replace(query=urlencode(query)).geturl()
+
+class VersionsPass:
+    """
+    Segundo paso (--versiones): para las fichas sin PDF se visita su página "All N versions",
+    que a menudo enlaza una copia libre en un repositorio. Tiene su propia cola, que solo se
+    atiende cuando la del primer paso está vacía, y su propio presupuesto de peticiones.
+    Una ficha ya visitada queda en el diario con source "versions" y no se repite.
+    """
+    def __init__(self, budget=PRESUPUESTO_VERSIONES):
+        self.tasks = queue.Queue()
+        self.budget = budget
+        self.lock = threading.Lock()
+        self.offered = set()
+        self.requests = 0
+        self.visited = 0
+        self.recovered = 0
+
+    def offer(self, url, candidates):
+        """Encola la ficha si no tiene candidato PDF pero sí enlace al cluster"""
+        sources = {candidate["source"] for candidate in candidates or []}
+        if "pdf" in sources or "versions" not in sources:
+            return
+        with self.lock:
+            if url in self.offered:
+                return
+            self.offered.add(url)
+        cluster = next(candidate["url"] for candidate in candidates if candidate["source"] == "versions")
+        self.tasks.put((url, versions_page_url(cluster), candidates))
+
+    def take_request(self):
+        with self.lock:
+            if self.requests >= self.budget:
+                return False
+            self.requests += 1
+            return True
+
+    @property
+    def exhausted(self):
+        with self.lock:
+            return self.requests >= self.budget
+
+    def record(self, recovered):
+        with self.lock:
+            self.visited += 1
+            if recovered:
+                self.recovered += 1
+
+    def print_summary(self):
+        if not self.offered:
+            return
+        per_request = self.recovered / self.requests if self.requests else 0.0
+        print(f"[INFO] Paso de versiones: {self.visited}/{len(self.offered)} fichas sin PDF visitadas, "
+              f"{self.requests}/{self.budget} peticiones, {self.recovered} PDFs recuperados "
+              f"({per_request:.2f} por petición)")
+        left = len(self.offered) - self.visited
+        if left:
+            print(f"[INFO] {left} fichas sin visitar quedan para la próxima ejecución con --versiones")
+
+class CrawlProgress:
+    """
+    Resultados compartidos por las identidades, anotados en el diario por URL:
+    el orden en que terminan no importa y reanudar salta las URLs ya hechas.
+    Lo obtenido de Scholar (sin source) se guarda además en la caché de fichas.
+    Con versions, las fichas sin PDF pasan a la cola del paso de versiones.
+    """
+    def __init__(self, journal, total, cache=None, versions=None):
+        self.journal = journal
+        self.total = total
+        self.cache = cache
+        self.versions = versions
+
+    def complete(self, url, link, source=None, candidates=None):
+        self.journal.record(url, STATUS_FOUND if link else STATUS_NOT_FOUND, link, source=source,
+                            candidates=candidates)
+        # Un PDF recuperado de las versiones también se guarda: otro perfil con la misma ficha no repite el cluster
+        if self.cache and (source is None or (source == "versions" and link)):
+            self.cache.store(url, link, candidates)
+        if self.versions and source != "versions":
+            self.versions.offer(url, candidates)
+
+    def fail(self, url, error):
+        self.journal.record(url, STATUS_ERROR, error=error)
+
+def build_identities():
+    """IDENTIDADES_TOR identidades sobre el Tor local más una por proxy validado, hasta MAX_IDENTIDADES"""
+    identities = [CrawlIdentity(f"ID{i + 1}") for i in range(min(IDENTIDADES_TOR, MAX_IDENTIDADES))]
+    while len(identities) < MAX_IDENTIDADES:
+        proxy_ip = acquire_free_proxy()
+        if not proxy_ip:
+            break
+        identities.append(CrawlIdentity(f"ID{len(identities) + 1}", proxy_ip))
+    return identities
+
+def visit_versions(task, versions, progress, browser_sim, session_mgr, identity=None):
+    """Busca un PDF en la página de versiones de una ficha; None si la identidad cayó a mitad"""
+    url, cluster_url, candidates = task
+    label = f" [{identity.label}]" if identity else ""
+    print(f"[VERSIONES]{label} {cluster_url}")
+    try:
+        found = extract_links_from_scholar(cluster_url, browser_sim, session_mgr, identity,
+                                           parse=parse_versions_page, budget=versions)
+    except ScholarFetchError as e:
+        # Sin anotar en el diario: la próxima ejecución con --versiones la vuelve a intentar
+        print(f"   -> Sin respuesta ({e}); se reintentará en la próxima ejecución")
+        return False
+    if found is None:
+        return None
+    recovered = any(candidate["source"] == "pdf" for candidate in found)
+    versions.record(recovered)
+    merged = merge_candidates(found, candidates)
+    link = primary_link(merged)
+    print(f"   -> PDF recuperado: {link}" if recovered else "   -> Sin PDF en las versiones")
+    progress.complete(url, link, source="versions", candidates=merged)
+    return recovered
+
+def visit_next_version(identity, versions, progress):
+    """Atiende una ficha de la cola de versiones; False si no queda trabajo o presupuesto"""
+    if versions.exhausted:
+        return False
+    try:
+        task = versions.tasks.get_nowait()
+    except queue.Empty:
+        return False
+    if not identity.proxy_ip:
+        identity.follow_tor_instance()
+    if visit_versions(task, versions, progress, identity.browser_sim, identity.session_mgr, identity) is None:
+        versions.tasks.put(task)  # Otra identidad la reintentará
+    return True
+
+def identity_worker(identity, tasks, progress, versions=None):
+    """
+    Hilo de una identidad: toma URLs de la cola compartida hasta vaciarla o ser retirada.
+    Con la cola vacía atiende la de versiones, mirando antes cada vez si el primer paso tiene trabajo.
+    """
+    while identity.healthy:
+        try:
+            idx, url = tasks.get_nowait()
+        except queue.Empty:
+            if versions and visit_next_version(identity, versions, progress):
+                continue
+            return
+        print(f"[{idx+1}/{progress.total}] [{identity.label}] {url}")
+        if not identity.proxy_ip:
+            identity.follow_tor_instance()
+        error = candidates = None
+        try:
+            candidates = extract_links_from_scholar(url, identity.browser_sim, identity.session_mgr, identity)
+        except ScholarFetchError as e:
+            error = str(e)
+        link = primary_link(candidates)
+        if not identity.healthy and not link:
+            # La identidad cayó a mitad de la URL: otra la reintentará
+            tasks.put((idx, url))
+            return
+        identity.processed += 1
+        if link:
+            identity.found += 1
+            identity.consecutive_blocks = 0
+            print(f"   -> {describe_result(link, candidates)}")
+        elif error:
+            print(f"   -> Sin respuesta ({error}); se reintentará al reanudar")
+        else:
+            print("   -> No se encontró enlace")
+        if error:
+            progress.fail(url, error)
+        else:
+            progress.complete(url, link, candidates=candidates)
+
+        # Rotación periódica de la identidad TOR
+        if not identity.proxy_ip and identity.processed % ROTATE_EVERY == 0:
+            print(f"[INFO] [{identity.label}] Rotación periódica de IP con TOR")
+            renew_tor_ip(identity.name, identity.session, replaced=10)
+        # Rotar perfil ocasionalmente
+        if identity.processed % 25 == 0:
+            identity.browser_sim.rotate_profile()
+
+def crawl_parallel(pending, progress, versions=None):
+    """Reparte las URLs pendientes entre las identidades sanas; retorna True si se procesaron todas"""
+    identities = build_identities()
+    print(f"[INFO] Rastreo en paralelo con {len(identities)} identidades: "
+          + ", ".join(identity.label for identity in identities))
+
+    tasks = queue.Queue()
+    for item in pending:
+        tasks.put(item)
+    threads = [threading.Thread(target=identity_worker, args=(identity, tasks, progress, versions), daemon=True)
+               for identity in identities]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    finished = tasks.empty()
+    if not finished:
+        print(f"[WARNING] Todas las identidades retiradas; {tasks.qsize()} URLs quedan para la próxima ejecución")
+
+    print("\n[IDENTIDADES] procesadas / encontradas / bloqueos / fichas por hora / ritmo final")
+    for identity in identities:
+        hours = max(time.time() - identity.start_time, 1) / 3600
+        status = "" if identity.healthy else " (retirada)"
+        print(f"   {identity.label:<32} {identity.processed:>5} / {identity.found:>5} / "
+              f"{identity.blocks:>3} / {identity.processed / hours:>6.0f} / {identity.rate.describe()}{status}")
+    return finished
+
+def load_input_urls():
+    """URLs de papers.txt y, para las líneas que traen un DOI, ese DOI"""
+    with open(INPUT_FILE, "r", encoding="utf-8") as f:
+        urls = []
+        line_dois = {}
+        for line in f:
+            line = line.strip()
+            if ": http" in line:
+                parts = line.split(": ", 1)
+                if len(parts) == 2 and parts[1].startswith("http"):
+                    urls.append(parts[1])
+                    # Si la línea trae un DOI se puede resolver sin consultar Scholar
+                    doi = extract_doi(parts[1])
+                    if doi:
+                        line_dois[parts[1]] = doi
+    return urls, line_dois
+
+def reparse_offline():
+    """--offline: vuelve a extraer los enlaces de las fichas guardadas en la caché HTTP, sin red ni TOR"""
+    urls, _ = load_input_urls()
+    journal = Journal(JOURNAL_FILE)
+    progress = CrawlProgress(journal, len(urls))
+    reparsed = found = 0
+    for idx, url in enumerate(urls):
+        page = http_cache.lookup(url)
+        if page is None:
+            continue
+        candidates = parse_citation_page(page.content, url)
+        # Ficha sin PDF cuyo cluster ya visitó el paso de versiones: también se reanaliza esa página
+        sources = {candidate["source"] for candidate in candidates}
+        clusters = [candidate["url"] for candidate in candidates if candidate["source"] == "versions"]
+        versions_page = None
+        if clusters and "pdf" not in sources:
+            versions_page = http_cache.lookup(versions_page_url(clusters[0]))
+        if versions_page is not None:
+            candidates = merge_candidates(parse_versions_page(versions_page.content, url), candidates)
+        link = primary_link(candidates)
+        progress.complete(url, link, source="offline", candidates=candidates)
+        reparsed += 1
+        if link:
+            found += 1
+        print(f"[{idx+1}/{len(urls)}] [OFFLINE] {url} -> {describe_result(link, candidates) if link else 'sin enlace'}")
+    total_links = journal.export_links(urls, OUTPUT_FILE)
+    journal.export_candidates(urls, CANDIDATES_FILE)
+    journal.close()
+    print(f"[INFO] Reanálisis offline: {reparsed} fichas guardadas ({found} con enlace), "
+          f"{len(urls) - reparsed} sin copia en caché")
+    print(f"[INFO] {total_links} enlaces guardados en {OUTPUT_FILE}")
+    http_cache.print_summary()
+    print_parse_summary()
 
 def main():
-    global session
+    global session, http_cache
+    
+    http_cache = HttpCache(offline=MODO_OFFLINE)
+    if MODO_OFFLINE:
+        reparse_offline()
+        return
     
     # Cargar y validar proxies
     if not load_and_validate_proxies():
@@ -918,86 +1383,129 @@ def main():
     
     tor_process = start_tor()
     
+    # Índice local DOI -> PDF de acceso abierto (opcional, ver oa_index.py)
+    oa_index = OAIndex.open_if_exists()
+
     # Cargar URLs
-    with open(INPUT_FILE, "r", encoding="utf-8") as f:
-        urls = []
-        for line in f:
-            line = line.strip()
-            if ": http" in line:
-                parts = line.split(": ", 1)
-                if len(parts) == 2 and parts[1].startswith("http"):
-                    urls.append(parts[1])
+    urls, line_dois = load_input_urls()
 
     print(f"[INFO] Total: {len(urls)} URLs a procesar")
     
-    # Verificar progreso anterior
-    progress = load_progress()
-    start_index = 0
-    result_links = []
-    
-    if progress:
-        start_index = progress['processed']
-        print(f"[INFO] Reanudando desde URL {start_index + 1}")
-        
-        # Cargar resultados existentes
-        try:
-            with open(OUTPUT_FILE, "r", encoding="utf-8") as f:
-                result_links = [line.strip() for line in f if line.strip()]
-        except FileNotFoundError:
-            pass
-    else:
-        # Crear archivo de salida vacío
-        with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
-            f.write("")  # Archivo vacío para empezar
+    # Reanudación por conjunto: se saltan las URLs que el diario ya da por hechas
+    journal = Journal(JOURNAL_FILE)
+    citation_cache = CitationCache(CACHE_FICHAS, CACHE_TTL_DIAS, CACHE_TTL_NEGATIVO_DIAS)
+    versions = VersionsPass() if MODO_VERSIONES else None
+    progress = CrawlProgress(journal, len(urls), citation_cache, versions)
+    if versions:
+        # Fichas sin PDF de ejecuciones anteriores cuyo cluster aún no se ha visitado
+        for url in urls:
+            entry = journal.entries.get(url)
+            if journal.is_done(url) and entry.get("source") != "versions":
+                versions.offer(url, entry.get("candidates"))
+        print(f"[INFO] Paso de versiones activo (hasta {versions.budget} peticiones); "
+              f"{len(versions.offered)} fichas sin PDF de ejecuciones anteriores en cola")
+    pending = [(idx, url) for idx, url in enumerate(urls) if not journal.is_done(url)]
+    if len(pending) < len(urls):
+        print(f"[INFO] Reanudando: {len(urls) - len(pending)} URLs ya procesadas según {JOURNAL_FILE}, "
+              f"{len(pending)} pendientes")
 
-    for idx in range(start_index, len(urls)):
-        url = urls[idx]
-        connection_type = "PROXY" if using_proxy else "TOR"
-        print(f"[{idx+1}/{len(urls)}] [{connection_type}] {url}")
-        
-        link = extract_links_from_scholar(url, browser_sim, session_mgr)
-        if link:
-            result_links.append(link)
-            append_result(link)  # Guardar inmediatamente
-            print(f"   -> {link}")
+    # Fichas ya consultadas en otra ejecución (y sin caducar): se saltan por completo
+    uncached = []
+    for idx, url in pending:
+        hit, link, candidates = citation_cache.lookup(url)
+        if hit:
+            print(f"[{idx+1}/{len(urls)}] [CACHÉ] {url} -> {link or 'sin enlace'}")
+            progress.complete(url, link, source="cache", candidates=candidates)
         else:
-            print("   -> No se encontró enlace")
+            uncached.append((idx, url))
+    pending = uncached
+
+    if MODO_PARALELO:
+        scholar_pending = []
+        for idx, url in pending:
+            # Primer paso: índice OA local, sin gastar una petición a Scholar
+            oa_link = oa_index.lookup(line_dois.get(url)) if oa_index else None
+            if oa_link:
+                print(f"[{idx+1}/{len(urls)}] [OA] {url}")
+                print(f"   -> [OA] {oa_link}")
+                progress.complete(url, oa_link, source="oa")
+            else:
+                scholar_pending.append((idx, url))
+        # Las fichas se analizan en otros procesos, sin frenar a las identidades que descargan
+        parse_pool = ParsePool() if ANALISIS_EN_PROCESOS and (scholar_pending or versions and versions.offered) else None
+        set_parse_pool(parse_pool)
+        crawl_parallel(scholar_pending, progress, versions)
+        if parse_pool:
+            set_parse_pool(None)
+            parse_pool.print_summary()
+            parse_pool.close()
+    else:
+        for count, (idx, url) in enumerate(pending, 1):
+            connection_type = "PROXY" if using_proxy else "TOR"
+            print(f"[{idx+1}/{len(urls)}] [{connection_type}] {url}")
 
-        # Guardar progreso
-        save_progress(idx + 1, len(urls), result_links)
+            # Primer paso: índice OA local, sin gastar una petición a Scholar
+            oa_link = oa_index.lookup(line_dois.get(url)) if oa_index else None
+            if oa_link:
+                print(f"   -> [OA] {oa_link}")
+                progress.complete(url, oa_link, source="oa")
+                continue
 
-        # Rotación periódica solo si estamos usando TOR y no está bloqueado
-        if (idx + 1) % ROTATE_EVERY == 0 and not using_proxy and not tor_blocked:
-            print("[INFO] Rotación periódica de IP con TOR")
-            renew_tor_ip()
-            time.sleep(random.uniform(8, 12))
+            try:
+                candidates = extract_links_from_scholar(url, browser_sim, session_mgr)
+            except ScholarFetchError as e:
+                print(f"   -> Sin respuesta ({e}); se reintentará al reanudar")
+                progress.fail(url, str(e))
+            else:
+                link = primary_link(candidates)
+                if link:
+                    print(f"   -> {describe_result(link, candidates)}")
+                else:
+                    print("   -> No se encontró enlace")
+                progress.complete(url, link, candidates=candidates)
 
-        # Rotar perfil ocasionalmente
-        if (idx + 1) % 25 == 0:
-            browser_sim.rotate_profile()
-            print(f"[FINGERPRINT] Nuevo perfil: {browser_sim.current_profile['browser_type']} - {browser_sim.current_profile['screen_resolution']}")
+            # Rotación periódica solo si estamos usando TOR y no está bloqueado
+            if count % ROTATE_EVERY == 0 and not using_proxy and not tor_blocked:
+                print("[INFO] Rotación periódica de IP con TOR")
+                renew_tor_ip(replaced=10)
 
-        # Pausa entre requests con comportamiento más humano
-        base_delay = random.uniform(1, 5)
-        
-        # Pausas ocasionales más largas
-        if random.random() < 0.1:  # 10% de probabilidad
-            base_delay = random.uniform(5, 12)
-            print(f"   [HUMAN] Pausa larga: {base_delay:.1f}s")
-        
-        time.sleep(base_delay)
+            # Rotar perfil ocasionalmente
+            if count % 25 == 0:
+                browser_sim.rotate_profile()
+                print(f"[FINGERPRINT] Nuevo perfil: {browser_sim.current_profile['browser_type']} - {browser_sim.current_profile['screen_resolution']}")
 
-    print(f"[INFO] Proceso completado. {len(result_links)} enlaces guardados en {OUTPUT_FILE}")
+        # Paso de versiones: solo cuando el primer paso ha terminado
+        while versions and not versions.exhausted:
+            try:
+                task = versions.tasks.get_nowait()
+            except queue.Empty:
+                break
+            visit_versions(task, versions, progress, browser_sim, session_mgr)
+        print(f"[INFO] Ritmo final: {scholar_rate.describe()}")
+
+    # papers2.txt se genera de una vez desde el diario, en el orden de papers.txt
+    found = journal.export_links(urls, OUTPUT_FILE)
+    with_candidates = journal.export_candidates(urls, CANDIDATES_FILE)
+    remaining = len(journal.pending(urls))
+    journal.close()
+    citation_cache.print_summary()
+    citation_cache.close()
+    http_cache.print_summary()
+    http_cache.close()
+    print_block_summary()
+    print_parse_summary()
+    if versions:
+        versions.print_summary()
+    print(f"[INFO] Proceso completado. {found} enlaces guardados en {OUTPUT_FILE}")
+    print(f"[INFO] Candidatos de {with_candidates} fichas guardados en {CANDIDATES_FILE}")
+    if remaining:
+        print(f"[INFO] {remaining} URLs con error o sin procesar se reintentarán en la próxima ejecución ({JOURNAL_FILE})")
+    if oa_index:
+        print(f"[INFO] Resueltos con el índice OA: {oa_index.hits} (peticiones a Scholar evitadas)")
     
-    # Limpiar archivos temporales
+    tor_fleet.print_metrics()
+
     tor_process.terminate()
-    
-    try:
-        os.remove(TORRC_FILE)
-        os.remove(PROGRESS_FILE)
-        print("[INFO] Archivos temporales eliminados")
-    except:
-        pass
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
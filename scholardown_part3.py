@@ -1,78 +1,1068 @@
 import os
+import sys
+import time
+import json
+import hashlib
+import math
+import itertools
+import re
+import html as html_lib
+import threading
+import concurrent.futures
+from collections import deque
 import requests
-from bs4 import BeautifulSoup
-from urllib.parse import urljoin
+from requests.adapters import HTTPAdapter
+from urllib.parse import urljoin, urlparse
+from pdf_store import PdfStore, hash_file
+from url_rules import UrlRewriter
+from oa_index import OAIndex, extract_doi
+from host_scheduler import HostScheduler, parse_retry_after
+from pdf_verify import check_pdf_head, verify_file, verify_folder
+from http_cache import HttpCache
+from html_backend import find_pdf_links, set_parse_pool, print_parse_summary
+from parse_pool import ParsePool
 
 # Archivo con enlaces
 INPUT_FILE = "papers2.txt"
+# Candidatos alternativos por ficha escritos por el paso 2 (opcional)
+CANDIDATES_FILE = "candidates.jsonl"
 # Carpeta de destino
 OUTPUT_DIR = "pdf"
 
+# Configuración de descarga concurrente
+MODO_CONCURRENTE = True       # False = descarga secuencial (comportamiento original)
+MAX_WORKERS = 8               # Hilos del pool de descarga
+MAX_DESCARGAS_GLOBALES = 8    # Conexiones simultáneas en total
+MAX_DESCARGAS_POR_HOST = 2    # Conexiones simultáneas contra un mismo host
+ANALISIS_EN_PROCESOS = True   # Analizar las páginas de aterrizaje en un pool de procesos (parse_pool.py)
+TIMEOUT = 15
+CHUNK_SIZE = 8192
+MAX_REINTENTOS_DESCARGA = 3   # Reintentos reanudando desde el .part
+PART_META_EVERY = 1048576     # Cada cuántos bytes se actualiza el sidecar .part.json
+SNIFF_BYTES = 1024            # Bytes iniciales usados para distinguir PDF de HTML
+MAX_HTML_BYTES = 5242880      # Tamaño máximo de una página HTML que se analiza
+HEAD_SCAN_BYTES = 65536       # Bytes máximos leídos buscando el PDF en <head>
+
+# Metadatos que declaran directamente la URL del PDF (Highwire/Google Scholar y variantes)
+PDF_META_NAMES = {
+    "citation_pdf_url",
+    "bepress_citation_pdf_url",
+    "wkhealth_pdf_url",
+    "eprints.document_url",
+}
+# Metadatos og:/Dublin Core que se aceptan solo si su valor parece un PDF
+PDF_META_HINT_PREFIXES = ("og:", "dc.", "dcterms.", "citation_")
+# Ranking y carrera de candidatos
+RACE_TOP_K = 3                # Candidatos sondeados en paralelo por tanda
+HEAD_SOURCE = "<head>"        # Marca de los candidatos declarados en <head>
+KNOWN_PDF_PATTERNS = [re.compile(p, re.IGNORECASE) for p in (
+    r"/doi/pdf/", r"/doi/pdfdirect/", r"/content/pdf/", r"/pdfft\b", r"/articlepdf/",
+    r"/bitstream/", r"arxiv\.org/pdf/", r"/pmc/articles/PMC\d+/pdf/", r"/track/pdf/",
+    r"/download/\d+/\d+", r"/stamp/stamp\.jsp",
+)]
+NON_PDF_EXTENSIONS = (".ris", ".bib", ".enw", ".nbib", ".xml", ".txt", ".doc", ".docx", ".zip", ".xls", ".xlsx")
+NON_PDF_WORDS = ("citation", "bibtex", "endnote", "refworks", "export", "supplement",
+                 "mendeley", "zotero", "figure", "powerpoint", "permissions")
+
+HEAD_END_RE = re.compile(rb"</head\s*>|<body[\s>]", re.IGNORECASE)
+HEAD_TAG_RE = re.compile(r"<(?:meta|link)\b[^>]*>", re.IGNORECASE)
+ATTR_RE = re.compile(r"""([\w:.-]+)\s*=\s*("[^"]*"|'[^']*'|[^\s>]+)""")
+USER_AGENT = "Mozilla/5.0"
+
+# Cortesía por host
+MIN_ESPACIADO_HOST = 1.0      # Segundos mínimos entre peticiones a un mismo host
+RESPETAR_CRAWL_DELAY = True   # Leer robots.txt de cada host y respetar su Crawl-delay
+ESTADO_CADA = 30              # Cada cuántos segundos se muestra la cola por host
+
+# Detección de descargas atascadas
+MIN_VELOCIDAD = 2048          # Bytes/s mínimos exigidos dentro de la ventana deslizante
+VENTANA_VELOCIDAD = 30        # Segundos de la ventana sobre la que se mide la velocidad
+PLAZO_BASE = 60               # Plazo máximo de una descarga, más PLAZO_POR_MB por cada MB anunciado
+PLAZO_POR_MB = 30
+PLAZO_SIN_LONGITUD = 900      # Plazo máximo si el servidor no envía Content-Length
+MAX_REENCOLADOS = 2           # Veces que una URL atascada vuelve a la cola
+# Salidas de red alternativas para reencolar una URL atascada (None = conexión directa).
+# Ej.: [None, "socks5h://127.0.0.1:9050"] (los proxies SOCKS requieren requests[socks])
+EGRESS_DESCARGA = [None]
+
+# Descarga segmentada de archivos grandes (tesis, libros)
+SEGMENTADA_MIN_BYTES = 20971520   # Tamaño a partir del cual se divide en varias conexiones
+MAX_SEGMENTOS = 6                 # Conexiones simultáneas máximas para un mismo archivo
+BYTES_POR_SEGMENTO = 8388608      # Tamaño mínimo de cada segmento
+MEDICION_BYTES = 1048576          # Bytes leídos por la primera conexión para medir su velocidad
+VELOCIDAD_OBJETIVO = 10485760     # Bytes/s agregados que se intentan alcanzar (velocidad del enlace)
+
+# Verificación de integridad
+VERIFICAR_CARPETA = True      # Verificar pdf/ al inicio y poner en cuarentena los PDFs dañados
+
+# Caché HTTP de páginas de aterrizaje (compartida con los pasos 1 y 2, ver http_cache.py)
+MODO_OFFLINE = "--offline" in sys.argv  # Buscar el PDF en las páginas guardadas, sin red ni descargas
+
 # Crear la carpeta de destino si no existe
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
+class RestartDownload(Exception):
+    """El .part guardado ya no sirve y la descarga debe empezar de cero"""
+
+class InvalidPdf(Exception):
+    """El contenido no es un PDF válido (HTML disfrazado, truncado...); no se reintenta"""
+
+class RetryLater(Exception):
+    """El servidor pidió esperar (429/503 con Retry-After); el planificador ya aplazó el host"""
+
+class DownloadStalled(Exception):
+    """La transferencia no alcanza la velocidad mínima o supera su plazo; la URL se reencola"""
+
+class ThroughputGuard:
+    """
+    Vigila una transferencia: velocidad mínima sobre una ventana deslizante y un plazo
+    total proporcional al Content-Length. El timeout de requests solo limita el tiempo
+    entre bytes, así que un servidor que envía 1 KB cada 14 s nunca lo dispararía.
+    """
+    def __init__(self, expected_bytes=None):
+        self.start = time.monotonic()
+        if expected_bytes is None:
+            self.deadline = self.start + PLAZO_SIN_LONGITUD
+        else:
+            self.deadline = self.start + PLAZO_BASE + PLAZO_POR_MB * expected_bytes / 1048576
+        self.received = 0
+        self.samples = deque([(self.start, 0)])
+
+    def update(self, count):
+        now = time.monotonic()
+        self.received += count
+        self.samples.append((now, self.received))
+        # Conservar una muestra anterior al inicio de la ventana para medir la ventana completa
+        while len(self.samples) > 2 and self.samples[1][0] <= now - VENTANA_VELOCIDAD:
+            self.samples.popleft()
+        if now > self.deadline:
+            raise DownloadStalled(f"plazo de {self.deadline - self.start:.0f}s superado "
+                                  f"({self.received / 1024:.0f} KB recibidos)")
+        since, base = self.samples[0]
+        if now - since >= VENTANA_VELOCIDAD:
+            speed = (self.received - base) / (now - since)
+            if speed < MIN_VELOCIDAD:
+                raise DownloadStalled(f"{speed:.0f} B/s durante {now - since:.0f}s "
+                                      f"(mínimo {MIN_VELOCIDAD} B/s)")
+
+# Sesión propia de cada hilo (requests.Session no es seguro entre hilos)
+_thread_local = threading.local()
+
+class DownloadStats:
+    """Estadísticas de la descarga, compartidas entre hilos"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.start_time = time.time()
+        self.downloaded = 0
+        self.failed = 0
+        self.bytes = 0
+        self.failed_urls = []
+        self.head_hits = 0
+        self.oa_hits = 0
+        self.invalid = 0
+        self.stalled = 0
+        self.stall_reasons = []
+        self.alternative_hits = 0
+
+    def record_stall(self, url, reason):
+        with self.lock:
+            self.stalled += 1
+            self.stall_reasons.append((url, reason))
+
+    def record_invalid(self):
+        with self.lock:
+            self.invalid += 1
+
+    def record_oa_hit(self):
+        with self.lock:
+            self.oa_hits += 1
+
+    def record_head_hit(self):
+        with self.lock:
+            self.head_hits += 1
+
+    def record_alternative_hit(self):
+        with self.lock:
+            self.alternative_hits += 1
+
+    def add_bytes(self, count):
+        with self.lock:
+            self.bytes += count
+
+    def record(self, url, ok):
+        with self.lock:
+            if ok:
+                self.downloaded += 1
+            else:
+                self.failed += 1
+                self.failed_urls.append(url)
+
+    def print_summary(self):
+        elapsed = max(time.time() - self.start_time, 0.001)
+        total = self.downloaded + self.failed
+        print("\n" + "="*60)
+        print("📊 RESUMEN DE DESCARGA")
+        print("="*60)
+        print(f"URLs procesadas:   {total}")
+        print(f"✅ Descargados:     {self.downloaded}")
+        print(f"❌ Fallidos:        {self.failed}")
+        print(f"♻️  Duplicados:      {store.dedup_hits}")
+        print(f"🚫 PDFs inválidos:  {self.invalid}")
+        print(f"🐢 Atascos:         {self.stalled}")
+        print(f"⚡ PDF en <head>:   {self.head_hits}")
+        print(f"📚 Índice OA:       {self.oa_hits}")
+        print(f"↪️  Alternativas:    {self.alternative_hits}")
+        print(f"💾 Datos:           {self.bytes / 1048576:.1f} MB")
+        print(f"⏱️  Tiempo total:    {elapsed:.1f}s")
+        print(f"⚡ Velocidad media: {self.bytes / elapsed / 1024:.1f} KB/s")
+        if self.failed_urls and len(self.failed_urls) <= 10:
+            print("\nURLs sin PDF:")
+            for url in self.failed_urls:
+                print(f"  • {url}")
+        if self.stall_reasons:
+            print("\nDescargas atascadas:")
+            for url, reason in self.stall_reasons[:10]:
+                print(f"  • {url}: {reason}")
+        print("="*60)
+
+def fetch_robots(robots_url):
+    """Descarga un robots.txt (fuera del planificador); None si no existe"""
+    try:
+        response = get_session().get(robots_url, timeout=TIMEOUT)
+        return response.text if response.status_code == 200 else None
+    except Exception:
+        return None
+
+def check_retry_after(url, response):
+    """Si el servidor pide esperar, aplaza el host en el planificador y lanza RetryLater"""
+    if response.status_code in (429, 503):
+        delay = parse_retry_after(response.headers.get("Retry-After"))
+        if delay is not None:
+            scheduler.penalize(url, delay)
+            raise RetryLater(f"HTTP {response.status_code}, Retry-After {delay:.0f}s")
+
+# Estado de la ejecución, creado por setup_runtime() al empezar main() y no al importar:
+# en Windows cada proceso de los pools (análisis, verificación) vuelve a importar este script
+scheduler = None
+probe_executor = None
+segment_executor = None
+stats = None
+store = None
+rewriter = None
+oa_index = None
+http_cache = None
+alternatives = {}  # enlace de papers2.txt -> [(url, origen)] de los demás candidatos de su ficha
+
+def get_session():
+    """Devuelve la sesión HTTP del hilo actual, con pool de conexiones reutilizables"""
+    session = getattr(_thread_local, "session", None)
+    if session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=MAX_DESCARGAS_GLOBALES, pool_maxsize=MAX_DESCARGAS_POR_HOST)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        session.headers.update({"User-Agent": USER_AGENT})
+        _thread_local.session = session
+    return session
+
 def is_pdf(content_type: str) -> bool:
     """Verifica si el contenido es PDF según el header."""
     return "application/pdf" in content_type.lower()
 
-def download_file(url: str, dest_folder: str):
-    """Descarga un archivo desde una URL y lo guarda en la carpeta especificada."""
+def looks_like_html(first_bytes: bytes) -> bool:
+    """Detecta HTML por los primeros bytes del cuerpo."""
+    head = first_bytes[:SNIFF_BYTES].lstrip(b"\xef\xbb\xbf \t\r\n").lower()
+    return head.startswith((b"<!doctype html", b"<html", b"<head", b"<?xml")) or b"<html" in head
+
+def classify_response(content_type: str, first_bytes: bytes) -> str:
+    """
+    Clasifica una respuesta con una sola petición.
+    Retorna: "pdf", "html" u "other"
+    """
+    # La firma %PDF- manda sobre el header (muchos servidores usan application/octet-stream);
+    # la especificación permite basura antes de la firma dentro del primer KB
+    if b"%PDF-" in first_bytes[:SNIFF_BYTES]:
+        return "pdf"
+    if looks_like_html(first_bytes) or "html" in content_type.lower():
+        return "html"
+    if is_pdf(content_type):
+        return "pdf"
+    return "other"
+
+def read_head(chunks, first):
+    """Lee solo hasta el cierre de <head> (o HEAD_SCAN_BYTES) para buscar metadatos."""
+    head = first
+    while not HEAD_END_RE.search(head) and len(head) < HEAD_SCAN_BYTES:
+        chunk = next(chunks, None)
+        if chunk is None:
+            break
+        head += chunk
+    return head
+
+def read_prefix(chunks, size):
+    """Lee del iterador de chunks hasta tener al menos `size` bytes (o agotar el cuerpo)."""
+    prefix = b""
+    for chunk in chunks:
+        prefix += chunk
+        if len(prefix) >= size:
+            break
+    return prefix
+
+def load_part_meta(part_path):
+    """Lee el sidecar de una descarga parcial (.part.json), si existe y es coherente."""
     try:
-        # Obtener respuesta inicial
-        response = requests.get(url, stream=True, timeout=15)
-        response.raise_for_status()
-        
-        # Comprobar si es PDF por Content-Type
-        if is_pdf(response.headers.get("Content-Type", "")):
-            filename = url.split("/")[-1].split("?")[0]
-            if not filename.endswith(".pdf"):
-                filename += ".pdf"
-            filepath = os.path.join(dest_folder, filename)
-            
-            with open(filepath, "wb") as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
-            print(f"✅ Descargado: {filename}")
-            return True
-        else:
-            print(f"🔍 No es PDF directo, buscando en página: {url}")
-            return False
-    except Exception as e:
-        print(f"❌ Error descargando {url}: {e}")
-        return False
+        with open(part_path + ".json", "r", encoding="utf-8") as f:
+            meta = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+    if not os.path.exists(part_path):
+        return None
+    # Nunca confiar en más bytes de los que hay realmente en disco
+    meta["bytes"] = min(int(meta.get("bytes", 0)), os.path.getsize(part_path))
+    return meta
+
+def save_part_meta(part_path, meta):
+    """Guarda el sidecar de forma atómica para que un corte no lo deje a medias."""
+    tmp_path = part_path + ".json.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, part_path + ".json")
+
+def remove_part(part_path):
+    """Elimina el archivo .part y su sidecar."""
+    for path in (part_path, part_path + ".json"):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+def write_at(f, data, position):
+    """Escritura posicional: os.pwrite donde existe, seek + write en Windows."""
+    if hasattr(os, "pwrite"):
+        os.pwrite(f.fileno(), data, position)
+    else:
+        f.seek(position)
+        f.write(data)
+
+def plan_segments(start, total, stream_speed):
+    """
+    Divide [start, total) en segmentos [inicio, fin, recibidos]. El número de conexiones
+    crece con el tamaño del archivo y con lo lejos que está una conexión de VELOCIDAD_OBJETIVO.
+    Retorna None si no compensa dividir.
+    """
+    remaining = total - start
+    by_size = remaining // BYTES_POR_SEGMENTO
+    by_speed = math.ceil(VELOCIDAD_OBJETIVO / max(stream_speed, 1))
+    count = min(MAX_SEGMENTOS, by_size, by_speed)
+    if count < 2:
+        return None
+    size = math.ceil(remaining / count)
+    return [[begin, min(begin + size, total), 0] for begin in range(start, total, size)]
+
+def fetch_segment(url, part_path, segment, meta, lock, stop, proxies):
+    """Descarga un segmento con Range/If-Range y lo escribe en su posición del .part."""
+    begin, end, received = segment
+    position = begin + received
+    if position >= end:
+        return
+    validator = meta.get("etag") or meta.get("last_modified")
+    slot = scheduler.acquire(url, limit=MAX_SEGMENTOS)
+    try:
+        headers = {"Range": f"bytes={position}-{end - 1}", "If-Range": validator}
+        response = get_session().get(url, headers=headers, stream=True, timeout=TIMEOUT, proxies=proxies)
+        with response:
+            check_retry_after(url, response)
+            if response.status_code != 206:
+                # If-Range no coincide: el archivo cambió en el servidor
+                raise RestartDownload(f"El servidor respondió {response.status_code} a un segmento")
+            content_range = response.headers.get("Content-Range", "")
+            if not content_range.startswith(f"bytes {position}-"):
+                raise RestartDownload(f"Content-Range inesperado: {content_range}")
+
+            guard = ThroughputGuard(end - position)
+            since_save = 0
+            with open(part_path, "r+b") as f:
+                for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                    if stop.is_set():
+                        return
+                    chunk = chunk[:end - position]
+                    write_at(f, chunk, position)
+                    position += len(chunk)
+                    since_save += len(chunk)
+                    stats.add_bytes(len(chunk))
+                    with lock:
+                        segment[2] += len(chunk)
+                        if since_save >= PART_META_EVERY:
+                            save_part_meta(part_path, meta)
+                            since_save = 0
+                    guard.update(len(chunk))
+                    if position >= end:
+                        break
+    finally:
+        scheduler.release(slot)
+
+def download_segments(url, part_path, meta):
+    """
+    Descarga en paralelo los segmentos pendientes del .part (preasignado al tamaño total).
+    El estado de cada segmento vive en el sidecar, así que un corte se reanuda por segmentos.
+    """
+    total = meta["total"]
+    pending = [segment for segment in meta["segments"] if segment[0] + segment[2] < segment[1]]
+    remaining = sum(end - begin - received for begin, end, received in pending)
+    print(f"🧩 Descarga segmentada {url}: {len(pending)} conexiones, {remaining / 1048576:.1f} MB pendientes")
+
+    with open(part_path, "r+b") as f:
+        if os.path.getsize(part_path) < total:
+            f.truncate(total)
+
+    egress = getattr(_thread_local, "egress", None)
+    proxies = {"http": egress, "https": egress} if egress else None
+    lock = threading.Lock()
+    stop = threading.Event()
+    error = None
+    futures = [segment_executor.submit(fetch_segment, url, part_path, segment, meta, lock, stop, proxies)
+               for segment in pending]
+    try:
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                # Un segmento fallido detiene al resto; lo recibido queda anotado para reanudar
+                stop.set()
+                error = error or e
+    finally:
+        with lock:
+            save_part_meta(part_path, meta)
+
+    if isinstance(error, RestartDownload):
+        remove_part(part_path)
+    if error:
+        raise error
+    missing = sum(end - begin - received for begin, end, received in meta["segments"])
+    if missing or os.path.getsize(part_path) != total:
+        raise requests.exceptions.ChunkedEncodingError(
+            f"Descarga segmentada incompleta: faltan {missing} bytes")
+    meta["bytes"] = total
+
+def verified_hash(part_path, hasher):
+    """Comprueba el trailer %%EOF y startxref antes de almacenar; retorna el SHA-256."""
+    _, reason = verify_file(part_path)
+    if reason:
+        remove_part(part_path)
+        raise InvalidPdf(reason)
+    return hasher.hexdigest()
+
+def download_attempt(url, part_path, head_fast_path=True):
+    """
+    Un intento de descarga reanudable con una única petición.
+    Retorna: (sha256, None) si era un PDF y quedó completo,
+             (None, (html_bytes, url_final, enlaces_head)) si era una página HTML,
+             (None, None) en cualquier otro caso.
+    Lanza excepción si la transferencia se corta (el .part se conserva).
+    """
+    meta = load_part_meta(part_path)
+    if meta and meta.get("url") == url and meta.get("segments"):
+        print(f"↪️  Reanudando descarga segmentada {url}")
+        download_segments(url, part_path, meta)
+        return verified_hash(part_path, hash_file(part_path)), None
+
+    offset = 0
+    headers = {}
+    if meta and meta.get("url") == url and meta["bytes"] > 0:
+        validator = meta.get("etag") or meta.get("last_modified")
+        # Sin validador no se puede garantizar que el archivo no haya cambiado
+        if validator:
+            offset = meta["bytes"]
+            headers["Range"] = f"bytes={offset}-"
+            headers["If-Range"] = validator
+    if not offset:
+        # Página de aterrizaje ya guardada: petición condicional (304 = se usa la copia)
+        headers.update(http_cache.validators(url, require_complete=not head_fast_path))
 
-def find_pdf_in_page(url: str):
-    """Busca enlaces a PDF en una página HTML."""
+    slot = scheduler.acquire(url)
     try:
-        headers = {"User-Agent": "Mozilla/5.0"}
-        response = requests.get(url, headers=headers, timeout=15)
-        response.raise_for_status()
-        
-        soup = BeautifulSoup(response.text, "html.parser")
-        pdf_links = []
-        
-        # Buscar enlaces que terminen en .pdf o tengan 'download'
-        for link in soup.find_all("a", href=True):
-            href = link["href"]
-            if ".pdf" in href.lower() or "download" in href.lower():
-                full_url = urljoin(url, href)
+        egress = getattr(_thread_local, "egress", None)
+        proxies = {"http": egress, "https": egress} if egress else None
+        response = get_session().get(url, headers=headers, stream=True, timeout=TIMEOUT, proxies=proxies)
+        with response:
+            check_retry_after(url, response)
+            if response.status_code == 416:
+                # El rango ya no es válido en el servidor: empezar de cero
+                remove_part(part_path)
+                raise RestartDownload("Rango no satisfacible, reiniciando descarga")
+            if response.status_code == 304:
+                page = http_cache.revalidated(url)
+                if page is None:
+                    raise RestartDownload("304 sin copia en la caché HTTP")
+                head_links = find_pdf_in_head(page.content, page.final_url) if head_fast_path else []
+                return None, (page.content, page.final_url, head_links)
+            response.raise_for_status()
+
+            chunks = response.iter_content(chunk_size=CHUNK_SIZE)
+            first = b""
+            resumed = offset > 0 and response.status_code == 206
+            if resumed:
+                content_range = response.headers.get("Content-Range", "")
+                if not content_range.startswith(f"bytes {offset}-"):
+                    remove_part(part_path)
+                    raise RestartDownload(f"Content-Range inesperado: {content_range}")
+            else:
+                # El servidor ignoró el rango o el archivo cambió: descarga completa
+                offset = 0
+                # Clasificar por Content-Type y por los primeros bytes del cuerpo
+                first = read_prefix(chunks, SNIFF_BYTES)
+                kind = classify_response(response.headers.get("Content-Type", ""), first)
+                if kind == "html":
+                    # Vía rápida: la mayoría de editoriales declaran el PDF en <head>;
+                    # si aparece, se cierra la conexión sin descargar el resto de la página
+                    body = first
+                    if head_fast_path:
+                        body = read_head(chunks, first)
+                        head_links = find_pdf_in_head(body, response.url)
+                        if head_links:
+                            http_cache.store(url, body, response.headers, response.url, complete=False)
+                            return None, (body, response.url, head_links)
+                    # El cuerpo ya está llegando: se pasa al buscador de enlaces sin pedirlo otra vez
+                    body += read_prefix(chunks, MAX_HTML_BYTES - len(body))
+                    http_cache.store(url, body, response.headers, response.url)
+                    return None, (body, response.url, [])
+                if kind != "pdf":
+                    return None, None
+                # Content-Type de PDF pero sin firma: se aborta antes de escribir nada
+                reason = check_pdf_head(first)
+                if reason:
+                    raise InvalidPdf(reason)
+
+            total = None
+            # Con Content-Encoding la longitud declarada no es la de los bytes decodificados
+            if response.headers.get("Content-Length") and not response.headers.get("Content-Encoding"):
+                total = offset + int(response.headers["Content-Length"])
+
+            meta = {
+                "url": url,
+                "bytes": offset,
+                "total": total,
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+            }
+            save_part_meta(part_path, meta)
+
+            # El hash se calcula mientras llegan los bytes; al reanudar se parte del prefijo guardado
+            hasher = hashlib.sha256()
+            if resumed:
+                print(f"↪️  Reanudando {url} desde {offset} bytes")
+                with open(part_path, "r+b") as f:
+                    f.truncate(offset)  # Descartar bytes escritos tras el último sidecar
+                hash_file(part_path, hasher)
+
+            since_save = 0
+            guard = ThroughputGuard(total - offset if total is not None else None)
+            # Archivo grande en un servidor con rangos: tras medir esta conexión se decide si dividirlo
+            can_split = (not resumed and total is not None and total >= SEGMENTADA_MIN_BYTES
+                         and response.headers.get("Accept-Ranges", "").lower() == "bytes"
+                         and bool(meta["etag"] or meta["last_modified"]))
+            try:
+                with open(part_path, "ab" if resumed else "wb") as f:
+                    for chunk in itertools.chain([first], chunks):
+                        f.write(chunk)
+                        hasher.update(chunk)
+                        meta["bytes"] += len(chunk)
+                        since_save += len(chunk)
+                        stats.add_bytes(len(chunk))
+                        guard.update(len(chunk))
+                        if since_save >= PART_META_EVERY:
+                            save_part_meta(part_path, meta)
+                            since_save = 0
+                        if can_split and meta["bytes"] >= MEDICION_BYTES:
+                            can_split = False
+                            speed = guard.received / max(time.monotonic() - guard.start, 0.001)
+                            segments = plan_segments(meta["bytes"], total, speed)
+                            if segments:
+                                meta["segments"] = segments
+                                break
+            finally:
+                save_part_meta(part_path, meta)
+
+            if total is not None and meta["bytes"] != total and not meta.get("segments"):
+                raise requests.exceptions.ChunkedEncodingError(
+                    f"Transferencia incompleta: {meta['bytes']}/{total} bytes")
+    finally:
+        scheduler.release(slot)
+
+    if meta.get("segments"):
+        # El prefijo ya está en disco; el resto llega por varias conexiones fuera de orden
+        download_segments(url, part_path, meta)
+        hasher = hash_file(part_path)
+
+    # Trailer %%EOF y startxref: detecta archivos truncados antes de almacenarlos
+    return verified_hash(part_path, hasher), None
+
+def download_file(url: str, dest_folder: str, head_fast_path=True):
+    """
+    Descarga un archivo desde una URL y lo guarda en la carpeta especificada.
+    Retorna: (sha256, None) si se descargó un PDF, (None, página) si la URL es HTML
+    """
+    filename = url.split("/")[-1].split("?")[0]
+    if not filename.endswith(".pdf"):
+        filename += ".pdf"
+
+    # Contenido ya almacenado en una ejecución anterior: ni siquiera se abre conexión
+    sha256 = store.lookup(url)
+    if sha256 and head_fast_path:
+        name = store.ensure_link(sha256, filename)
+        print(f"⏭️  Ya almacenado: {name}")
+        return sha256, None
+
+    part_path = store.tmp_path(url)
+    for attempt in range(MAX_REINTENTOS_DESCARGA):
+        try:
+            sha256, page = download_attempt(url, part_path, head_fast_path)
+            if sha256:
+                # Solo un archivo completo llega al almacén y a su nombre definitivo
+                name, duplicate = store.commit(url, part_path, sha256, filename)
+                remove_part(part_path)
+                if duplicate:
+                    print(f"♻️  Duplicado (mismo contenido que {name}): {url}")
+                else:
+                    print(f"✅ Descargado: {name}")
+                return sha256, None
+            if page:
+                print(f"🔍 No es PDF directo, buscando en página: {url}")
+            else:
+                print(f"⏭️  Ni PDF ni HTML: {url}")
+            return None, page
+        except InvalidPdf as e:
+            print(f"🚫 PDF inválido descartado {url}: {e}")
+            stats.record_invalid()
+            return None, None
+        except DownloadStalled as e:
+            # El .part se conserva: al reencolar la URL se reanuda donde se quedó
+            print(f"🐢 Descarga atascada {url}: {e}")
+            stats.record_stall(url, str(e))
+            scheduler.record_stall(url, str(e))
+            raise
+        except RetryLater as e:
+            # El planificador retiene el host el tiempo pedido; no hace falta dormir aquí
+            print(f"⏳ {url}: {e} ({attempt + 1}/{MAX_REINTENTOS_DESCARGA})")
+        except (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError,
+                requests.exceptions.Timeout, RestartDownload) as e:
+            # Corte a mitad de transferencia: el siguiente intento reanuda desde el .part
+            print(f"⚠️  Descarga interrumpida ({attempt + 1}/{MAX_REINTENTOS_DESCARGA}) {url}: {e}")
+            time.sleep(min(2 ** attempt, 10))
+        except Exception as e:
+            print(f"❌ Error descargando {url}: {e}")
+            return None, None
+
+    print(f"❌ Error descargando {url}: reintentos agotados")
+    return None, None
+
+def parse_tag_attributes(tag: str) -> dict:
+    """Extrae los atributos de una etiqueta <meta>/<link> como diccionario en minúsculas."""
+    attrs = {}
+    for name, value in ATTR_RE.findall(tag):
+        attrs[name.lower()] = html_lib.unescape(value.strip("\"'")).strip()
+    return attrs
+
+def find_pdf_in_head(head: bytes, base_url: str):
+    """
+    Busca el PDF declarado en <head>: citation_pdf_url (Highwire), sus variantes,
+    pistas og:/Dublin Core que apuntan a un PDF y <link rel="alternate" type="application/pdf">.
+    """
+    text = head.decode("utf-8", errors="replace")
+    pdf_links = []
+    for tag in HEAD_TAG_RE.findall(text):
+        attrs = parse_tag_attributes(tag)
+        url = None
+        if tag[1:5].lower() == "meta":
+            name = (attrs.get("name") or attrs.get("property") or "").lower()
+            content = attrs.get("content", "")
+            if name in PDF_META_NAMES:
+                url = content
+            elif name.startswith(PDF_META_HINT_PREFIXES) and is_pdf_like_url(content):
+                url = content
+        elif "alternate" in attrs.get("rel", "").lower() and is_pdf(attrs.get("type", "")):
+            url = attrs.get("href")
+
+        if url:
+            full_url = urljoin(base_url, url)
+            if full_url not in pdf_links:
                 pdf_links.append(full_url)
-        
-        return pdf_links
-    except Exception as e:
-        print(f"❌ Error analizando la página {url}: {e}")
-        return []
+    return pdf_links
+
+def is_pdf_like_url(url: str) -> bool:
+    path = urlparse(url).path.lower()
+    return path.endswith(".pdf") or "/pdf" in path
+
+def same_site(url_a, url_b):
+    """Compara los dos últimos niveles del dominio (www.x.org ~ pdfs.x.org)."""
+    host_a = urlparse(url_a).hostname or ""
+    host_b = urlparse(url_b).hostname or ""
+    return host_a.split(".")[-2:] == host_b.split(".")[-2:]
+
+def score_candidate(url, text, base_url):
+    """Puntúa un candidato por forma de la URL, texto del enlace, dominio y patrones conocidos."""
+    path = urlparse(url).path.lower()
+    lowered_text = text.lower()
+    score = 0
+
+    if text == HEAD_SOURCE:
+        score += 60
+    if path.endswith(".pdf"):
+        score += 30
+    elif "pdf" in path:
+        score += 15
+    if "download" in path:
+        score += 5
+    if "pdf" in lowered_text:
+        score += 20
+    if any(word in lowered_text for word in ("full text", "fulltext", "texto completo", "article")):
+        score += 10
+    if any(pattern.search(url) for pattern in KNOWN_PDF_PATTERNS):
+        score += 25
+    if same_site(url, base_url):
+        score += 10
+
+    # Exportaciones de cita, material suplementario, etc.: nunca son el artículo
+    if path.endswith(NON_PDF_EXTENSIONS):
+        score -= 100
+    if any(word in lowered_text or word in path for word in NON_PDF_WORDS):
+        score -= 50
+    return score
+
+def rank_pdf_candidates(candidates, base_url):
+    """Elimina duplicados y ordena los candidatos (url, texto) de mejor a peor; descarta los negativos."""
+    best = {}
+    for url, text in candidates:
+        url = url.split("#")[0]
+        if not url.startswith(("http://", "https://")):
+            continue
+        score = score_candidate(url, text, base_url)
+        if url not in best or score > best[url]:
+            best[url] = score
+    ranked = sorted(best.items(), key=lambda item: item[1], reverse=True)
+    return [url for url, score in ranked if score >= 0]
+
+def probe_pdf(url, proxies=None):
+    """Sondeo barato: pide solo el primer KB y comprueba si es un PDF (por la salida de red del hilo que lo pidió)."""
+    if store.lookup(url):
+        return True
+    slot = scheduler.acquire(url)
+    try:
+        response = get_session().get(url, headers={"Range": f"bytes=0-{SNIFF_BYTES - 1}"},
+                                     stream=True, timeout=TIMEOUT, proxies=proxies)
+        with response:
+            check_retry_after(url, response)
+            if response.status_code not in (200, 206):
+                return False
+            first = read_prefix(response.iter_content(chunk_size=SNIFF_BYTES), SNIFF_BYTES)
+            return classify_response(response.headers.get("Content-Type", ""), first) == "pdf"
+    except Exception:
+        return False
+    finally:
+        scheduler.release(slot)
+
+def probed_pdf(probes, candidate):
+    """Resultado de un sondeo lanzado: True/False, o None si sigue en curso, se canceló o no se lanzó."""
+    probe = probes.get(candidate)
+    if probe is None or not probe.done() or probe.cancelled():
+        return None
+    return probe.result()
+
+def best_probed(ranked, probes):
+    """El mejor candidato sondeado como PDF; None si no hay o si uno mejor aún no ha respondido."""
+    for candidate in ranked:
+        result = probed_pdf(probes, candidate)
+        if result is None:
+            return None  # Un candidato mejor aún no ha respondido
+        if result:
+            return candidate
+    return None
+
+def race_candidates(ranked, probes):
+    """
+    Sondea en paralelo los RACE_TOP_K mejores candidatos y devuelve el de mayor
+    puntuación que responde con un PDF, sin esperar a los que van por detrás.
+    probes guarda los sondeos lanzados (url -> Future): se reutilizan, aunque sigan en curso.
+    """
+    # Los hilos del sondeo no tienen la salida de red de este hilo: se les pasa
+    egress = getattr(_thread_local, "egress", None)
+    proxies = {"http": egress, "https": egress} if egress else None
+    for candidate in ranked:
+        probe = probes.get(candidate)
+        if probe is None or probe.cancelled():
+            probes[candidate] = probe_executor.submit(probe_pdf, candidate, proxies)
+    futures = [probes[candidate] for candidate in ranked]
+    winner = best_probed(ranked, probes)
+    while not winner and not all(future.done() for future in futures):
+        concurrent.futures.wait(futures, return_when=concurrent.futures.FIRST_COMPLETED)
+        winner = best_probed(ranked, probes)
+    if winner:
+        for pending in futures:
+            pending.cancel()
+    return winner
+
+def discard_candidate(probes, candidate):
+    """Marca un candidato como descartado (su descarga no dio un PDF) para no volver a intentarlo."""
+    failed = concurrent.futures.Future()
+    failed.set_result(False)
+    probes[candidate] = failed
+
+def try_candidates(url, pdf_candidates, probes=None):
+    """
+    Compite entre los candidatos por tandas y descarga solo el ganador; retorna su hash o None.
+    probes: sondeos ya lanzados para la misma URL, para no repetirlos entre tandas ni entre llamadas.
+    """
+    probes = {} if probes is None else probes
+    remaining = [candidate for candidate in pdf_candidates if probed_pdf(probes, candidate) is not False]
+    while remaining:
+        batch, remaining = remaining[:RACE_TOP_K], remaining[RACE_TOP_K:]
+        while batch:
+            if len(batch) > 1 or batch[0] in probes:
+                winner = race_candidates(batch, probes)
+            else:
+                winner = batch[0]
+            if not winner:
+                break
+            sha256, _ = download_file(winner, OUTPUT_DIR)
+            if sha256:
+                # La próxima ejecución salta también la página de aterrizaje
+                store.add_alias(url, sha256)
+                return sha256  # Si se descarga un PDF, no seguimos buscando más en esa página
+            discard_candidate(probes, winner)
+            batch = [candidate for candidate in batch if probed_pdf(probes, candidate) is not False]
+    return None
+
+def try_rewrite(url):
+    """Prueba la URL directa del PDF según las reglas de editoriales; retorna su hash o None."""
+    if store.lookup(url):
+        return None  # Ya almacenada: download_file la resuelve sin red
+    pdf_url, rule = rewriter.rewrite(url)
+    if not pdf_url:
+        return None
+    print(f"🔀 [{rule}] {url} -> {pdf_url}")
+    sha256, _ = download_file(pdf_url, OUTPUT_DIR)
+    rewriter.record(rule, bool(sha256))
+    if sha256:
+        store.add_alias(url, sha256)
+    return sha256
+
+def try_oa_index(url):
+    """Primer paso: si la URL contiene un DOI con versión OA en el índice local, se usa esa."""
+    if not oa_index or store.lookup(url):
+        return None
+    doi = extract_doi(url)
+    oa_url = oa_index.lookup(doi) if doi else None
+    if not oa_url or oa_url == url:
+        return None
+    print(f"📚 [OA] {doi} -> {oa_url}")
+    sha256, _ = download_file(oa_url, OUTPUT_DIR)
+    if sha256:
+        store.add_alias(url, sha256)
+        stats.record_oa_hit()
+    return sha256
+
+def load_alternatives(path=CANDIDATES_FILE):
+    """
+    Lee los candidatos del paso 2; el cluster de versiones es una página de Scholar y no se usa aquí.
+    Las fichas sin enlace en papers2.txt (solo copias HTML, bibliotecas u otros) se indexan por su
+    mejor candidato, que se retorna en la lista de enlaces a añadir a la descarga.
+    """
+    unlinked = []
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                candidates = [(candidate["url"], candidate["source"]) for candidate in record["candidates"]
+                              if candidate["source"] != "versions"]
+                link = record.get("link")
+                if not link:
+                    if not candidates or candidates[0][0] in alternatives:
+                        continue
+                    link = candidates[0][0]
+                    unlinked.append(link)
+                alternatives[link] = [(url, source) for url, source in candidates if url != link]
+    except FileNotFoundError:
+        pass
+    return unlinked
+
+def find_and_download(url: str):
+    """Descarga el PDF de una URL, buscando en la página si no es un PDF directo. Retorna el sha256 o None."""
+    sha256 = try_oa_index(url)
+    # Si la página de aterrizaje es predecible se salta el HTML; si falla, se usa la URL original
+    if not sha256:
+        sha256 = try_rewrite(url)
+    page = None
+    probes = {}  # Sondeos compartidos entre los enlaces de la cabecera y los de la página completa
+    if not sha256:
+        sha256, page = download_file(url, OUTPUT_DIR)
+    if not sha256 and page:
+        html, base_url, head_links = page
+        if head_links:
+            stats.record_head_hit()
+            sha256 = try_candidates(url, rank_pdf_candidates([(link, HEAD_SOURCE) for link in head_links], base_url), probes)
+            if not sha256:
+                # La cabecera prometía un PDF que no llegó: analizar la página completa
+                _, page = download_file(url, OUTPUT_DIR, head_fast_path=False)
+                html, base_url = (page[0], page[1]) if page else (b"", url)
+        if not sha256 and html:
+            sha256 = try_candidates(url, rank_pdf_candidates(find_pdf_links(html, base_url), base_url), probes)
+    return sha256
+
+def process_url(url: str) -> bool:
+    """Descarga el PDF del enlace y, si no hay PDF, prueba los demás candidatos de su ficha en orden."""
+    sha256 = find_and_download(url)
+    if not sha256:
+        for alternative, source in alternatives.get(url, []):
+            print(f"↪️  Alternativa ({source}) para {url}: {alternative}")
+            sha256 = find_and_download(alternative)
+            if sha256:
+                store.add_alias(url, sha256)
+                stats.record_alternative_hit()
+                break
+    stats.record(url, bool(sha256))
+    return bool(sha256)
+
+requeues = {}
+requeues_lock = threading.Lock()
+
+def use_egress(url):
+    """Elige la salida de red del hilo según las veces que la URL se ha atascado."""
+    with requeues_lock:
+        count = requeues.get(url, 0)
+    _thread_local.egress = EGRESS_DESCARGA[count % len(EGRESS_DESCARGA)]
+
+def should_requeue(url):
+    """Anota un atasco de la URL; True si aún puede volver a la cola."""
+    with requeues_lock:
+        requeues[url] = requeues.get(url, 0) + 1
+        count = requeues[url]
+    if count > MAX_REENCOLADOS:
+        stats.record(url, False)
+        return False
+    egress = EGRESS_DESCARGA[count % len(EGRESS_DESCARGA)]
+    print(f"🔁 Reencolando {url} ({count}/{MAX_REENCOLADOS}) vía {egress or 'conexión directa'}")
+    return True
+
+def download_worker():
+    """Hilo de descarga: pide URLs al planificador hasta que no queda trabajo."""
+    while True:
+        url = scheduler.next_task()
+        if url is None:
+            return
+        try:
+            use_egress(url)
+            process_url(url)
+        except DownloadStalled:
+            # Se reencola antes de task_done para que el planificador no dé el trabajo por terminado
+            if should_requeue(url):
+                scheduler.submit(url)
+        except Exception as e:
+            print(f"❌ Error procesando {url}: {e}")
+        finally:
+            scheduler.task_done(url)
+
+def reparse_offline(urls):
+    """--offline: vuelve a buscar el PDF en las páginas guardadas en la caché HTTP, sin red ni descargas"""
+    reparsed = with_candidates = 0
+    for url in urls:
+        page = http_cache.lookup(url)
+        if page is None:
+            continue
+        reparsed += 1
+        head_links = [(link, HEAD_SOURCE) for link in find_pdf_in_head(page.content, page.final_url)]
+        ranked = rank_pdf_candidates(head_links + find_pdf_links(page.content, page.final_url), page.final_url)
+        if ranked:
+            with_candidates += 1
+            print(f"🔍 [OFFLINE] {url}: {len(ranked)} candidatos, mejor {ranked[0]}")
+        else:
+            print(f"🔍 [OFFLINE] {url}: sin candidatos")
+    print(f"[INFO] Reanálisis offline: {reparsed} páginas guardadas, {with_candidates} con candidatos a PDF, "
+          f"{len(urls) - reparsed} sin copia en caché")
+    http_cache.print_summary()
+
+def setup_runtime():
+    """Planificador, pools de hilos, almacén, reglas, índice OA y caché HTTP de esta ejecución"""
+    global scheduler, probe_executor, segment_executor, stats, store, rewriter, oa_index, http_cache
+    scheduler = HostScheduler(MAX_DESCARGAS_GLOBALES, MAX_DESCARGAS_POR_HOST, MIN_ESPACIADO_HOST,
+                              robots_fetcher=fetch_robots if RESPETAR_CRAWL_DELAY else None,
+                              user_agent=USER_AGENT)
+    # Pool aparte para los sondeos, así un hilo de descarga nunca espera a su propio pool
+    probe_executor = concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS * RACE_TOP_K)
+    # Pool de los segmentos de las descargas grandes
+    segment_executor = concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS * MAX_SEGMENTOS)
+    stats = DownloadStats()
+    store = PdfStore(OUTPUT_DIR)
+    rewriter = UrlRewriter()
+    oa_index = OAIndex.open_if_exists()
+    http_cache = HttpCache(offline=MODO_OFFLINE)
 
 def main():
+    setup_runtime()
     with open(INPUT_FILE, "r", encoding="utf-8") as f:
         urls = [line.strip() for line in f if line.strip()]
-    
-    for url in urls:
-        if not download_file(url, OUTPUT_DIR):
-            pdf_candidates = find_pdf_in_page(url)
-            for pdf_url in pdf_candidates:
-                if download_file(pdf_url, OUTPUT_DIR):
-                    break  # Si se descarga un PDF, no seguimos buscando más en esa página
+
+    if MODO_OFFLINE:
+        reparse_offline(urls)
+        return
+
+    unlinked = load_alternatives()
+    with_alternatives = sum(1 for others in alternatives.values() if others)
+    if with_alternatives:
+        print(f"[INFO] {with_alternatives} enlaces con candidatos alternativos ({CANDIDATES_FILE})")
+    # Fichas sin PDF ni editorial: se descarga su mejor candidato y, si falla, los demás
+    known = set(urls)
+    unlinked = [link for link in unlinked if link not in known]
+    if unlinked:
+        print(f"[INFO] {len(unlinked)} fichas sin enlace en {INPUT_FILE}: se prueban sus candidatos ({CANDIDATES_FILE})")
+        urls += unlinked
+
+    # Los PDFs dañados de ejecuciones anteriores se apartan y sus URLs se vuelven a descargar
+    if VERIFICAR_CARPETA:
+        verify_folder(OUTPUT_DIR, store=store)
+
+    if MODO_CONCURRENTE:
+        print(f"[INFO] Descargando {len(urls)} URLs con {MAX_WORKERS} hilos "
+              f"(máx. {MAX_DESCARGAS_GLOBALES} conexiones, {MAX_DESCARGAS_POR_HOST} por host, "
+              f"{MIN_ESPACIADO_HOST:.1f}s entre peticiones al mismo host)")
+        # El HTML se analiza en otros procesos; si no dan abasto, los hilos esperan antes de descargar más
+        parse_pool = ParsePool() if ANALISIS_EN_PROCESOS else None
+        set_parse_pool(parse_pool)
+        # Las URLs se reparten round-robin por host en lugar de en el orden del archivo
+        for url in urls:
+            scheduler.submit(url)
+        workers = [threading.Thread(target=download_worker, daemon=True) for _ in range(MAX_WORKERS)]
+        for worker in workers:
+            worker.start()
+        last_status = time.time()
+        while any(worker.is_alive() for worker in workers):
+            time.sleep(1)
+            if time.time() - last_status >= ESTADO_CADA:
+                scheduler.print_status()
+                last_status = time.time()
+        if parse_pool:
+            set_parse_pool(None)
+            parse_pool.print_summary()
+            parse_pool.close()
+    else:
+        pending = deque(urls)
+        while pending:
+            url = pending.popleft()
+            try:
+                use_egress(url)
+                process_url(url)
+            except DownloadStalled:
+                if should_requeue(url):
+                    pending.append(url)
+
+    stats.print_summary()
+    scheduler.print_summary()
+    rewriter.print_summary()
+    http_cache.print_summary()
+    http_cache.close()
+    print_parse_summary()
 
 if __name__ == "__main__":
     main()
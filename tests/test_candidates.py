@@ -0,0 +1,50 @@
+"""Los candidatos que el paso 2 deja en candidates.jsonl llegan a la descarga del paso 3"""
+
+import json
+
+import scholardown_part3
+from journal import Journal, STATUS_FOUND, STATUS_NOT_FOUND
+
+SCHOLAR = "https://scholar.google.com/citations?view_op=view_citation&citation_for_view=U1:"
+
+def write_candidates(tmp_path, records):
+    journal = Journal(str(tmp_path / "journal.jsonl"))
+    for url, status, link, candidates in records:
+        journal.record(url, status, link, candidates=candidates)
+    path = str(tmp_path / "candidates.jsonl")
+    journal.export_candidates([record[0] for record in records], path)
+    journal.close()
+    return path
+
+def test_html_only_record_is_downloaded(tmp_path, monkeypatch):
+    monkeypatch.setattr(scholardown_part3, "alternatives", {})
+    path = write_candidates(tmp_path, [
+        (SCHOLAR + "p1", STATUS_NOT_FOUND, None, [
+            {"url": "https://repo.example.edu/copia.html", "source": "html"},
+            {"url": "https://biblioteca.example.org/buscar?id=1", "source": "library"},
+            {"url": "https://scholar.google.com/scholar?cluster=1", "source": "versions"},
+        ]),
+    ])
+    with open(path, "r", encoding="utf-8") as f:
+        assert json.loads(f.readline())["link"] is None
+
+    unlinked = scholardown_part3.load_alternatives(path)
+
+    assert unlinked == ["https://repo.example.edu/copia.html"]
+    assert scholardown_part3.alternatives == {
+        "https://repo.example.edu/copia.html": [("https://biblioteca.example.org/buscar?id=1", "library")],
+    }
+
+def test_linked_record_keeps_other_candidates(tmp_path, monkeypatch):
+    monkeypatch.setattr(scholardown_part3, "alternatives", {})
+    path = write_candidates(tmp_path, [
+        (SCHOLAR + "p2", STATUS_FOUND, "https://editorial.example.com/articulo", [
+            {"url": "https://editorial.example.com/articulo", "source": "publisher"},
+            {"url": "https://repo.example.edu/copia.html", "source": "html"},
+        ]),
+    ])
+
+    assert scholardown_part3.load_alternatives(path) == []
+    assert scholardown_part3.alternatives == {
+        "https://editorial.example.com/articulo": [("https://repo.example.edu/copia.html", "html")],
+    }
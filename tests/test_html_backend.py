@@ -0,0 +1,16 @@
+"""Cada analizador instalado debe extraer de las páginas de tests/golden/ exactamente su .json"""
+
+import pytest
+
+import html_backend
+
+CASES = html_backend.load_golden()
+BACKENDS = html_backend.available_backends()
+
+@pytest.mark.parametrize("backend", BACKENDS, ids=lambda backend: backend.name)
+@pytest.mark.parametrize("name, kind, html, expected", CASES, ids=[case[0] for case in CASES])
+def test_golden_page(backend, name, kind, html, expected):
+    assert html_backend.as_json(html_backend.extract(backend, kind, html)) == expected
+
+def test_every_kind_has_pages():
+    assert {kind for _, kind, _, _ in CASES} == set(html_backend.GOLDEN_KINDS)
@@ -0,0 +1,36 @@
+"""Extracción de DOIs de enlaces de editoriales y consulta del índice OA"""
+
+import json
+
+import pytest
+
+import oa_index
+
+@pytest.mark.parametrize("url, doi", [
+    ("https://www.tandfonline.com/doi/full/10.1080/0001/abc?scroll=top&needAccess=true", "10.1080/0001/abc"),
+    ("https://pubs.example.org/doi/pdf/10.1021/ja0001.pdf?casa_token=XyZ", "10.1021/ja0001"),
+    ("https://link.example.com/article/10.1007/s0001-020-1#Sec1", "10.1007/s0001-020-1"),
+    ("https://resolver.example.edu/abrir?doi=10.1000/XYZ.1&origen=scholar", "10.1000/xyz.1"),
+    ("https://doi.org/10.1371/journal.pone.0001", "10.1371/journal.pone.0001"),
+    ("https://example.com/sin-doi?id=10", None),
+])
+def test_extract_doi(url, doi):
+    assert oa_index.extract_doi(url) == doi
+
+def test_lookup_with_query_string(tmp_path):
+    dump = tmp_path / "volcado.jsonl"
+    with open(dump, "w", encoding="utf-8") as f:
+        for doi, url in (("10.1080/0001/ABC", "https://repo.example.edu/primero.pdf"),
+                         ("10.1080/0001/abc", "https://a.example.org/segundo.pdf"),
+                         ("10.1021/ja0001", "https://repo.example.edu/ja0001.pdf")):
+            f.write(json.dumps({"doi": doi, "oa_url": url}) + "\n")
+    prefix = str(tmp_path / "oa_index")
+    assert oa_index.build_index(str(dump), prefix) == 2
+
+    index = oa_index.OAIndex(prefix)
+    try:
+        doi = oa_index.extract_doi("https://www.tandfonline.com/doi/full/10.1080/0001/abc?scroll=top&needAccess=true")
+        # DOI repetido: manda la primera aparición en el volcado
+        assert index.lookup(doi) == "https://repo.example.edu/primero.pdf"
+    finally:
+        index.close()
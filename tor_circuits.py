@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Aislamiento de circuitos TOR por identidad para ScholarDown
+Con IsolateSOCKSAuth, Tor asigna circuitos distintos a cada par usuario/contraseña SOCKS.
+Cada identidad del rastreo usa sus propias credenciales, así un único Tor local ofrece
+tantas IPs de salida como identidades, y cada una se rota por separado cerrando sus
+circuitos con stem en lugar de un NEWNYM que cambia todas a la vez.
+Tras rotar no hay espera fija: la identidad sigue en cuanto hay un circuito limpio
+construido (evento CIRC BUILT), y NEWNYM solo se envía cuando Tor lo admite.
+
+Uso:
+    python tor_circuits.py --autoprueba     # Verifica el aislamiento contra un SOCKS5 local de prueba
+"""
+
+import sys
+import time
+import uuid
+import socket
+import struct
+import hashlib
+import threading
+import socketserver
+from urllib.parse import quote
+
+SOCKS_HOST = "127.0.0.1"
+USER_PREFIX = "scholardown"
+CIRCUIT_READY_TIMEOUT = 20   # Espera máxima a un circuito limpio tras rotar (segundos)
+
+class TorCircuitPool:
+    """
+    Credenciales SOCKS por identidad: usuario fijo (scholardown-<nombre>) y contraseña
+    con un contador de generación. rotate() cierra los circuitos de ese usuario y sube
+    la generación, de modo que la siguiente conexión abre un circuito nuevo.
+    """
+    def __init__(self, socks_port=9050, control_port=9051, control_password="",
+                 socks_host=SOCKS_HOST, controller=None):
+        self.socks_host = socks_host
+        self.socks_port = socks_port
+        self.control_port = control_port
+        self.control_password = control_password
+        self.controller = controller
+        self.lock = threading.Lock()
+        self.generations = {}
+        self.rotations = {}
+        # Cada evento CIRC BUILT sube el contador y despierta a todas las identidades que esperan
+        self.circuit_built = threading.Condition()
+        self.built_count = 0
+        self.listening_controller = None
+        self.metrics = {"rotations": 0, "ready_wait": 0.0, "saved": 0.0, "newnym": 0, "newnym_deferred": 0}
+        # Cambia en cada ejecución: no se reutilizan circuitos de una ejecución anterior
+        self.run_id = uuid.uuid4().hex[:8]
+
+    def credentials(self, name):
+        with self.lock:
+            generation = self.generations.setdefault(name, 0)
+        return f"{USER_PREFIX}-{name}", f"{self.run_id}-{generation}"
+
+    def proxy_url(self, name):
+        user, password = self.credentials(name)
+        return f"socks5h://{quote(user, safe='')}:{quote(password, safe='')}@{self.socks_host}:{self.socks_port}"
+
+    def proxies(self, name):
+        """Diccionario de proxies de requests para la identidad"""
+        url = self.proxy_url(name)
+        return {"http": url, "https": url}
+
+    def _get_controller(self):
+        """Conexión de control perezosa; None si Tor no acepta la conexión"""
+        if self.controller is None:
+            from stem.control import Controller
+            controller = Controller.from_port(port=self.control_port)
+            controller.authenticate(password=self.control_password)
+            self.controller = controller
+        return self.controller
+
+    def close_circuits(self, name):
+        """Cierra los circuitos que Tor asoció al usuario SOCKS de la identidad"""
+        user, _ = self.credentials(name)
+        closed = 0
+        with self.lock:
+            try:
+                controller = self._get_controller()
+                for circuit in controller.get_circuits():
+                    if getattr(circuit, "socks_username", None) != user:
+                        continue
+                    try:
+                        controller.close_circuit(circuit.id)
+                        closed += 1
+                    except Exception:
+                        pass  # Ya cerrado por Tor
+            except Exception as e:
+                print(f"   [TOR] Sin puerto de control ({e}); solo se cambian las credenciales")
+                self.controller = None
+        return closed
+
+    def _on_circuit(self, event):
+        if event.status == "BUILT":
+            with self.circuit_built:
+                self.built_count += 1
+                self.circuit_built.notify_all()
+
+    def _clean_circuit_ready(self, controller):
+        """True si hay un circuito general construido sin identidad asociada (listo para una nueva)"""
+        for circuit in controller.get_circuits():
+            if (circuit.status == "BUILT" and circuit.purpose == "GENERAL"
+                    and not getattr(circuit, "socks_username", None)):
+                return True
+        return False
+
+    def wait_ready(self, replaced=0, timeout=CIRCUIT_READY_TIMEOUT):
+        """
+        Espera (solo en el hilo de la identidad) a que Tor tenga un circuito limpio construido.
+        replaced: espera fija que esto sustituye, para contabilizar el tiempo muerto evitado.
+        Retorna: segundos esperados
+        """
+        from stem.control import EventType
+
+        start = time.monotonic()
+        with self.lock:
+            try:
+                controller = self._get_controller()
+                if controller is not self.listening_controller:
+                    controller.add_event_listener(self._on_circuit, EventType.CIRC)
+                    self.listening_controller = controller
+            except Exception:
+                controller = None
+        if controller is not None:
+            try:
+                while time.monotonic() - start < timeout:
+                    # El contador se lee antes de mirar los circuitos: un BUILT posterior no se pierde
+                    with self.circuit_built:
+                        seen = self.built_count
+                    if self._clean_circuit_ready(controller):
+                        break
+                    with self.circuit_built:
+                        self.circuit_built.wait_for(lambda: self.built_count != seen,
+                                                    timeout - (time.monotonic() - start))
+            except Exception:
+                pass  # Sin control: la conexión construirá el circuito al usarse
+
+        waited = time.monotonic() - start
+        with self.lock:
+            self.metrics["ready_wait"] += waited
+            self.metrics["saved"] += max(0.0, replaced - waited)
+        return waited
+
+    def newnym(self):
+        """
+        NEWNYM para toda la instancia, solo si Tor lo admite ya (is_newnym_available);
+        si no, se omite sin bloquear. Retorna True si se envió.
+        """
+        from stem import Signal
+
+        with self.lock:
+            try:
+                controller = self._get_controller()
+                if not controller.is_newnym_available():
+                    self.metrics["newnym_deferred"] += 1
+                    print(f"   [TOR] NEWNYM aplazado: Tor lo admite en {controller.get_newnym_wait():.0f}s")
+                    return False
+                controller.signal(Signal.NEWNYM)
+                self.metrics["newnym"] += 1
+                return True
+            except Exception as e:
+                print(f"   [TOR] No se pudo enviar NEWNYM: {e}")
+                self.controller = None
+                return False
+
+    def rotate(self, name, session=None):
+        """
+        Nueva salida solo para esta identidad. Si se pasa su sesión y usa las credenciales
+        actuales, se actualizan sus proxies sin perder cookies.
+        Retorna: número de circuitos cerrados
+        """
+        old_proxies = self.proxies(name)
+        closed = self.close_circuits(name)
+        with self.lock:
+            self.generations[name] = self.generations.get(name, 0) + 1
+            self.rotations[name] = self.rotations.get(name, 0) + 1
+            self.metrics["rotations"] += 1
+        if session is not None and session.proxies == old_proxies:
+            session.proxies = self.proxies(name)
+        print(f"   [TOR] Circuito de {name} rotado ({closed} circuitos cerrados)")
+        return closed
+
+    def close(self):
+        with self.lock:
+            if self.controller is not None:
+                try:
+                    self.controller.close()
+                except Exception:
+                    pass
+                self.controller = None
+
+# --- Autoprueba -------------------------------------------------------------
+
+class StandInCircuit:
+    def __init__(self, circuit_id, socks_username):
+        self.id = circuit_id
+        self.socks_username = socks_username
+
+class StandInTor:
+    """
+    Sustituto local de Tor: un servidor SOCKS5 con autenticación usuario/contraseña que
+    asigna una "IP de salida" distinta a cada par de credenciales, y un controlador con
+    get_circuits()/close_circuit() como el de stem.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.circuits = {}      # (usuario, contraseña) -> id de circuito
+        self.next_id = 1
+        stand_in = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                stand_in.serve_client(self.request)
+
+        self.server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def exit_ip(self, circuit_id):
+        digest = hashlib.sha1(str(circuit_id).encode()).digest()
+        return "10.%d.%d.%d" % (digest[0], digest[1], digest[2])
+
+    def serve_client(self, conn):
+        def read(count):
+            data = b""
+            while len(data) < count:
+                chunk = conn.recv(count - len(data))
+                if not chunk:
+                    raise ConnectionError("cliente desconectado")
+                data += chunk
+            return data
+
+        _, methods = read(2)
+        if 2 not in read(methods):
+            conn.sendall(b"\x05\xff")
+            return
+        conn.sendall(b"\x05\x02")
+        read(1)
+        user = read(read(1)[0]).decode()
+        password = read(read(1)[0]).decode()
+        conn.sendall(b"\x01\x00")
+
+        _, _, _, address_type = read(4)
+        if address_type == 1:
+            read(4)
+        elif address_type == 3:
+            read(read(1)[0])
+        else:
+            read(16)
+        read(2)
+        conn.sendall(b"\x05\x00\x00\x01" + socket.inet_aton("0.0.0.0") + struct.pack(">H", 0))
+
+        # Como Tor con IsolateSOCKSAuth: mismas credenciales -> mismo circuito mientras exista
+        with self.lock:
+            key = (user, password)
+            if key not in self.circuits:
+                self.circuits[key] = self.next_id
+                self.next_id += 1
+            body = self.exit_ip(self.circuits[key]).encode()
+
+        request = b""
+        while b"\r\n\r\n" not in request:
+            chunk = conn.recv(4096)
+            if not chunk:
+                return
+            request += chunk
+        conn.sendall(b"HTTP/1.1 200 OK\r\nContent-Type: text/plain\r\nContent-Length: "
+                     + str(len(body)).encode() + b"\r\nConnection: close\r\n\r\n" + body)
+
+    # API de controlador (subconjunto de stem.control.Controller)
+    def get_circuits(self):
+        with self.lock:
+            return [StandInCircuit(circuit_id, user) for (user, _), circuit_id in self.circuits.items()]
+
+    def close_circuit(self, circuit_id):
+        with self.lock:
+            for key, value in list(self.circuits.items()):
+                if value == circuit_id:
+                    del self.circuits[key]
+
+    def close(self):
+        self.server.shutdown()
+
+def self_check(identities=4):
+    """Comprueba: una salida distinta por identidad y rotación que solo afecta a una"""
+    import requests
+
+    stand_in = StandInTor()
+    pool = TorCircuitPool(socks_port=stand_in.port, controller=stand_in)
+    names = [f"ID{i + 1}" for i in range(identities)]
+    sessions = {}
+    for name in names:
+        sessions[name] = requests.Session()
+        sessions[name].proxies = pool.proxies(name)
+
+    def exits():
+        return {name: sessions[name].get("http://autoprueba.invalid/", timeout=5).text for name in names}
+
+    ok = True
+    before = exits()
+    print(f"[INFO] Salidas iniciales: {before}")
+    if len(set(before.values())) != identities:
+        print("[ERROR] Varias identidades comparten circuito")
+        ok = False
+    if exits() != before:
+        print("[ERROR] Una identidad cambió de circuito sin rotar")
+        ok = False
+
+    pool.rotate(names[0], sessions[names[0]])
+    after = exits()
+    print(f"[INFO] Tras rotar {names[0]}: {after}")
+    if after[names[0]] == before[names[0]]:
+        print(f"[ERROR] {names[0]} mantiene la misma salida tras rotar")
+        ok = False
+    if any(after[name] != before[name] for name in names[1:]):
+        print("[ERROR] La rotación afectó a otras identidades")
+        ok = False
+    if len(stand_in.get_circuits()) != identities:
+        print("[ERROR] El circuito antiguo no se cerró")
+        ok = False
+
+    stand_in.close()
+    print("✅ Autoprueba superada" if ok else "❌ Autoprueba fallida")
+    return ok
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] == "--autoprueba":
+        sys.exit(0 if self_check() else 1)
+    print(__doc__)
@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Flota de procesos TOR para ScholarDown
+Lanza N instancias de Tor con puertos SOCKS/Control y directorios de datos propios,
+espera su arranque con los eventos BOOTSTRAP de stem (sin sleeps fijos), vigila que
+sigan vivas, reinicia las caídas y ofrece la flota como un conjunto de salidas.
+
+Uso:
+    python tor_fleet.py [instancias]     # Arrancar la flota y mostrar su estado (Ctrl+C para salir)
+"""
+
+import os
+import sys
+import time
+import shutil
+import atexit
+import threading
+import subprocess
+
+from tor_circuits import TorCircuitPool
+
+TOR_BINARY_ENV = "TOR_BIN"        # Variable de entorno con la ruta del binario (opcional)
+TOR_BINARY_PATHS = [
+    r"C:\Tor Browser\Browser\TorBrowser\Tor\tor.exe",
+    os.path.expanduser(r"~\Desktop\Tor Browser\Browser\TorBrowser\Tor\tor.exe"),
+    "/usr/bin/tor",
+    "/usr/sbin/tor",
+    "/usr/local/bin/tor",
+    "/opt/homebrew/bin/tor",
+    "/Applications/Tor Browser.app/Contents/MacOS/Tor/tor",
+    os.path.expanduser("~/tor-browser/Browser/TorBrowser/Tor/tor"),
+]
+FLEET_DIR = ".tor_fleet"          # Directorios de datos (se conservan: el siguiente arranque es más rápido)
+BOOTSTRAP_TIMEOUT = 120           # Segundos máximos para llegar a Bootstrapped 100%
+CONTROL_CONNECT_TIMEOUT = 30      # Segundos máximos hasta que abre el puerto de control
+CHECK_INTERVAL = 5                # Cada cuántos segundos se comprueba que las instancias siguen vivas
+MAX_RESTART_BACKOFF = 60          # Espera máxima entre reinicios de una instancia que cae en bucle
+
+def find_tor_binary(preferred=None):
+    """Busca el binario de Tor: ruta preferida, $TOR_BIN, PATH y rutas habituales (Windows/Linux/macOS)"""
+    candidates = [preferred, os.environ.get(TOR_BINARY_ENV), shutil.which("tor"), shutil.which("tor.exe")]
+    for path in candidates + TOR_BINARY_PATHS:
+        if path and os.path.isfile(path) and os.access(path, os.X_OK):
+            return path
+    return None
+
+class TorInstance:
+    def __init__(self, index, socks_port, control_port, control_password, data_root):
+        self.index = index
+        self.name = f"tor{index}"
+        self.socks_port = socks_port
+        self.control_port = control_port
+        self.control_password = control_password
+        self.data_dir = os.path.abspath(os.path.join(data_root, self.name))
+        self.pool = TorCircuitPool(socks_port, control_port, control_password)
+        self.process = None
+        self.controller = None
+        self.log_file = None
+        self.healthy = False
+        self.restarts = 0
+        self.bootstrap_time = None
+        self.next_restart = 0.0
+        self.restart_thread = None   # Reinicio en curso (el bootstrap puede tardar BOOTSTRAP_TIMEOUT)
+
+    def write_torrc(self):
+        os.makedirs(self.data_dir, exist_ok=True)
+        torrc = os.path.join(self.data_dir, "torrc")
+        with open(torrc, "w") as f:
+            f.write(f"SocksPort {self.socks_port} IsolateSOCKSAuth\n")
+            f.write(f"ControlPort {self.control_port}\n")
+            f.write(f"DataDirectory {self.data_dir}\n")
+            f.write("CookieAuthentication 0\n")
+        return torrc
+
+    def is_alive(self):
+        if self.process is None or self.process.poll() is not None:
+            return False
+        return self.controller is not None and self.controller.is_alive()
+
+class TorFleet:
+    """
+    Conjunto de instancias Tor. Cada identidad del rastreo se asigna a una instancia
+    sana (pool_for) y usa su TorCircuitPool, así las identidades se reparten entre
+    procesos y circuitos. terminate() detiene toda la flota.
+    """
+    def __init__(self, count=1, tor_exe=None, socks_port=9050, control_port=9051,
+                 control_password="", data_root=FLEET_DIR):
+        self.tor_exe = tor_exe
+        self.control_password = control_password
+        # Instancia i: SOCKS base + 2i, Control base + 2i (9050/9051, 9052/9053...)
+        self.instances = [TorInstance(i, socks_port + 2 * i, control_port + 2 * i, control_password, data_root)
+                          for i in range(count)]
+        self.assignments = {}
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.monitor_thread = None
+        self.binary = None
+
+    # --- Arranque -----------------------------------------------------------
+
+    def start(self):
+        """Arranca todas las instancias en paralelo y espera su bootstrap; retorna la flota"""
+        self.binary = find_tor_binary(self.tor_exe)
+        if not self.binary:
+            print(f"[ERROR] No se encontró Tor. Instálalo (p.ej. 'sudo apt install tor') o indica la ruta en ${TOR_BINARY_ENV}")
+            return self
+        print(f"[INFO] Iniciando {len(self.instances)} instancias de TOR con {self.binary}...")
+        start_time = time.time()
+        threads = [threading.Thread(target=self._launch, args=(instance,), daemon=True)
+                   for instance in self.instances]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        ready = sum(instance.healthy for instance in self.instances)
+        print(f"[INFO] TOR listo: {ready}/{len(self.instances)} instancias en {time.time() - start_time:.1f}s")
+
+        atexit.register(self.terminate)
+        self.monitor_thread = threading.Thread(target=self._monitor, daemon=True)
+        self.monitor_thread.start()
+        return self
+
+    def _launch(self, instance):
+        """Lanza una instancia y espera al evento BOOTSTRAP 100%"""
+        from stem.control import Controller, EventType
+
+        torrc = instance.write_torrc()
+        start_time = time.time()
+        # La salida va a un archivo: una tubería sin leer acabaría bloqueando a Tor
+        instance.log_file = open(os.path.join(instance.data_dir, "tor.log"), "ab")
+        instance.process = subprocess.Popen([self.binary, "-f", torrc],
+                                            stdout=instance.log_file, stderr=subprocess.STDOUT)
+
+        # El puerto de control abre en cuanto Tor lee su configuración
+        controller = None
+        deadline = time.time() + CONTROL_CONNECT_TIMEOUT
+        delay = 0.05
+        while controller is None and time.time() < deadline and instance.process.poll() is None:
+            try:
+                controller = Controller.from_port(port=instance.control_port)
+                controller.authenticate(password=self.control_password)
+            except Exception:
+                controller = None
+                time.sleep(delay)
+                delay = min(delay * 2, 1.0)
+        if controller is None:
+            print(f"   [TOR] {instance.name}: el puerto de control {instance.control_port} no respondió")
+            self._kill(instance)
+            return False
+
+        bootstrapped = threading.Event()
+
+        def on_status(event):
+            if event.action == "BOOTSTRAP":
+                progress = int(event.arguments.get("PROGRESS", 0))
+                if progress >= 100:
+                    bootstrapped.set()
+
+        controller.add_event_listener(on_status, EventType.STATUS_CLIENT)
+        # Si el bootstrap terminó antes de suscribirse (datos en caché), el evento ya pasó
+        if "PROGRESS=100" in controller.get_info("status/bootstrap-phase", ""):
+            bootstrapped.set()
+
+        deadline = time.time() + BOOTSTRAP_TIMEOUT
+        while not bootstrapped.wait(1):
+            if instance.process.poll() is not None or time.time() > deadline:
+                break
+        if not bootstrapped.is_set():
+            print(f"   [TOR] {instance.name}: sin bootstrap completo en {time.time() - start_time:.0f}s")
+            controller.close()
+            self._kill(instance)
+            return False
+
+        instance.controller = controller
+        instance.pool.controller = controller
+        instance.bootstrap_time = time.time() - start_time
+        instance.healthy = True
+        print(f"   [TOR] {instance.name}: listo en {instance.bootstrap_time:.1f}s "
+              f"(SOCKS {instance.socks_port}, Control {instance.control_port})")
+        return True
+
+    def _kill(self, instance):
+        instance.healthy = False
+        if instance.controller is not None:
+            try:
+                instance.controller.close()
+            except Exception:
+                pass
+            instance.controller = None
+        instance.pool.controller = None
+        if instance.process is not None and instance.process.poll() is None:
+            instance.process.terminate()
+            try:
+                instance.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                instance.process.kill()
+        if instance.log_file is not None:
+            instance.log_file.close()
+            instance.log_file = None
+
+    # --- Supervisión -----------------------------------------------------------
+
+    def _monitor(self):
+        """Comprueba periódicamente cada instancia y reinicia las caídas con espera creciente"""
+        while not self.stop_event.wait(CHECK_INTERVAL):
+            for instance in self.instances:
+                if self.stop_event.is_set():
+                    return
+                if instance.restart_thread is not None and instance.restart_thread.is_alive():
+                    continue
+                if instance.healthy and instance.is_alive():
+                    continue
+                if instance.healthy:
+                    code = instance.process.poll() if instance.process else None
+                    print(f"[WARNING] {instance.name} ha caído (código {code}); sus identidades pasan a otras instancias")
+                    instance.healthy = False
+                    instance.pool.controller = None
+                if time.time() < instance.next_restart:
+                    continue
+                self._kill(instance)
+                instance.restarts += 1
+                backoff = min(2 ** instance.restarts, MAX_RESTART_BACKOFF)
+                instance.next_restart = time.time() + backoff
+                print(f"   [TOR] Reiniciando {instance.name} (reinicio {instance.restarts})")
+                # Cada reinicio en su hilo: mientras arranca, las demás instancias siguen supervisadas
+                instance.restart_thread = threading.Thread(target=self._restart, args=(instance,), daemon=True)
+                instance.restart_thread.start()
+
+    def _restart(self, instance):
+        self._launch(instance)
+        if self.stop_event.is_set():
+            self._kill(instance)  # terminate() llegó durante el arranque
+
+    # --- Salidas para el rastreo --------------------------------------------------
+
+    def pool_for(self, name):
+        """
+        TorCircuitPool de la instancia asignada a la identidad. Si esa instancia no está
+        sana, la identidad se reasigna a la instancia sana con menos identidades.
+        """
+        with self.lock:
+            current = self.assignments.get(name)
+            if current is not None and current.healthy:
+                return current.pool
+            healthy = [instance for instance in self.instances if instance.healthy]
+            if not healthy:
+                # Sin instancias sanas (p.ej. antes de start): reparto fijo por orden de llegada
+                if current is None:
+                    current = self.instances[len(self.assignments) % len(self.instances)]
+                    self.assignments[name] = current
+                return current.pool
+            load = {instance.index: 0 for instance in healthy}
+            for assigned in self.assignments.values():
+                if assigned.index in load:
+                    load[assigned.index] += 1
+            chosen = min(healthy, key=lambda instance: load[instance.index])
+            self.assignments[name] = chosen
+            return chosen.pool
+
+    def healthy_count(self):
+        return sum(instance.healthy for instance in self.instances)
+
+    def print_status(self):
+        print(f"\n🧅 Flota TOR ({self.healthy_count()}/{len(self.instances)} sanas) - puertos / estado / arranque / reinicios:")
+        for instance in self.instances:
+            status = "✅" if instance.healthy else "❌"
+            bootstrap = f"{instance.bootstrap_time:.1f}s" if instance.bootstrap_time else "-"
+            print(f"   {instance.name:<6} {instance.socks_port}/{instance.control_port} {status} "
+                  f"{bootstrap:>6} / {instance.restarts}")
+
+    def print_metrics(self):
+        """Rotaciones, NEWNYM y tiempo hasta circuito listo frente a las esperas fijas sustituidas"""
+        totals = {"rotations": 0, "ready_wait": 0.0, "saved": 0.0, "newnym": 0, "newnym_deferred": 0}
+        for instance in self.instances:
+            for key in totals:
+                totals[key] += instance.pool.metrics[key]
+        if not totals["rotations"] and not totals["newnym"] and not totals["newnym_deferred"]:
+            return
+        average = totals["ready_wait"] / totals["rotations"] if totals["rotations"] else 0.0
+        print(f"\n🧅 Rotaciones TOR: {totals['rotations']} (espera media hasta circuito listo {average:.1f}s)")
+        print(f"   NEWNYM enviados: {totals['newnym']} | aplazados por Tor: {totals['newnym_deferred']}")
+        print(f"   ⏱️ Tiempo muerto evitado frente a esperas fijas: {totals['saved']:.0f}s")
+
+    def terminate(self):
+        """Detiene la supervisión y todas las instancias"""
+        self.stop_event.set()
+        for instance in self.instances:
+            self._kill(instance)
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) >= 2 else 2
+    fleet = TorFleet(count).start()
+    if not fleet.binary:
+        sys.exit(1)
+    try:
+        while True:
+            fleet.print_status()
+            time.sleep(30)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        fleet.terminate()
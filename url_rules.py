@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Reescritura de URLs de editoriales para ScholarDown
+Convierte páginas de aterrizaje predecibles en la URL directa del PDF sin pedir el HTML
+"""
+
+import os
+import re
+import json
+import threading
+from urllib.parse import urlparse
+
+RULES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "url_rules.json")
+
+class UrlRewriter:
+    """
+    Cada regla del archivo tiene: name, hosts, pattern (regex sobre ruta + query) y pdf
+    (plantilla con los grupos con nombre del patrón y {host}). Las reglas se compilan en
+    un diccionario host -> reglas, así cada URL solo se compara con las de su dominio.
+    """
+    def __init__(self, rules_file=RULES_FILE):
+        self.rules_by_host = {}
+        self.counters = {}
+        self.lock = threading.Lock()
+        self.load(rules_file)
+
+    def load(self, rules_file):
+        try:
+            with open(rules_file, "r", encoding="utf-8") as f:
+                rules = json.load(f)
+        except FileNotFoundError:
+            print(f"[WARNING] No se encontró {rules_file}, sin reglas de reescritura")
+            return
+        except ValueError as e:
+            print(f"[WARNING] {rules_file} no es JSON válido: {e}")
+            return
+
+        for rule in rules:
+            try:
+                compiled = (rule["name"], re.compile(rule["pattern"]), rule["pdf"])
+                hosts = rule["hosts"]
+            except (KeyError, re.error) as e:
+                print(f"[WARNING] Regla de reescritura inválida {rule.get('name', '?')}: {e}")
+                continue
+            for host in hosts:
+                self.rules_by_host.setdefault(host.lower(), []).append(compiled)
+            self.counters[rule["name"]] = {"applied": 0, "saved": 0, "failed": 0}
+
+        print(f"[INFO] {len(self.counters)} reglas de reescritura cargadas para {len(self.rules_by_host)} hosts")
+
+    def rewrite(self, url):
+        """
+        Retorna: (url_pdf, nombre_regla) si alguna regla aplica, o (None, None)
+        """
+        parsed = urlparse(url)
+        host = (parsed.hostname or "").lower()
+        rules = self.rules_by_host.get(host)
+        if not rules:
+            return None, None
+
+        target = parsed.path + ("?" + parsed.query if parsed.query else "")
+        for name, pattern, template in rules:
+            match = pattern.match(target)
+            if match:
+                pdf_url = template.format(host=host, **match.groupdict())
+                if pdf_url == url:
+                    return None, None
+                with self.lock:
+                    self.counters[name]["applied"] += 1
+                return pdf_url, name
+        return None, None
+
+    def record(self, name, ok):
+        """Anota si la URL reescrita funcionó (una petición ahorrada) o hubo que volver a la original"""
+        with self.lock:
+            self.counters[name]["saved" if ok else "failed"] += 1
+
+    def print_summary(self):
+        used = {name: c for name, c in self.counters.items() if c["applied"]}
+        if not used:
+            return
+        print("\n🔀 Reglas de reescritura (aplicadas / peticiones ahorradas / fallidas):")
+        for name, c in sorted(used.items(), key=lambda item: item[1]["saved"], reverse=True):
+            print(f"   {name:<14} {c['applied']:>5} / {c['saved']:>5} / {c['failed']:>5}")